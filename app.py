@@ -1,9 +1,22 @@
 import streamlit as st
 import pandas as pd
 import os
+import html
 import json
+import uuid
+from collections import Counter
 from datetime import datetime
-import jaconv
+
+from master import MASTER_PATH, MasterData, get_master_data, get_default_master_data, get_cache_stats
+from suggest import get_suggestions, resolve_reading
+from datacache import get_dataset_cache
+from storage import ConflictError, compute_row_diff, expand_frame, get_storage, restore_row_ids, wait_for_change
+from search import search_rows
+from export import EXPORT_FORMATS, export_csv, export_storage, iter_frame_chunks
+from sequences import advance_numbers, allocate_numbers, allocate_row_numbers, get_allocator
+from site_master import get_layered_indexes, learn_rows, get_site_cache_stats
+from metrics import get_metrics, timer
+from photos import PHOTO_TYPES, get_photo_store
 
 # ページ設定
 st.set_page_config(
@@ -12,69 +25,55 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+# 処理時間の計測（環境変数 INSPECTION_METRICS=1 の場合のみ。無効の場合は何もしない）
+get_metrics().start_rerun()
+
 # マスターデータの読み込み
+# 解析結果はプロセス全体でキャッシュされ、ファイルが更新された場合のみ再読み込みされる
 def load_master_data():
     try:
-        master_path = "data/master_data.csv"
-        if os.path.exists(master_path):
-            # 複数のエンコーディングを試行
-            encodings = ['utf-8', 'shift_jis', 'cp932', 'utf-8-sig']
-            for encoding in encodings:
-                try:
-                    df = pd.read_csv(master_path, encoding=encoding)
-                    # 場所と劣化名のマッピングを作成
-                    locations_dict = dict(zip(df['場所よみ'], df['場所']))
-                    deteriorations_dict = dict(zip(df['劣化名よみ'], df['劣化名']))
-                    return (
-                        df['場所'].unique().tolist(),
-                        df['劣化名'].unique().tolist(),
-                        locations_dict,
-                        deteriorations_dict,
-                        df['場所よみ'].unique().tolist(),
-                        df['劣化名よみ'].unique().tolist()
-                    )
-                except UnicodeDecodeError:
-                    continue
-                except Exception as e:
-                    st.error(f"マスターデータの読み込みエラー: {str(e)}")
-                    continue
-            
-            st.error("適切なエンコーディングが見つかりませんでした。")
-            return [], [], {}, {}, [], []
-        else:
-            st.warning("マスターデータファイルが見つかりません。デフォルトの選択肢を使用します。")
-            # デフォルトの選択肢を提供
-            default_locations = ["1階廊下", "2階廊下", "屋上", "外壁", "階段", "玄関", "機械室", "駐車場"]
-            default_deteriorations = ["ひび割れ", "剥離", "漏水", "腐食", "変形", "欠損", "さび", "変色"]
-            return default_locations, default_deteriorations, {}, {}, [], []
+        return get_master_data(MASTER_PATH)
+    except FileNotFoundError:
+        st.warning("マスターデータファイルが見つかりません。デフォルトの選択肢を使用します。")
+        # デフォルトの選択肢を提供
+        return get_default_master_data()
+    except UnicodeDecodeError:
+        st.error("適切なエンコーディングが見つかりませんでした。")
+        return MasterData([], [])
     except Exception as e:
-        st.error(f"予期せぬエラー: {str(e)}")
-        return [], [], {}, {}, [], []
+        st.error(f"マスターデータの読み込みエラー: {str(e)}")
+        return MasterData([], [])
 
-# 予測変換機能
-def get_suggestions(input_text, options, yomi_options, mapping_dict):
-    if not input_text:
-        return []
-    
-    # 入力をひらがなに変換
-    input_hira = jaconv.kata2hira(jaconv.normalize(input_text))
-    
-    # 候補を探す
-    suggestions = []
-    
-    # 読み仮名での検索
-    for yomi in yomi_options:
-        if yomi.startswith(input_hira):
-            suggestions.append(mapping_dict[yomi])
-    
-    # 通常の検索（元の表記でも検索可能に）
-    for opt in options:
-        opt_hira = jaconv.kata2hira(jaconv.normalize(opt))
-        if opt_hira.startswith(input_hira):
-            if opt not in suggestions:  # 重複を避ける
-                suggestions.append(opt)
-    
-    return suggestions
+# データ閲覧タブの1ページあたりの表示件数
+PAGE_SIZE_OPTIONS = [50, 100, 200, 500]
+DEFAULT_PAGE_SIZE = 100
+
+# 自動更新で変更を待つ最大の秒数（変更が無ければスクリプトを終了し、画面を操作すると再び待つ）
+AUTO_REFRESH_TIMEOUT_SECONDS = 300
+
+# 入力済み劣化項目の1ページあたりの表示件数
+ITEM_PAGE_SIZE = 50
+
+# 入力済み劣化項目の一覧の下に並べるサムネイルの幅（ピクセル）
+THUMBNAIL_WIDTH = 96
+
+# まとめて入力の表の行数の初期値（行は表の下で追加できる）
+BATCH_ROWS = 10
+
+# 入力済み劣化項目の一覧のスタイル（保存済み項目は背景色を変える）
+ITEM_LIST_STYLE = """
+<style>
+.item-list .item {
+    padding: 5px;
+    border-bottom: 1px solid #e0e0e0;
+}
+.item-list .saved-item {
+    background-color: #e6f3ff;
+    border-radius: 5px;
+    border-left: 3px solid #1E88E5;
+}
+</style>
+"""
 
 # セッション状態の初期化
 if 'inspection_items' not in st.session_state:
@@ -91,10 +90,20 @@ if 'editing_deterioration' not in st.session_state:
     st.session_state.editing_deterioration = ""
 if 'editing_photo' not in st.session_state:
     st.session_state.editing_photo = ""
+if 'temp_photos' not in st.session_state:
+    st.session_state.temp_photos = []  # 追加する項目の写真（ハッシュ）
+if 'photo_upload_key' not in st.session_state:
+    st.session_state.photo_upload_key = 0  # 項目の追加後に写真のアップロード欄を空にするためのキー
+if 'batch_rows' not in st.session_state:
+    st.session_state.batch_rows = []  # まとめて入力の表に戻す行（場所・劣化名が不足していた行）
+if 'batch_editor_key' not in st.session_state:
+    st.session_state.batch_editor_key = 0  # 表に戻す行が変わった場合に表を作り直すためのキー
+if 'batch_messages' not in st.session_state:
+    st.session_state.batch_messages = []  # 再実行後に表示するまとめて入力の結果
 if 'form_submitted' not in st.session_state:
     st.session_state.form_submitted = False
 if 'saved_items' not in st.session_state:
-    st.session_state.saved_items = []
+    st.session_state.saved_items = set()  # 保存済みの項目ID
 if 'editing_saved_data' not in st.session_state:
     st.session_state.editing_saved_data = False
 if 'editing_saved_row' not in st.session_state:
@@ -104,30 +113,47 @@ if 'editing_saved_index' not in st.session_state:
 if 'active_tab' not in st.session_state:
     st.session_state.active_tab = "input"
 
+def new_item_id():
+    # 入力項目ごとの一意なID（内容が同じ項目でも区別できるようにする）
+    return uuid.uuid4().hex
+
+def next_item_number():
+    # 現場名と棟名の組み合わせキーを作成
+    site_building_key = f"{st.session_state.current_site_name}_{st.session_state.current_building_name}" if ('current_site_name' in st.session_state and 'current_building_name' in st.session_state) else "default"
+    
+    # 現場名と棟名の組み合わせに対する劣化番号を取得または初期化
+    # （ここでの番号は仮の番号で、保存時に番号の払い出しで確定する）
+    if site_building_key not in st.session_state.site_building_numbers:
+        next_number = get_allocator().peek(st.session_state.get("current_site_name", ""), st.session_state.get("current_building_name", ""))
+        st.session_state.site_building_numbers[site_building_key] = next_number or 1
+    deterioration_number = st.session_state.site_building_numbers[site_building_key]
+    # 次の劣化番号を設定
+    st.session_state.site_building_numbers[site_building_key] += 1
+    return deterioration_number
+
 def add_item():
     if 'temp_location' in st.session_state and 'temp_deterioration' in st.session_state and 'temp_photo' in st.session_state:
         current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
         
-        # 現場名と棟名の組み合わせキーを作成
-        site_building_key = f"{st.session_state.current_site_name}_{st.session_state.current_building_name}" if ('current_site_name' in st.session_state and 'current_building_name' in st.session_state) else "default"
-        
         # 編集モードでない場合は、現場名と棟名の組み合わせごとの劣化番号を使用
         if st.session_state.editing_item_index < 0:
-            # 現場名と棟名の組み合わせに対する劣化番号を取得または初期化
-            if site_building_key not in st.session_state.site_building_numbers:
-                st.session_state.site_building_numbers[site_building_key] = 1
-            deterioration_number = st.session_state.site_building_numbers[site_building_key]
-            # 次の劣化番号を設定
-            st.session_state.site_building_numbers[site_building_key] += 1
+            deterioration_number = next_item_number()
         else:
-            # 編集モードの場合は既存の劣化番号を使用
-            deterioration_number = st.session_state.inspection_items[st.session_state.editing_item_index]["deterioration_number"]
+            # 編集モードの場合は既存の劣化番号とIDを使用
+            editing_item = st.session_state.inspection_items[st.session_state.editing_item_index]
+            deterioration_number = editing_item["deterioration_number"]
+        
+        # 写真は編集前の写真に新しくアップロードした写真を加える
+        photos = editing_item.get("photos", []) if st.session_state.editing_item_index >= 0 else []
+        photos = photos + [digest for digest in st.session_state.get("temp_photos", []) if digest not in photos]
         
         new_item = {
+            "id": editing_item["id"] if st.session_state.editing_item_index >= 0 else new_item_id(),
             "deterioration_number": deterioration_number,
             "location": st.session_state.temp_location,
             "deterioration_name": st.session_state.temp_deterioration,
             "photo_number": st.session_state.temp_photo,
+            "photos": photos,
             "現場名": st.session_state.current_site_name if 'current_site_name' in st.session_state else "",
             "棟名": st.session_state.current_building_name if 'current_building_name' in st.session_state else ""
         }
@@ -143,11 +169,15 @@ def add_item():
         else:
             # 新規追加モード
             st.session_state.inspection_items.append(new_item)
+            # 追加した項目が表示されるよう最終ページに移動
+            st.session_state.item_page = (len(st.session_state.inspection_items) - 1) // ITEM_PAGE_SIZE + 1
         
         # 入力欄をクリア
         st.session_state.temp_location = ""
         st.session_state.temp_deterioration = ""
         st.session_state.temp_photo = ""
+        st.session_state.temp_photos = []
+        st.session_state.photo_upload_key += 1
         
         # フォーム送信フラグを設定
         st.session_state.form_submitted = True
@@ -159,18 +189,14 @@ def edit_item(index):
     st.session_state.editing_deterioration = item["deterioration_name"]
     st.session_state.editing_photo = item["photo_number"]
     
-    # 編集時に保存済みリストから削除
-    item_key = f"{item['deterioration_number']}_{item['location']}_{item['deterioration_name']}_{item['photo_number']}"
-    if item_key in st.session_state.saved_items:
-        st.session_state.saved_items.remove(item_key)
+    # 編集時に保存済みから外す
+    st.session_state.saved_items.discard(item["id"])
 
 def delete_item(index):
     item = st.session_state.inspection_items[index]
     
-    # 削除時に保存済みリストから削除
-    item_key = f"{item['deterioration_number']}_{item['location']}_{item['deterioration_name']}_{item['photo_number']}"
-    if item_key in st.session_state.saved_items:
-        st.session_state.saved_items.remove(item_key)
+    # 削除時に保存済みから外す
+    st.session_state.saved_items.discard(item["id"])
     
     del st.session_state.inspection_items[index]
     # 劣化番号を振り直す
@@ -178,18 +204,94 @@ def delete_item(index):
         item["deterioration_number"] = i + 1
     st.session_state.current_deterioration_number = len(st.session_state.inspection_items) + 1
 
+def save_new_items(inspection_date, inspector_name, site_name, building_name):
+    # 未保存の項目をまとめて保存先に追加し、保存した件数を返す（保存先への書き込みは1回）
+    # 劣化データを展開して保存用のデータフレームを作成
+    rows = []
+    newly_saved_items = []
+    row_items = []
+    
+    for item in st.session_state.inspection_items:
+        # 既に保存済みの項目はスキップ
+        if item["id"] in st.session_state.saved_items:
+            continue
+            
+        rows.append({
+            "点検日": inspection_date.strftime("%Y-%m-%d"),
+            "点検者名": inspector_name,
+            "現場名": site_name,
+            "棟名": building_name,
+            "劣化番号": item["deterioration_number"],
+            "場所": item["location"],
+            "劣化名": item["deterioration_name"],
+            "写真番号": item["photo_number"]
+        })
+        
+        # 保存済みに追加
+        newly_saved_items.append(item["id"])
+        row_items.append(item)
+    
+    # 保存するデータがある場合のみ処理
+    if not rows:
+        return 0
+    
+    # 劣化番号は現場名・棟名ごとに払い出して確定する（同じ棟を同時に入力しても重複しない）
+    with timer("sequence.allocate", rows=len(rows)):
+        numbers = allocate_numbers(storage, site_name, building_name, len(rows))
+    for row, item, number in zip(rows, row_items, numbers):
+        row["劣化番号"] = number
+        item["deterioration_number"] = number
+    # 以降に追加する項目の仮の番号を払い出し済みの番号の次にする
+    st.session_state.site_building_numbers[f"{site_name}_{building_name}"] = numbers[-1] + 1
+    
+    # 新しい行だけを保存先に追加する
+    with timer("storage.append", rows=len(rows)):
+        storage.append_rows(rows)
+    # 写真を確定した劣化番号に結び付ける
+    for item in row_items:
+        if item.get("photos"):
+            get_photo_store().attach(site_name, building_name, item["deterioration_number"], item["photos"])
+    # 過去の点検から学習した項目に保存した場所・劣化名を加える（保存先は読み直さない）
+    learn_rows(storage, site_name, rows)
+    
+    # 保存済みリストを更新
+    st.session_state.saved_items.update(newly_saved_items)
+    return len(rows)
+
+def reset_after_save():
+    # 保存後に入力欄・アップロードした写真をクリアして新規入力を可能にする（1項目ずつ・まとめて入力のどちらの保存でも使う）
+    st.session_state.form_submitted = True
+    st.session_state.temp_location = ""
+    st.session_state.temp_deterioration = ""
+    st.session_state.temp_photo = ""
+    st.session_state.temp_photos = []
+    st.session_state.photo_upload_key += 1
+
+def add_batch_items(rows):
+    # まとめて入力した行（場所・劣化名・写真番号）を劣化項目として追加する（1項目ずつ追加する場合と同じ仮の番号を使う）
+    for location, deterioration_name, photo_number in rows:
+        st.session_state.inspection_items.append({
+            "id": new_item_id(),
+            "deterioration_number": next_item_number(),
+            "location": location,
+            "deterioration_name": deterioration_name,
+            "photo_number": photo_number,
+            "photos": [],
+            "現場名": st.session_state.current_site_name if 'current_site_name' in st.session_state else "",
+            "棟名": st.session_state.current_building_name if 'current_building_name' in st.session_state else ""
+        })
+    # 追加した項目が表示されるよう最終ページに移動
+    st.session_state.item_page = (len(st.session_state.inspection_items) - 1) // ITEM_PAGE_SIZE + 1
+
 def update_saved_data():
     if 'editing_saved_data' in st.session_state and st.session_state.editing_saved_data:
         try:
-            csv_path = "data/inspection_data.csv"
-            if not os.path.exists(csv_path):
+            if not storage.exists():
                 st.error("保存されたデータが見つかりません")
                 return False
             
-            df = pd.read_csv(csv_path, encoding='utf-8-sig')
             row_index = st.session_state.editing_saved_index
-            
-            if row_index < 0 or row_index >= len(df):
+            if row_index < 0:
                 st.error("編集対象のデータが見つかりません")
                 return False
             
@@ -204,19 +306,20 @@ def update_saved_data():
             deterioration_name = st.session_state.temp_deterioration if 'temp_deterioration' in st.session_state else ""
             photo_number = st.session_state.temp_photo if 'temp_photo' in st.session_state else ""
             
-            # データフレームの更新
-            df.loc[row_index, '点検日'] = inspection_date
-            df.loc[row_index, '点検者名'] = inspector_name
-            df.loc[row_index, '現場名'] = site_name
-            df.loc[row_index, '棟名'] = building_name
-            df.loc[row_index, '場所'] = location
-            df.loc[row_index, '劣化名'] = deterioration_name
-            df.loc[row_index, '写真番号'] = photo_number
-            
-            # 更新履歴情報は追加しない
-            
-            # CSVに保存
-            df.to_csv(csv_path, index=False, encoding='utf-8-sig')
+            # 対象の行だけを更新（更新履歴情報は追加しない）
+            with timer("storage.update_row", rows=1):
+                updated = storage.update_row(row_index, {
+                    '点検日': inspection_date,
+                    '点検者名': inspector_name,
+                    '現場名': site_name,
+                    '棟名': building_name,
+                    '場所': location,
+                    '劣化名': deterioration_name,
+                    '写真番号': photo_number
+                })
+            if not updated:
+                st.error("編集対象のデータが見つかりません")
+                return False
             
             # 編集モードを終了
             st.session_state.editing_saved_data = False
@@ -233,8 +336,56 @@ def update_saved_data():
 if not os.path.exists('data'):
     os.makedirs('data')
 
+# 点検データの保存先（環境変数 INSPECTION_STORAGE で csv / sqlite を切り替え）
+storage = get_storage()
+
 # マスターデータの読み込み
-locations, deterioration_types, locations_dict, deteriorations_dict, locations_yomi, deteriorations_yomi = load_master_data()
+with timer("master.load") as load_timer:
+    master_data = load_master_data()
+    load_timer.set_rows(master_data.row_count)
+
+# マスターデータキャッシュの状態（再実行時にディスクを読んでいないかの確認用）
+with st.sidebar.expander("マスターデータキャッシュ"):
+    cache_stats = get_cache_stats()
+    st.write(f"ヒット: {cache_stats['hits']} / ミス: {cache_stats['misses']}")
+    site_cache_stats = get_site_cache_stats()
+    st.write(f"現場ごとのマスター: {site_cache_stats['site_masters']}件 / 学習した項目: {site_cache_stats['learned']}件")
+    data_cache_stats = get_dataset_cache().stats()
+    st.write(f"点検データ: {data_cache_stats['used_mb']}MB / 上限 {data_cache_stats['max_mb']}MB"
+             f"（派生データ {data_cache_stats['views']}件、読み込み {data_cache_stats['loads']}回）")
+
+# 処理時間の計測結果（計測が有効な場合のみ表示）
+if get_metrics().enabled:
+    with st.sidebar.expander("処理時間の計測"):
+        last_rerun = get_metrics().last_rerun()
+        if last_rerun:
+            st.caption("直前の再実行の内訳")
+            st.dataframe(pd.DataFrame(
+                [{"項目": name, "時間(ms)": round(seconds * 1000, 1), "行数": rows} for name, (seconds, rows) in sorted(last_rerun.items())]
+            ), hide_index=True, use_container_width=True)
+        summary = get_metrics().snapshot()["metrics"]
+        if summary:
+            st.caption("直近の計測値")
+            st.dataframe(pd.DataFrame(
+                [{"項目": name, "回数": values["count"], "p50(ms)": values["p50_ms"], "p99(ms)": values["p99_ms"], "最大(ms)": values["max_ms"], "行数": values["rows_total"]}
+                 for name, values in summary.items()]
+            ), hide_index=True, use_container_width=True)
+        col1, col2 = st.columns(2)
+        with col1:
+            if st.button("書き出す", key="metrics_dump"):
+                get_metrics().write_dump()
+                st.success("data/metrics.json・data/metrics.prom に書き出しました")
+        with col2:
+            if st.button("リセット", key="metrics_reset"):
+                get_metrics().reset()
+
+# 現場ごとのマスター → 過去の点検から学習した項目 → 共通のマスター の順に重ねた予測変換の索引
+def load_site_indexes(site_name):
+    try:
+        return get_layered_indexes(master_data, site_name, storage)
+    except Exception as e:
+        st.warning(f"現場ごとのマスターデータの読み込みエラー: {str(e)}")
+        return master_data.location_index, master_data.deterioration_index
 
 # タブの作成
 if st.session_state.active_tab == "input":
@@ -291,58 +442,48 @@ with tab_input:
                 st.session_state.current_building_name = building_name
                 
                 # 現場名と棟名が両方入力されている場合、登録済みの劣化項目を読み込む
+                # （現場名・棟名が変わった場合のみ。同じ組み合わせでの再実行では読み込まない）
                 if 'current_site_name' in st.session_state and st.session_state.current_site_name:
-                    # 既存のデータを読み込む
-                    csv_path = "data/inspection_data.csv"
-                    if os.path.exists(csv_path):
+                    site_building_key = f"{st.session_state.current_site_name}_{building_name}"
+                    if st.session_state.get('loaded_site_building_key') != site_building_key:
+                        st.session_state.loaded_site_building_key = site_building_key
                         try:
-                            df = pd.read_csv(csv_path, encoding='utf-8-sig')
-                            
-                            # 現場名と棟名の列が存在するか確認
-                            has_site_column = '現場名' in df.columns
-                            has_building_column = '棟名' in df.columns
-                            
-                            # 両方の列が存在する場合のみフィルタリングを行う
-                            if has_site_column and has_building_column:
-                                # 現場名と棟名でフィルタリング
-                                filtered_df = df[(df['現場名'] == st.session_state.current_site_name) & 
-                                                (df['棟名'] == building_name)]
-                            else:
-                                # 列が存在しない場合は空のデータフレームを使用
-                                filtered_df = pd.DataFrame()
+                            # 現場名と棟名で絞り込んだデータを取得（索引から取得）
+                            with timer("site.load") as site_timer:
+                                filtered_df = storage.read_site(st.session_state.current_site_name, building_name) if storage.exists() else pd.DataFrame()
+                                site_timer.set_rows(len(filtered_df))
                             
                             if not filtered_df.empty:
                                 # 既存の入力項目をクリア（編集モードでない場合のみ）
                                 if not ('editing_saved_data' in st.session_state and st.session_state.editing_saved_data):
-                                    st.session_state.inspection_items = []
-                                    st.session_state.saved_items = []
-                                    
-                                    # 現場名と棟名の組み合わせキーを作成
-                                    site_building_key = f"{st.session_state.current_site_name}_{building_name}"
-                                    
-                                    # 最大の劣化番号を取得して次の番号を設定
+                                    # 最大の劣化番号と払い出し済みの番号から次の（仮の）番号を設定
                                     max_deterioration_number = filtered_df['劣化番号'].max()
-                                    st.session_state.site_building_numbers[site_building_key] = max_deterioration_number + 1
+                                    next_number = get_allocator().peek(st.session_state.current_site_name, building_name)
+                                    st.session_state.site_building_numbers[site_building_key] = max(max_deterioration_number + 1, next_number or 0)
                                     
-                                    # 劣化項目を追加
-                                    for _, row in filtered_df.iterrows():
-                                        item = {
+                                    # 劣化項目を作成
+                                    now = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+                                    attached_photos = get_photo_store().attached(st.session_state.current_site_name, building_name)
+                                    st.session_state.inspection_items = [
+                                        {
+                                            "id": new_item_id(),
                                             "deterioration_number": row['劣化番号'],
                                             "location": row['場所'],
                                             "deterioration_name": row['劣化名'],
                                             "photo_number": row['写真番号'],
+                                            "photos": attached_photos.get(row['劣化番号'], []),
                                             "現場名": row['現場名'],
                                             "棟名": row['棟名'],
-                                            "作成日時": row['最終更新日時'] if '最終更新日時' in row else datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                            "最終更新日時": row['最終更新日時'] if '最終更新日時' in row else datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                                            "更新者": row['更新者'] if '更新者' in row else "",
-                                            "更新回数": row['更新回数'] if '更新回数' in row else 0
+                                            "作成日時": row.get('最終更新日時', now),
+                                            "最終更新日時": row.get('最終更新日時', now),
+                                            "更新者": row.get('更新者', ""),
+                                            "更新回数": row.get('更新回数', 0)
                                         }
-                                        st.session_state.inspection_items.append(item)
-                                        
-                                        # 保存済みリストに追加
-                                        item_key = f"{item['deterioration_number']}_{item['location']}_{item['deterioration_name']}_{item['photo_number']}"
-                                        st.session_state.saved_items.append(item_key)
+                                        for row in filtered_df.to_dict('records')
+                                    ]
+                                    
+                                    # 読み込んだ項目はすべて保存済み
+                                    st.session_state.saved_items = {item["id"] for item in st.session_state.inspection_items}
                                     
                                     # 読み込み完了メッセージ
                                     st.session_state.items_loaded = True
@@ -372,6 +513,12 @@ with tab_input:
             
             col1, col2, col3 = st.columns(3)
             
+            # 現場名・棟名で登録済みの場所・劣化名の出現回数（候補の並べ替えに使用）
+            location_frequencies = Counter(item["location"] for item in st.session_state.inspection_items)
+            deterioration_frequencies = Counter(item["deterioration_name"] for item in st.session_state.inspection_items)
+            with timer("suggest.layers"):
+                location_index, deterioration_index = load_site_indexes(st.session_state.current_site_name)
+            
             # フォーム送信後に入力欄をクリア
             if st.session_state.form_submitted:
                 st.session_state.location_input = ""
@@ -386,10 +533,12 @@ with tab_input:
                     "場所",
                     key="location_input",
                     value=default_location,
-                    help="ひらがなで入力してください（例：いっかい）"
+                    help="ひらがな・ローマ字で入力してください（例：いっかい、ikkai）"
                 )
                 if location:
-                    location_suggestions = get_suggestions(location, locations, locations_yomi, locations_dict)
+                    with timer("suggest.location") as suggest_timer:
+                        location_suggestions = get_suggestions(location, location_index, frequencies=location_frequencies)
+                        suggest_timer.set_rows(len(location_suggestions))
                     if location_suggestions:
                         selected_location = st.selectbox(
                             "場所の候補",
@@ -409,7 +558,9 @@ with tab_input:
                     help="ひらがなで入力してください（例：ひび）"
                 )
                 if deterioration_name:
-                    deterioration_suggestions = get_suggestions(deterioration_name, deterioration_types, deteriorations_yomi, deteriorations_dict)
+                    with timer("suggest.deterioration") as suggest_timer:
+                        deterioration_suggestions = get_suggestions(deterioration_name, deterioration_index, frequencies=deterioration_frequencies)
+                        suggest_timer.set_rows(len(deterioration_suggestions))
                     if deterioration_suggestions:
                         selected_deterioration = st.selectbox(
                             "劣化名の候補",
@@ -428,6 +579,14 @@ with tab_input:
                     value=default_photo
                 )
 
+            # 写真は項目の追加時に保存する（サムネイルの作成はバックグラウンドで行い、待たない）
+            uploaded_photos = st.file_uploader(
+                "写真",
+                type=PHOTO_TYPES,
+                accept_multiple_files=True,
+                key=f"photo_upload_{st.session_state.photo_upload_key}"
+            )
+
             # 一時的に値を保存
             st.session_state.temp_location = location
             st.session_state.temp_deterioration = deterioration_name
@@ -444,6 +603,7 @@ with tab_input:
                     st.session_state.temp_location = location
                     st.session_state.temp_deterioration = deterioration_name
                     st.session_state.temp_photo = photo_number
+                    st.session_state.temp_photos = [get_photo_store().store(f.getvalue(), f.name) for f in uploaded_photos or []]
                     
                     # 劣化項目を追加
                     add_item()
@@ -451,6 +611,82 @@ with tab_input:
                     st.rerun()  # 画面を更新して追加された項目を表示
                 else:
                     st.error("場所と劣化名は必須項目です")
+            
+            # まとめて入力（複数の項目を表に入力し、1回の送信で追加する。送信までは再実行しない）
+            if not ('editing_saved_data' in st.session_state and st.session_state.editing_saved_data):
+                with st.expander("まとめて入力", expanded=bool(st.session_state.batch_rows or st.session_state.batch_messages)):
+                    # 前回の送信の結果（入力に不足があった行を表に戻して再実行した場合）
+                    for kind, text in st.session_state.batch_messages:
+                        getattr(st, kind)(text)
+                    st.session_state.batch_messages = []
+                    
+                    # 送信後は表を空にする（入力に不足があった行だけを表に戻す）
+                    with st.form("batch_form", clear_on_submit=True):
+                        batch_df = st.data_editor(
+                            pd.DataFrame(st.session_state.batch_rows or [["", "", ""]] * BATCH_ROWS, columns=["場所", "劣化名", "写真番号"]),
+                            num_rows="dynamic",
+                            hide_index=True,
+                            use_container_width=True,
+                            column_config={
+                                "場所": st.column_config.TextColumn("場所", help="ひらがな・ローマ字で入力すると、追加時に最上位の候補に置き換えます（例：いっかい、ikkai）"),
+                                "劣化名": st.column_config.TextColumn("劣化名", help="ひらがなで入力すると、追加時に最上位の候補に置き換えます（例：ひび）"),
+                                "写真番号": st.column_config.TextColumn("写真番号"),
+                            },
+                            key=f"batch_editor_{st.session_state.batch_editor_key}"
+                        )
+                        resolve_batch = st.checkbox("ひらがな・ローマ字の入力を候補に置き換える", value=True, key="batch_resolve")
+                        col1, col2 = st.columns(2)
+                        with col1:
+                            batch_add = st.form_submit_button("まとめて追加", use_container_width=True)
+                        with col2:
+                            batch_save = st.form_submit_button("まとめて追加して保存", use_container_width=True)
+                    
+                    if batch_add or batch_save:
+                        batch_rows = []
+                        incomplete_rows = []
+                        replaced = []
+                        with timer("batch.resolve", rows=len(batch_df)) as batch_timer:
+                            for row in batch_df.fillna("").astype(str).itertuples(index=False):
+                                batch_location, batch_deterioration, batch_photo = (value.strip() for value in row)
+                                if not batch_location and not batch_deterioration and not batch_photo:
+                                    continue
+                                if not batch_location or not batch_deterioration:
+                                    incomplete_rows.append([batch_location, batch_deterioration, batch_photo])
+                                    continue
+                                if resolve_batch:
+                                    resolved_location = resolve_reading(batch_location, location_index, location_frequencies)
+                                    resolved_deterioration = resolve_reading(batch_deterioration, deterioration_index, deterioration_frequencies)
+                                    for before, after in ((batch_location, resolved_location), (batch_deterioration, resolved_deterioration)):
+                                        if before != after:
+                                            replaced.append(f"{before} → {after}")
+                                    batch_location, batch_deterioration = resolved_location, resolved_deterioration
+                                batch_rows.append((batch_location, batch_deterioration, batch_photo))
+                            batch_timer.set_rows(len(batch_rows))
+                        
+                        messages = []
+                        if batch_rows:
+                            add_batch_items(batch_rows)
+                            if batch_save:
+                                saved_count = save_new_items(inspection_date, inspector_name, site_name, building_name)
+                                reset_after_save()
+                                messages.append(("success", f"劣化項目を{len(batch_rows)}件追加し、{saved_count}件のデータを保存しました"))
+                            else:
+                                messages.append(("success", f"劣化項目を{len(batch_rows)}件追加しました"))
+                            if replaced:
+                                messages.append(("caption", "候補に置き換えた入力: " + "、".join(dict.fromkeys(replaced))))
+                        if incomplete_rows:
+                            messages.append(("error", f"場所と劣化名は必須項目です（{len(incomplete_rows)}行を表に戻しました）"))
+                        elif not batch_rows:
+                            messages.append(("info", "追加する項目がありません"))
+                        
+                        if incomplete_rows or st.session_state.batch_rows:
+                            # 表に戻す行が変わる場合は表を作り直す（この場合だけ再実行する）
+                            st.session_state.batch_rows = incomplete_rows
+                            st.session_state.batch_editor_key += 1
+                            st.session_state.batch_messages = messages
+                            st.rerun()
+                        for kind, text in messages:
+                            getattr(st, kind)(text)
     else:
         # 現場名と棟名が入力されていない場合のメッセージ
         st.warning("劣化情報を入力するには、まず「現場名」と「棟名」を入力してください。")
@@ -459,64 +695,70 @@ with tab_input:
     if st.session_state.inspection_items:
         st.subheader("入力済み劣化項目")
         
+        items = st.session_state.inspection_items
+        page_count = (len(items) - 1) // ITEM_PAGE_SIZE + 1
+        
+        # 項目が多い場合はページ単位で表示する（削除でページ数が減った場合は最終ページに合わせる）
+        if st.session_state.get('item_page', 1) > page_count:
+            st.session_state.item_page = page_count
+        if page_count > 1:
+            item_page = st.number_input(f"表示ページ（全{page_count}ページ・{len(items)}件）", min_value=1, max_value=page_count, step=1, key="item_page")
+        else:
+            item_page = 1
+        page_start = (item_page - 1) * ITEM_PAGE_SIZE
+        page_indices = range(page_start, min(page_start + ITEM_PAGE_SIZE, len(items)))
+        
         # スマホ表示に最適化したコンパクトなレイアウト
-        for i, item in enumerate(st.session_state.inspection_items):
-            with st.container():
-                # 保存済みかどうかを判定
-                item_key = f"{item['deterioration_number']}_{item['location']}_{item['deterioration_name']}_{item['photo_number']}"
-                is_saved = item_key in st.session_state.saved_items
-                
+        # 表示中のページの項目を1つのHTMLにまとめて描画する（スタイルシートも1回だけ）
+        with timer("render.item_list", rows=len(page_indices)):
+            photo_store = get_photo_store()
+            lines = [ITEM_LIST_STYLE, '<div class="item-list">']
+            thumbnail_files = []
+            thumbnail_captions = []
+            for i in page_indices:
+                item = items[i]
                 # 保存済み項目は背景色を変える
-                if is_saved:
-                    container_style = """
-                    <style>
-                    .saved-item {
-                        background-color: #e6f3ff;
-                        padding: 5px;
-                        border-radius: 5px;
-                        border-left: 3px solid #1E88E5;
-                    }
-                    </style>
-                    <div class="saved-item">
-                    """
-                    st.markdown(container_style, unsafe_allow_html=True)
-                
-                cols = st.columns([0.6, 0.2, 0.2])
-                
-                # 項目情報を1列目にまとめて表示
-                with cols[0]:
-                    status_badge = "🔵 " if is_saved else ""
-                    st.markdown(f"""
-                    {status_badge}**No.{item['deterioration_number']}**: {item['location']} / {item['deterioration_name']} / {item['photo_number']}
-                    """)
-                
-                # 編集ボタン
-                with cols[1]:
-                    st.button(
-                        "編集",
-                        key=f"edit_{i}",
-                        on_click=edit_item,
-                        args=(i,),
-                        use_container_width=True
-                    )
-                
-                # 削除ボタン
-                with cols[2]:
-                    st.button(
-                        "削除",
-                        key=f"delete_{i}",
-                        on_click=delete_item,
-                        args=(i,),
-                        use_container_width=True
-                    )
-                
-                # 保存済み項目のHTMLを閉じる
-                if is_saved:
-                    st.markdown("</div>", unsafe_allow_html=True)
-                
-                # 項目間の区切り線（オプション）
-                if i < len(st.session_state.inspection_items) - 1:
-                    st.markdown("---")
+                is_saved = item["id"] in st.session_state.saved_items
+                # 写真は枚数を表示し、作成済みのサムネイルは一覧の下にまとめて表示する（作成中の写真は枚数だけ）
+                photos = item.get("photos", [])
+                waiting = 0
+                for digest in photos:
+                    path = photo_store.thumbnail_file(digest)
+                    if path is None:
+                        waiting += 1
+                    else:
+                        thumbnail_files.append(path)
+                        thumbnail_captions.append(f"No.{item['deterioration_number']}")
+                photo_note = f' / 📷 {len(photos)}枚' if photos else ''
+                if waiting:
+                    photo_note += f'（{waiting}枚は準備中）'
+                lines.append(
+                    f'<div class="{"item saved-item" if is_saved else "item"}">'
+                    f'{"🔵 " if is_saved else ""}<b>No.{html.escape(str(item["deterioration_number"]))}</b>: '
+                    f'{html.escape(str(item["location"]))} / {html.escape(str(item["deterioration_name"]))} / {html.escape(str(item["photo_number"]))}'
+                    f'{photo_note}'
+                    '</div>'
+                )
+            lines.append('</div>')
+            st.markdown("\n".join(lines), unsafe_allow_html=True)
+            # サムネイルはファイルのパスを渡し、Streamlit のメディアのURLで配信する
+            # （画像を再実行のたびに送らず、ブラウザは同じURLの画像をキャッシュから表示する）
+            if thumbnail_files:
+                st.image(thumbnail_files, caption=thumbnail_captions, width=THUMBNAIL_WIDTH)
+        
+        # 編集・削除は選択した1項目に対して行う（選択肢の表示名 → 項目の位置）
+        page_positions = {}
+        for i in page_indices:
+            item = items[i]
+            page_positions[f"{i + 1}. No.{item['deterioration_number']}: {item['location']} / {item['deterioration_name']} / {item['photo_number']}"] = i
+        
+        cols = st.columns([0.6, 0.2, 0.2])
+        with cols[0]:
+            selected_label = st.selectbox("操作する項目", list(page_positions), key="selected_item", label_visibility="collapsed")
+        with cols[1]:
+            st.button("編集", key="edit_selected_item", on_click=edit_item, args=(page_positions[selected_label],), use_container_width=True)
+        with cols[2]:
+            st.button("削除", key="delete_selected_item", on_click=delete_item, args=(page_positions[selected_label],), use_container_width=True)
 
     # 保存ボタン
     if st.button("保存"):
@@ -528,63 +770,12 @@ with tab_input:
                 st.rerun()
         else:
             # 既存の新規保存処理
-            # 劣化データを展開して保存用のデータフレームを作成
-            rows = []
-            newly_saved_items = []
-            
-            for item in st.session_state.inspection_items:
-                # 既に保存済みの項目はスキップ
-                item_key = f"{item['deterioration_number']}_{item['location']}_{item['deterioration_name']}_{item['photo_number']}"
-                if item_key in st.session_state.saved_items:
-                    continue
-                    
-                rows.append({
-                    "点検日": inspection_date.strftime("%Y-%m-%d"),
-                    "点検者名": inspector_name,
-                    "現場名": site_name,
-                    "棟名": building_name,
-                    "劣化番号": item["deterioration_number"],
-                    "場所": item["location"],
-                    "劣化名": item["deterioration_name"],
-                    "写真番号": item["photo_number"]
-                })
-                
-                # 保存済みリストに追加
-                newly_saved_items.append(item_key)
-            
-            # 保存するデータがある場合のみ処理
-            if rows:
-                df_save = pd.DataFrame(rows)
-                
-                csv_path = "data/inspection_data.csv"
-                if os.path.exists(csv_path):
-                    df_existing = pd.read_csv(csv_path, encoding='utf-8-sig')
-                    
-                    # 現場名と棟名の組み合わせごとに劣化番号を確認し、必要に応じて調整
-                    for i, row in enumerate(rows):
-                        # 劣化番号の重複を避けるために、既存の最大劣化番号を取得
-                        if not df_existing.empty and "劣化番号" in df_existing.columns:
-                            existing_max_number = df_existing["劣化番号"].max()
-                            
-                            # 新しいデータの劣化番号が既存の最大番号以下の場合、番号を調整
-                            if row["劣化番号"] <= existing_max_number:
-                                # 劣化番号を既存の最大番号+1に設定
-                                df_save.loc[i, "劣化番号"] = existing_max_number + 1
-                    
-                    df_save = pd.concat([df_existing, df_save], ignore_index=True)
-                
-                df_save.to_csv(csv_path, index=False, encoding='utf-8-sig')
-                
-                # 保存済みリストを更新
-                st.session_state.saved_items.extend(newly_saved_items)
-                
-                st.success(f"{len(rows)}件のデータを保存しました。入力データはそのまま残っています。必要に応じて編集・削除できます。")
+            saved_count = save_new_items(inspection_date, inspector_name, site_name, building_name)
+            if saved_count:
+                st.success(f"{saved_count}件のデータを保存しました。入力データはそのまま残っています。必要に応じて編集・削除できます。")
                 
                 # 保存後にフォームをリセットして新規入力を可能にする
-                st.session_state.form_submitted = True
-                st.session_state.temp_location = ""
-                st.session_state.temp_deterioration = ""
-                st.session_state.temp_photo = ""
+                reset_after_save()
             else:
                 st.info("保存するデータがありません。すべての項目は既に保存済みです。")
 
@@ -594,33 +785,66 @@ with tab_view:
     # 自動更新の設定
     col1, col2 = st.columns([1, 3])
     with col1:
-        auto_refresh = st.checkbox("自動更新（10秒ごと）", value=False)
+        auto_refresh = st.checkbox("自動更新（データの変更時）", value=False)
     with col2:
         edit_mode = st.checkbox("編集モード", value=False)
     
-    if auto_refresh and not edit_mode:  # 編集モード中は自動更新しない
-        st.markdown("""
-        <meta http-equiv="refresh" content="10">
-        """, unsafe_allow_html=True)
+    # 自動更新する場合は表示したデータのバージョンを記録し、描画後に変更を待つ（編集モード中は自動更新しない）
+    refresh_version = storage.version() if auto_refresh and not edit_mode else None
+    refresh_status = st.empty()
     
-    csv_path = "data/inspection_data.csv"
-    if os.path.exists(csv_path):
-        df = pd.read_csv(csv_path, encoding='utf-8-sig')
-        
+    if storage.exists():
         # 検索フィルター
-        search_term = st.text_input("検索（点検日、現場名、点検者名など）")
+        search_term = st.text_input(
+            "検索（点検日、現場名、点検者名など）",
+            help="ひらがな・カタカナ・全角半角を区別せずに検索します。空白区切りで複数条件、「現場名:○○ 点検日:2025-03」のように列を指定した検索もできます。"
+        )
         if search_term:
-            mask = df.astype(str).apply(lambda x: x.str.contains(search_term, case=False)).any(axis=1)
-            df = df[mask]
+            # データのバージョンごとに作成した検索索引を使う
+            with timer("search.filter") as search_timer:
+                matched_df = search_rows(storage, search_term)
+                search_timer.set_rows(len(matched_df))
+            total_count = len(matched_df)
+        else:
+            # 検索しない場合は件数だけを取得し、表示するページの行だけを読み込む
+            matched_df = None
+            with timer("storage.count"):
+                total_count = storage.count()
         
         # データが存在する場合のみ表示
-        if not df.empty:
-            st.write(f"合計 {len(df)} 件のデータがあります")
+        if total_count > 0:
+            # ページ送り
+            col1, col2 = st.columns(2)
+            with col1:
+                page_size = st.selectbox("1ページの表示件数", PAGE_SIZE_OPTIONS, index=PAGE_SIZE_OPTIONS.index(DEFAULT_PAGE_SIZE))
+            page_count = (total_count - 1) // page_size + 1
+            with col2:
+                page = st.number_input(f"ページ（全{page_count}ページ）", min_value=1, max_value=page_count, value=1, step=1)
+            page_offset = (page - 1) * page_size
+            if matched_df is not None:
+                # 検索結果は省メモリの型（カテゴリ型・日付型）のため、表示・編集用の文字列に戻す
+                df = expand_frame(matched_df.iloc[page_offset:page_offset + page_size])
+            else:
+                with timer("storage.read_page") as read_timer:
+                    df = storage.read_page(page_offset, page_size)
+                    read_timer.set_rows(len(df))
+            
+            st.write(f"合計 {total_count} 件のデータがあります（{page_offset + 1}〜{page_offset + len(df)}件目を表示）")
             
             # 編集モードの場合
             if edit_mode:
                 st.info("テーブル内のセルをタップして直接編集できます。行の追加も可能です。編集後は「変更を保存」ボタンをクリックしてください。")
                 
+                # 編集開始時の内容を保持し、保存時の差分計算と競合の確認に使う
+                # （再実行のたびに読み直すと、他のユーザーの変更を上書きしてしまうため）
+                editor_key = (search_term, page_size, page)
+                snapshot = st.session_state.get('editor_snapshot')
+                if snapshot is None or snapshot['key'] != editor_key:
+                    snapshot = {'key': editor_key, 'df': df.copy(), 'new_rows': []}
+                    st.session_state.editor_snapshot = snapshot
+                original_df = snapshot['df']
+                df = original_df.copy()
+                
                 # 行の操作ボタン
                 col1, col2 = st.columns(2)
                 with col1:
@@ -629,16 +853,22 @@ with tab_view:
                         new_row = {col: "" for col in df.columns}
                         # 必須フィールドに初期値を設定
                         new_row['点検日'] = datetime.now().strftime("%Y-%m-%d")
-                        new_row['劣化番号'] = df['劣化番号'].max() + 1 if not df.empty else 1
-                        df = pd.concat([df, pd.DataFrame([new_row])], ignore_index=True)
+                        # 劣化番号は保存時に現場名・棟名ごとに払い出す（ページ内の最大番号からは決めない）
+                        new_row['劣化番号'] = None
+                        snapshot['new_rows'].append(new_row)
                         st.success("新しい行を追加しました。内容を編集してください。")
+                with col2:
+                    if st.button("最新のデータを読み込む", key="reload_editor"):
+                        # 編集中の内容を破棄して保存先の内容を読み直す
+                        del st.session_state.editor_snapshot
+                        st.rerun()
                 
                 # データエディタの表示
                 try:
                     # データ型を適切に変換
                     # 日付列を文字列として扱う
                     if '点検日' in df.columns:
-                        df['点検日'] = df['点検日'].astype(str)
+                        df['点検日'] = df['点検日'].fillna('').astype(str)
                     
                     # 数値列を適切に変換
                     numeric_cols = ['劣化番号']
@@ -646,6 +876,14 @@ with tab_view:
                         if col in df.columns:
                             # NaN値を0に変換してから整数型に
                             df[col] = df[col].fillna(0).astype(int)
+                    editor_df = df
+                    # st.data_editor は RangeIndex 以外の表に追加された行を返さないことがあるため、
+                    # 行位置（0始まり）の表で編集し、行位置 → 行ID は別に保持する（追加した行は None）
+                    row_ids = list(df.index) + [None] * len(snapshot['new_rows'])
+                    df = pd.concat([df, pd.DataFrame(snapshot['new_rows'], columns=df.columns)], ignore_index=True)
+                    if '劣化番号' in df.columns:
+                        # 追加した行は番号が空のため、欠損値を扱える整数型にする
+                        df['劣化番号'] = pd.to_numeric(df['劣化番号'], errors='coerce').astype('Int64')
                     
                     # まずst.data_editorを試す
                     try:
@@ -656,11 +894,11 @@ with tab_view:
                             use_container_width=True,
                             num_rows="dynamic",  # 動的な行数
                             disabled=["劣化番号"],  # 劣化番号は編集不可
-                            hide_index=False,  # インデックスを表示
+                            hide_index=True,  # 行位置のインデックスは表示しない
                             column_config={
                                 # 点検日は文字列として扱う（DateColumnではなくTextColumnを使用）
                                 "点検日": st.column_config.TextColumn("点検日", help="YYYY-MM-DD形式で入力してください"),
-                                "劣化番号": st.column_config.NumberColumn("劣化番号", help="自動的に割り当てられる番号です"),
+                                "劣化番号": st.column_config.NumberColumn("劣化番号", help="自動的に割り当てられる番号です（追加した行は保存時に割り当てます）"),
                             }
                             # 古いバージョンでは行選択パラメータを使用しない
                         )
@@ -676,31 +914,95 @@ with tab_view:
                 # 変更を保存するボタン
                 if st.button("変更を保存", key="save_table_edits"):
                     try:
-                        # 更新情報を追加
-                        current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-                        
-                        # 更新履歴情報の列は追加しない
-                        # 変更された行を特定して保存
-                        
-                        # CSVに保存
-                        edited_df.to_csv(csv_path, index=False, encoding='utf-8-sig')
-                        st.success("変更を保存しました")
-                        st.rerun()  # 画面を更新
+                        # 変更・追加・削除された行だけを保存先に反映する
+                        # （検索で絞り込んだ表示でも、表示されていない行は変更されない）
+                        diff = compute_row_diff(editor_df, restore_row_ids(edited_df, row_ids))
+                        if not diff["changed"] and not diff["added"] and not diff["deleted"]:
+                            st.info("変更はありません")
+                        else:
+                            # 追加した行の劣化番号を現場名・棟名ごとに払い出す
+                            with timer("sequence.allocate", rows=len(diff["added"])):
+                                allocate_row_numbers(storage, diff["added"])
+                            with timer("storage.apply_diff", rows=len(diff["changed"]) + len(diff["added"]) + len(diff["deleted"])):
+                                storage.apply_diff(diff, original_df)
+                            # 表で変更した行（現場名・棟名・劣化番号の変更）の番号を以降に払い出さないようにする
+                            saved_rows = [dict(original_df.loc[row_id], **values) for row_id, values in diff["changed"].items()]
+                            advance_numbers(storage, saved_rows + diff["added"])
+                            del st.session_state.editor_snapshot
+                            st.success(f"変更を保存しました（変更 {len(diff['changed'])} 行・追加 {len(diff['added'])} 行・削除 {len(diff['deleted'])} 行）")
+                            st.rerun()  # 画面を更新
+                    except ConflictError as e:
+                        st.error(f"保存できませんでした。{str(e)}。「最新のデータを読み込む」で読み直してから編集してください。")
                     except Exception as e:
                         st.error(f"保存中にエラーが発生しました: {str(e)}")
             else:
+                # 編集モードを終えたら、次回は最新の内容から編集を始める
+                st.session_state.pop('editor_snapshot', None)
                 # 通常の表示モード（編集不可）
                 st.dataframe(df)
             
-            # CSVダウンロード
-            csv = df.to_csv(index=False, encoding='utf-8-sig')
-            st.download_button(
-                label="CSVダウンロード",
-                data=csv,
-                file_name="inspection_data.csv",
-                mime="text/csv"
-            )
+            # CSVエクスポート（保存先からチャンク単位で読み込み、一時ファイルに書き出す）
+            with st.expander("CSVエクスポート"):
+                export_format = st.selectbox("出力形式", list(EXPORT_FORMATS.keys()), key="export_format")
+                export_search = False
+                if search_term:
+                    export_search = st.checkbox("検索結果のみを出力", value=True, key="export_search")
+                col1, col2 = st.columns(2)
+                with col1:
+                    export_site = st.text_input("現場名で絞り込み", key="export_site", disabled=export_search)
+                with col2:
+                    export_building = st.text_input("棟名で絞り込み", key="export_building", disabled=export_search)
+                use_date_range = st.checkbox("点検日の期間で絞り込む", key="export_use_dates", disabled=export_search)
+                date_from = date_to = None
+                if use_date_range and not export_search:
+                    col1, col2 = st.columns(2)
+                    with col1:
+                        date_from = st.date_input("開始日", key="export_date_from")
+                    with col2:
+                        date_to = st.date_input("終了日", key="export_date_to")
+                
+                if st.button("エクスポートファイルを作成", key="prepare_download"):
+                    # 前回作成したファイルを削除する
+                    previous = st.session_state.pop('export_file', None)
+                    if previous and os.path.exists(previous['path']):
+                        os.remove(previous['path'])
+                    if export_search:
+                        path, count = export_csv(iter_frame_chunks(matched_df), export_format)
+                    else:
+                        path, count = export_storage(storage, export_format, export_site, export_building, date_from, date_to)
+                    st.session_state.export_file = {'path': path, 'count': count, 'format': export_format}
+                
+                export_file = st.session_state.get('export_file')
+                if export_file and os.path.exists(export_file['path']):
+                    if export_file['count'] == 0:
+                        st.info("条件に一致するデータがありません")
+                    else:
+                        _, _, suffix, mime = EXPORT_FORMATS[export_file['format']]
+                        st.write(f"{export_file['count']} 件を出力しました")
+                        # st.download_button はファイルの内容をまとめて送信するため、
+                        # 送信時にはファイルサイズ分のメモリを使う（作成時のメモリはチャンク分に収まる）
+                        with open(export_file['path'], 'rb') as f:
+                            st.download_button(
+                                label="CSVダウンロード",
+                                data=f,
+                                file_name="inspection_data" + suffix,
+                                mime=mime
+                            )
         else:
             st.info("検索条件に一致するデータがありません")
     else:
-        st.info("保存されたデータがありません")
\ No newline at end of file
+        st.info("保存されたデータがありません")
+
+# 再実行全体の処理時間と内訳を記録する（st.rerun() で中断された再実行は記録しない）
+get_metrics().finish_rerun()
+
+# 自動更新: ページ全体を読み込み直さず、保存先のバージョンだけを確認して変更された場合のみ再実行する
+# （入力内容・ページ位置などのセッションの状態は保たれる。操作された場合はその時点で待つのをやめて再実行される）
+if auto_refresh and not edit_mode:
+    def show_refresh_status():
+        refresh_status.caption(f"自動更新: データの変更を確認しています（{datetime.now():%H:%M:%S}）")
+
+    if wait_for_change(storage, refresh_version, on_poll=show_refresh_status, timeout=AUTO_REFRESH_TIMEOUT_SECONDS) is not None:
+        st.rerun()
+    # 変更が無いまま待ち続けないよう、一定時間でスクリプトを終了する（開いたままのタブがスレッドを使い続けないように）
+    refresh_status.caption(f"自動更新: {AUTO_REFRESH_TIMEOUT_SECONDS // 60}分間変更が無かったため確認を停止しました（画面を操作すると再開します）")
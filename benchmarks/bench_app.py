@@ -0,0 +1,330 @@
+# 点検アプリのデータ処理を Streamlit の外で計測する
+# マスターデータの読み込み・予測変換・点検データ全行の読み込み・現場名/棟名の絞り込み・保存（追記）と保存後の再読み込み・保存済みデータの更新・検索について、
+# p50/p99 の処理時間・スループット・ピークメモリ（Python のメモリ割り当て）を計測し、JSON に書き出す
+# 使い方:
+#   python benchmarks/bench_app.py [--master-sizes 1000 10000 100000] [--rows 10000 100000] [--backends csv sqlite]
+#   python benchmarks/bench_app.py --json results.json --compare previous.json
+#   python benchmarks/bench_app.py --master-sizes 500000 --rows 5000000 --budget 30   # 大規模データ
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jaconv
+import pandas as pd
+
+import master
+from datacache import get_dataset_cache
+from build_master import build
+from search import search_rows
+from storage import COLUMNS, CsvStorage, SqliteStorage
+from suggest import get_suggestions
+from synthetic import generate_master_rows, iter_inspection_chunks, write_master_csv
+
+# 1つの計測にかける時間の上限（秒）。repeat 回に達する前でも上限を超えたら打ち切る（最低3回は計測する）
+DEFAULT_BUDGET_SECONDS = 10
+MIN_REPEAT = 3
+
+# 保存（追記）1回あたりの行数（入力画面で1回に保存する劣化項目の数を想定）
+APPEND_BATCH = 20
+
+SEARCH_TERMS = ["現場001", "外壁", "ひびわれ", "現場名:現場002 点検日:2025-03", "山田 漏水", "存在しない語"]
+
+
+def _measure(func, repeat, budget=DEFAULT_BUDGET_SECONDS):
+    # func() の処理時間（秒）と戻り値（処理した件数）のリスト
+    timings = []
+    units = []
+    deadline = time.perf_counter() + budget
+    for i in range(repeat):
+        if i >= MIN_REPEAT and time.perf_counter() > deadline:
+            break
+        start = time.perf_counter()
+        count = func()
+        timings.append(time.perf_counter() - start)
+        units.append(count or 0)
+    return timings, units
+
+
+def _peak_memory(func):
+    # func() を1回実行した間の Python のメモリ割り当てのピーク（MB）
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return round(peak / 1024 / 1024, 2)
+
+
+def _percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def _result(benchmark, backend, size, timings, units, unit, peak_mb=None, **extra):
+    total = sum(timings)
+    result = {
+        "benchmark": benchmark,
+        "backend": backend,
+        "size": size,
+        "ops": len(timings),
+        "p50_ms": round(_percentile(timings, 0.5) * 1000, 4),
+        "p99_ms": round(_percentile(timings, 0.99) * 1000, 4),
+        "max_ms": round(max(timings) * 1000, 4),
+        "throughput": round(sum(units) / total, 1) if total > 0 else None,
+        "unit": unit,
+        "peak_mb": peak_mb,
+    }
+    result.update(extra)
+    return result
+
+
+def _keystrokes(text):
+    return [text[:i] for i in range(1, len(text) + 1)]
+
+
+def bench_master(size, work_dir, samples, budget, seed=0):
+    # マスターデータの読み込み（CSVの解析・変換済みデータ・キャッシュ）と予測変換
+    rng = random.Random(seed)
+    rows = generate_master_rows(size, seed)
+    path = os.path.join(work_dir, f"master_{size}.csv")
+    write_master_csv(path, rows)
+    results = []
+
+    def load_cold():
+        master.clear_cache()
+        return master.get_master_data(path).row_count
+
+    timings, units = _measure(load_cold, 5, budget)
+    results.append(_result("master.load_csv", "-", size, timings, units, "rows/s", _peak_memory(load_cold)))
+
+    timings, units = _measure(lambda: master.get_master_data(path) and 1, 200, budget)
+    results.append(_result("master.load_cached", "-", size, timings, units, "loads/s"))
+
+    start = time.perf_counter()
+    build(path)
+    build_seconds = time.perf_counter() - start
+    timings, units = _measure(load_cold, 20, budget)
+    results.append(_result("master.load_artifact", "-", size, timings, units, "rows/s", _peak_memory(load_cold),
+                           build_s=round(build_seconds, 3)))
+    os.remove(master.artifact_path_for(path))
+
+    master.clear_cache()
+    master_data = master.get_master_data(path)
+    locations = [row[0] for row in rows]
+    frequencies = {location: rng.randrange(1, 20) for location in rng.sample(locations, min(50, len(locations)))}
+    targets = rng.sample(rows, min(samples, len(rows)))
+    for mode, make_input in (("kana", lambda row: row[1]), ("romaji", lambda row: jaconv.kana2alphabet(row[1]))):
+        inputs = [text for row in targets for text in _keystrokes(make_input(row))]
+        timings = []
+        units = []
+        for text in inputs:
+            start = time.perf_counter()
+            get_suggestions(text, master_data.location_index, frequencies=frequencies)
+            timings.append(time.perf_counter() - start)
+            units.append(1)
+        results.append(_result(f"suggest.{mode}", "-", size, timings, units, "keystrokes/s"))
+    master.clear_cache()
+    return results
+
+
+def _populate(backend, count, work_dir, master_rows, seed):
+    # 点検データを作成し、保存先と (現場名, 棟名) の一覧を返す
+    sites = max(10, count // 10000)
+    if backend == "csv":
+        path = os.path.join(work_dir, f"inspection_{count}.csv")
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            f.write(",".join(COLUMNS) + "\n")
+        storage = CsvStorage(path)
+    else:
+        storage = SqliteStorage(os.path.join(work_dir, f"inspection_{count}.db"))
+    for chunk in iter_inspection_chunks(count, master_rows, sites=sites, seed=seed):
+        frame = pd.DataFrame(chunk, columns=COLUMNS)
+        if backend == "csv":
+            frame.to_csv(storage.path, mode="a", header=False, index=False, lineterminator="\n")
+        else:
+            storage.append_rows(frame)
+    pairs = [(f"現場{site:03d}", f"{building + 1}号棟") for site in range(sites) for building in range(5)]
+    return storage, pairs
+
+
+def bench_storage(backend, count, work_dir, master_rows, budget, seed=0):
+    # 現場名/棟名の絞り込み・検索・保存（追記）・保存済みデータの更新
+    rng = random.Random(seed)
+    start = time.perf_counter()
+    storage, pairs = _populate(backend, count, work_dir, master_rows, seed)
+    populate_seconds = time.perf_counter() - start
+    results = []
+
+    # 全行の読み込み（読み取り専用の省メモリの型）。最初の1回はCSVの解析と列指向のキャッシュの作成を含む
+    start = time.perf_counter()
+    frame = storage.read_frame()
+    first_seconds = time.perf_counter() - start
+    frame_mb = frame.memory_usage(deep=True).sum() / 1024 / 1024
+    raw_mb = storage.read_all().memory_usage(deep=True).sum() / 1024 / 1024
+    del frame
+
+    def read_frame():
+        return len(storage.read_frame())
+
+    timings, units = _measure(read_frame, 5, budget)
+    results.append(_result("storage.read_frame", backend, count, timings, units, "rows/s", _peak_memory(read_frame),
+                           first_ms=round(first_seconds * 1000, 2), frame_mb=round(frame_mb, 1), raw_mb=round(raw_mb, 1)))
+
+    # 最初の1回は索引の作成を含む
+    start = time.perf_counter()
+    storage.read_site(*pairs[0])
+    first_seconds = time.perf_counter() - start
+
+    def read_site():
+        return len(storage.read_site(*rng.choice(pairs)))
+
+    timings, units = _measure(read_site, 100, budget)
+    results.append(_result("storage.read_site", backend, count, timings, units, "rows/s", _peak_memory(read_site),
+                           first_ms=round(first_seconds * 1000, 2), populate_s=round(populate_seconds, 2)))
+
+    start = time.perf_counter()
+    search_rows(storage, SEARCH_TERMS[0])
+    first_seconds = time.perf_counter() - start
+    terms = iter(SEARCH_TERMS * 100)
+
+    def search():
+        return len(search_rows(storage, next(terms)))
+
+    timings, units = _measure(search, len(SEARCH_TERMS) * 5, budget)
+    results.append(_result("search.mask", backend, count, timings, units, "matches/s", _peak_memory(search),
+                           first_ms=round(first_seconds * 1000, 2)))
+
+    new_rows = iter(iter_inspection_chunks(10 ** 9, master_rows, seed=seed + 1, chunk_size=APPEND_BATCH))
+
+    def append():
+        return storage.append_rows(next(new_rows))
+
+    timings, units = _measure(append, 50, budget)
+    results.append(_result("storage.append", backend, count, timings, units, "rows/s", _peak_memory(append),
+                           batch=APPEND_BATCH))
+
+    # 1行を保存した後に、共有している全行を最新にする時間（CSV は追記された部分だけを読み込む）
+    cache = get_dataset_cache()
+    cache.get(storage)
+    single_rows = iter(iter_inspection_chunks(10 ** 9, master_rows, seed=seed + 2, chunk_size=1))
+    timings = []
+    deadline = time.perf_counter() + budget
+    while len(timings) < 20 and (len(timings) < MIN_REPEAT or time.perf_counter() < deadline):
+        storage.append_rows(next(single_rows))
+        start = time.perf_counter()
+        cache.get(storage)
+        timings.append(time.perf_counter() - start)
+    results.append(_result("storage.refresh", backend, count, timings, [1] * len(timings), "refreshes/s"))
+
+    total = storage.count()
+
+    def update_row():
+        row_id = rng.randrange(total)
+        if backend == "sqlite":
+            row_id += 1
+        storage.update_row(row_id, {"場所": f"更新{rng.randrange(1000)}"})
+        return 1
+
+    timings, units = _measure(update_row, 20, budget)
+    results.append(_result("storage.update_row", backend, count, timings, units, "rows/s", _peak_memory(update_row)))
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True,
+                                       cwd=os.path.dirname(os.path.abspath(__file__)), stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, previous_path, threshold):
+    # 前回の結果と p50/p99 を比較し、threshold 倍を超えて遅くなった計測の数を返す
+    with open(previous_path, encoding="utf-8") as f:
+        previous = json.load(f)
+    baseline = {(item["benchmark"], item["backend"], item["size"]): item for item in previous["results"]}
+    regressions = 0
+    print(f"\n前回（{previous['meta'].get('commit')}）との比較")
+    for item in results:
+        before = baseline.get((item["benchmark"], item["backend"], item["size"]))
+        if before is None:
+            continue
+        ratios = [item[key] / before[key] if before[key] else 1.0 for key in ("p50_ms", "p99_ms")]
+        flag = "遅くなりました" if max(ratios) > threshold else ""
+        regressions += bool(flag)
+        print(f"{item['benchmark']:<22} {item['backend']:>7} {item['size']:>9}"
+              f"  p50 x{ratios[0]:.2f}  p99 x{ratios[1]:.2f}  {flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="点検アプリのデータ処理の処理時間を計測します")
+    parser.add_argument("--master-sizes", type=int, nargs="*", default=[1000, 10000, 100000], help="マスターデータの件数")
+    parser.add_argument("--rows", type=int, nargs="*", default=[10000, 100000], help="点検データの行数")
+    parser.add_argument("--backends", nargs="+", default=["csv", "sqlite"], choices=["csv", "sqlite"])
+    parser.add_argument("--samples", type=int, default=50, help="予測変換で入力をシミュレートする項目数")
+    parser.add_argument("--budget", type=float, default=DEFAULT_BUDGET_SECONDS, help="1つの計測にかける時間の上限（秒）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--dir", help="作業ディレクトリ（省略時は一時ディレクトリを作成して終了時に削除）")
+    parser.add_argument("--json", help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", help="比較する前回の結果（JSON）")
+    parser.add_argument("--threshold", type=float, default=1.2, help="遅くなったと判定する比率")
+    args = parser.parse_args()
+
+    work_dir = args.dir or tempfile.mkdtemp(prefix="bench_app_")
+    os.makedirs(work_dir, exist_ok=True)
+    results = []
+    print(f"{'計測':<22} {'保存先':>7} {'件数':>9} {'回数':>5} {'p50(ms)':>10} {'p99(ms)':>10} {'スループット':>16} {'ピーク(MB)':>10}")
+
+    def report(items):
+        for item in items:
+            results.append(item)
+            throughput = f"{item['throughput']} {item['unit']}" if item["throughput"] is not None else "-"
+            print(f"{item['benchmark']:<22} {item['backend']:>7} {item['size']:>9} {item['ops']:>5} "
+                  f"{item['p50_ms']:>10} {item['p99_ms']:>10} {throughput:>16} {item['peak_mb'] if item['peak_mb'] is not None else '-':>10}")
+
+    try:
+        for size in args.master_sizes:
+            report(bench_master(size, work_dir, args.samples, args.budget, args.seed))
+        master_rows = generate_master_rows(1000, args.seed)
+        for count in args.rows:
+            for backend in args.backends:
+                report(bench_storage(backend, count, work_dir, master_rows, args.budget, args.seed))
+    finally:
+        if not args.dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = {
+        "meta": {
+            "commit": _git_commit(),
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(output, f, ensure_ascii=False, indent=2)
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.threshold)
+        sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+# 予測変換の1キー入力あたりの処理時間をマスター件数ごとに計測する
+# 使い方: python benchmarks/bench_suggest.py [--sizes 1000 10000 50000] [--json results.json]
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import jaconv
+
+from suggest import SuggestionIndex
+from synthetic import generate_master_rows
+
+
+def _typo(reading, rng):
+    # よみの1文字を別のひらがなに置き換える
+    if len(reading) < 2:
+        return reading
+    i = rng.randrange(len(reading))
+    return reading[:i] + chr(rng.randrange(ord('あ'), ord('ん') + 1)) + reading[i + 1:]
+
+
+def _keystrokes(text):
+    return [text[:i] for i in range(1, len(text) + 1)]
+
+
+def _percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * ratio))]
+
+
+def bench_size(size, samples, seed=0):
+    rng = random.Random(seed)
+    rows = generate_master_rows(size, seed)
+    locations = list(dict.fromkeys(row[0] for row in rows))
+    yomi = list(dict.fromkeys(row[1] for row in rows))
+    mapping = dict(zip((row[1] for row in rows), (row[0] for row in rows)))
+
+    start = time.perf_counter()
+    index = SuggestionIndex(locations, yomi, mapping)
+    build_seconds = time.perf_counter() - start
+
+    frequencies = {location: rng.randrange(1, 20) for location in rng.sample(locations, min(50, len(locations)))}
+    targets = rng.sample(rows, min(samples, len(rows)))
+
+    results = {}
+    modes = {
+        "kana": lambda row: row[1],
+        "romaji": lambda row: jaconv.kana2alphabet(row[1]),
+        "typo": lambda row: _typo(row[1], rng),
+    }
+    for mode, make_input in modes.items():
+        timings = []
+        for row in targets:
+            for text in _keystrokes(make_input(row)):
+                start = time.perf_counter()
+                index.suggest(text, frequencies=frequencies)
+                timings.append((time.perf_counter() - start) * 1000)
+        results[mode] = {
+            "keystrokes": len(timings),
+            "p50_ms": round(statistics.median(timings), 4),
+            "p99_ms": round(_percentile(timings, 0.99), 4),
+            "max_ms": round(max(timings), 4),
+        }
+    return {"size": size, "build_s": round(build_seconds, 3), "modes": results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="予測変換のキー入力ごとの処理時間を計測します")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000, 100000])
+    parser.add_argument("--samples", type=int, default=200, help="マスター件数ごとに入力をシミュレートする項目数")
+    parser.add_argument("--json", help="結果を書き出すJSONファイル")
+    args = parser.parse_args()
+
+    report = []
+    print(f"{'件数':>8} {'構築(s)':>8} {'入力':>7} {'p50(ms)':>9} {'p99(ms)':>9} {'max(ms)':>9}")
+    for size in args.sizes:
+        result = bench_size(size, args.samples)
+        report.append(result)
+        for mode, stats in result["modes"].items():
+            print(f"{size:>8} {result['build_s']:>8} {mode:>7} {stats['p50_ms']:>9} {stats['p99_ms']:>9} {stats['max_ms']:>9}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+import random
+
+# 合成データ生成用の語彙（表記, よみ）
+FLOORS = [
+    ("1階", "いっかい"), ("2階", "にかい"), ("3階", "さんかい"), ("4階", "よんかい"),
+    ("5階", "ごかい"), ("6階", "ろっかい"), ("7階", "ななかい"), ("8階", "はっかい"),
+    ("地下1階", "ちかいっかい"), ("屋上", "おくじょう"), ("塔屋", "とうや"),
+]
+AREAS = [
+    ("廊下", "ろうか"), ("階段", "かいだん"), ("外壁", "がいへき"), ("玄関", "げんかん"),
+    ("機械室", "きかいしつ"), ("駐車場", "ちゅうしゃじょう"), ("バルコニー", "ばるこにー"),
+    ("庇", "ひさし"), ("手摺", "てすり"), ("笠木", "かさぎ"), ("天井", "てんじょう"),
+    ("床", "ゆか"), ("開口部", "かいこうぶ"), ("排水溝", "はいすいこう"), ("パラペット", "ぱらぺっと"),
+    ("エントランス", "えんとらんす"), ("ポーチ", "ぽーち"), ("外階段", "そとかいだん"),
+]
+SIDES = [
+    ("", ""), ("北面", "ほくめん"), ("南面", "なんめん"), ("東面", "とうめん"), ("西面", "せいめん"),
+    ("北側", "きたがわ"), ("南側", "みなみがわ"),
+]
+DETERIORATIONS = [
+    ("ひび割れ", "ひびわれ"), ("剥離", "はくり"), ("漏水", "ろうすい"), ("腐食", "ふしょく"),
+    ("変形", "へんけい"), ("欠損", "けっそん"), ("さび", "さび"), ("変色", "へんしょく"),
+    ("浮き", "うき"), ("白華", "はっか"), ("爆裂", "ばくれつ"), ("鉄筋露出", "てっきんろしゅつ"),
+    ("塗膜剥れ", "とまくはがれ"), ("シーリング劣化", "しーりんぐれっか"), ("汚れ", "よごれ"),
+    ("傾斜", "けいしゃ"), ("沈下", "ちんか"), ("脱落", "だつらく"), ("膨れ", "ふくれ"),
+]
+MODIFIERS = [
+    ("", ""), ("軽微な", "けいびな"), ("著しい", "いちじるしい"), ("部分的な", "ぶぶんてきな"),
+]
+INSPECTORS = ["山田", "佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "中村"]
+
+MASTER_COLUMNS = ['場所', '場所よみ', '劣化名', '劣化名よみ']
+
+
+def _numbered(surface, reading, serial):
+    # 語彙が尽きた場合は番号を付けて一意な項目にする
+    if serial == 0:
+        return surface, reading
+    return f"{surface}{serial}", f"{reading}{serial}"
+
+
+def generate_master_rows(size, seed=0):
+    # 場所・劣化名それぞれ size 件の一意な項目を持つマスターデータの行を生成する
+    rng = random.Random(seed)
+    locations = []
+    for serial in range(size // (len(FLOORS) * len(AREAS) * len(SIDES)) + 1):
+        for floor in FLOORS:
+            for side in SIDES:
+                for area in AREAS:
+                    surface = floor[0] + side[0] + area[0]
+                    reading = floor[1] + side[1] + area[1]
+                    locations.append(_numbered(surface, reading, serial))
+    deteriorations = []
+    for serial in range(size // (len(DETERIORATIONS) * len(MODIFIERS)) + 1):
+        for modifier in MODIFIERS:
+            for deterioration in DETERIORATIONS:
+                surface = modifier[0] + deterioration[0]
+                reading = modifier[1] + deterioration[1]
+                deteriorations.append(_numbered(surface, reading, serial))
+    rng.shuffle(locations)
+    rng.shuffle(deteriorations)
+    return [
+        (location[0], location[1], deterioration[0], deterioration[1])
+        for location, deterioration in zip(locations[:size], deteriorations[:size])
+    ]
+
+
+def iter_inspection_rows(count, master_rows, sites=50, buildings=5, seed=0):
+    # 点検データの行を1行ずつ生成する（劣化番号は現場名・棟名ごとの連番）
+    rng = random.Random(seed)
+    numbers = {}
+    for _ in range(count):
+        site = f"現場{rng.randrange(sites):03d}"
+        building = f"{rng.randrange(buildings) + 1}号棟"
+        numbers[(site, building)] = numbers.get((site, building), 0) + 1
+        location, _, deterioration, _ = rng.choice(master_rows)
+        yield {
+            "点検日": f"2025-{rng.randrange(12) + 1:02d}-{rng.randrange(28) + 1:02d}",
+            "点検者名": rng.choice(INSPECTORS),
+            "現場名": site,
+            "棟名": building,
+            "劣化番号": numbers[(site, building)],
+            "場所": location,
+            "劣化名": deterioration,
+            "写真番号": f"P{rng.randrange(1000):04d}",
+        }
+
+
+def generate_inspection_rows(count, master_rows, sites=50, buildings=5, seed=0):
+    return list(iter_inspection_rows(count, master_rows, sites, buildings, seed))
+
+
+def write_master_csv(path, master_rows, encoding="utf-8"):
+    with open(path, "w", encoding=encoding, newline="") as f:
+        f.write(",".join(MASTER_COLUMNS) + "\n")
+        for row in master_rows:
+            f.write(",".join(row) + "\n")
+
+
+def iter_inspection_chunks(count, master_rows, sites=50, buildings=5, seed=0, chunk_size=100000):
+    # 大きな点検データを一度にメモリに載せずに作るため、chunk_size 行ずつのリストで返す
+    chunk = []
+    for row in iter_inspection_rows(count, master_rows, sites, buildings, seed):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
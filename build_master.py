@@ -0,0 +1,101 @@
+# マスターデータのCSVを正規化し、予測変換用の索引を含む変換済みデータ（data/master_data.pkl）を作成する
+# アプリは変換済みデータがCSVと一致していれば1回の読み込みで復元し、CSVの解析と索引の作成を省略する
+# 使い方:
+#   python build_master.py [--master data/master_data.csv] [--output data/master_data.pkl]
+#   python build_master.py --yomi-converter dictionary --update-csv
+# マスターデータのCSVを更新した場合は作成し直す（作成し直すまではCSVを解析して使う）
+import argparse
+import os
+import sys
+import time
+
+from import_data import MASTER_COLUMNS, clean_text
+from master import MASTER_PATH, MasterData, load_artifact, read_master_frame, save_artifact
+from yomi import get_converter, normalize_yomi
+
+PAIRS = (("場所", "場所よみ"), ("劣化名", "劣化名よみ"))
+
+
+def normalize_master(df, converter_name=None):
+    # 表記・よみを正規化し、よみが無い項目はよみを生成する
+    # (正規化したデータフレーム, 生成したよみの数) を返す
+    df = df.reindex(columns=MASTER_COLUMNS)
+    converter = get_converter(converter_name)
+    for surface_column, yomi_column in PAIRS:
+        for surface, reading in zip(df[surface_column], df[yomi_column]):
+            if isinstance(reading, str) and reading.strip():
+                converter.add(clean_text(surface), normalize_yomi(reading))
+
+    generated = 0
+    for surface_column, yomi_column in PAIRS:
+        surfaces = []
+        readings = []
+        for surface, reading in zip(df[surface_column], df[yomi_column]):
+            surface = clean_text(surface)
+            if not surface:
+                surfaces.append(None)
+                readings.append(None)
+                continue
+            if isinstance(reading, str) and reading.strip():
+                reading = normalize_yomi(reading)
+            else:
+                reading = converter.convert(surface)
+                generated += 1
+            surfaces.append(surface)
+            readings.append(reading)
+        df[surface_column] = surfaces
+        df[yomi_column] = readings
+    return df, generated
+
+
+def build(master_path=MASTER_PATH, output_path=None, converter_name=None, update_csv=False):
+    # 変換済みデータを作成し、(出力先, 生成したよみの数, 場所の数, 劣化名の数) を返す
+    df, encoding = read_master_frame(master_path)
+    df, generated = normalize_master(df, converter_name)
+    if update_csv:
+        # 生成したよみをCSVにも書き戻す（元のエンコーディングで書けない文字があれば UTF-8 にする）
+        tmp_path = master_path + ".tmp"
+        try:
+            df.to_csv(tmp_path, index=False, encoding=encoding)
+        except UnicodeEncodeError:
+            encoding = 'utf-8'
+            df.to_csv(tmp_path, index=False, encoding=encoding)
+        os.replace(tmp_path, master_path)
+
+    master = MasterData.from_dataframe(df, encoding)
+    output_path = save_artifact(master, master_path, output_path)
+    return output_path, generated, len(master.locations), len(master.deterioration_types)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="マスターデータの変換済みデータ（索引を含む）を作成します")
+    parser.add_argument("--master", default=MASTER_PATH, help="マスターデータのCSV")
+    parser.add_argument("--output", help="出力先（省略時はCSVと同じ名前で拡張子が .pkl）")
+    parser.add_argument("--yomi-converter", choices=["dictionary", "kakasi"],
+                        help="よみの生成方法（省略時は pykakasi があれば使い、無ければ辞書で変換する）")
+    parser.add_argument("--update-csv", action="store_true", help="正規化・生成したよみをCSVにも書き戻す")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.master):
+        print(f"マスターデータが見つかりません: {args.master}", file=sys.stderr)
+        sys.exit(1)
+
+    started = time.perf_counter()
+    output_path, generated, locations, deteriorations = build(
+        args.master, args.output, args.yomi_converter, args.update_csv
+    )
+    elapsed = time.perf_counter() - started
+    print(f"作成しました: {output_path}（場所 {locations}件・劣化名 {deteriorations}件、"
+          f"生成したよみ {generated}件、{elapsed:.1f}秒）")
+
+    # 作成したデータを読み込めることと、読み込みにかかる時間を確認する
+    started = time.perf_counter()
+    master = load_artifact(output_path)
+    elapsed = (time.perf_counter() - started) * 1000
+    size = os.path.getsize(output_path) / 1024 / 1024
+    print(f"読み込み: {elapsed:.0f}ミリ秒（{size:.1f}MB）" if master is not None else "読み込みに失敗しました")
+    sys.exit(0 if master is not None else 1)
+
+
+if __name__ == "__main__":
+    main()
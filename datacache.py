@@ -0,0 +1,260 @@
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+# 点検データのプロセス全体で共有するキャッシュ
+# 保存先ごとに全行（storage.load_frame()）を1つだけ読み込み、すべてのセッションに読み取り専用で渡す
+# 保存先のバージョン（書き込みのたびに変わる）が変わった場合のみ読み込み直す（追記の場合は追記された部分だけ）
+# 全行から作る派生データ（現場名/棟名ごとの行・検索索引など）はバージョンごとに保持し、
+# 合計のメモリ使用量が上限を超えた場合は最も長く使われていないものから破棄する
+CACHE_MAX_MB_ENV = "INSPECTION_CACHE_MB"
+DEFAULT_CACHE_MAX_MB = 1024
+
+# 文字列の列のメモリ使用量を見積もる際に数える行数
+_SAMPLE_ROWS = 1000
+
+# 追記前のバージョンを覚えておく数（派生データをこの数のバージョンまで遡って追記分だけ更新できる）
+LINEAGE_SIZE = 64
+
+# GrowableArray の容量の最小値と、容量を増やす際に加える余裕（要素数に対する割合の逆数）
+_MIN_CAPACITY = 1024
+_GROWTH_DIVISOR = 8
+
+_grow_lock = threading.Lock()
+
+
+def frame_bytes(df):
+    # データフレームのメモリ使用量の見積もり（文字列の列は先頭の一部の行から見積もる）
+    return int(df.index.memory_usage()) + sum(series_bytes(df[column]) for column in df.columns)
+
+
+def series_bytes(series):
+    # 列のメモリ使用量の見積もり（文字列の列・カテゴリは先頭の一部から見積もる）
+    total = int(series.memory_usage(index=False, deep=False))
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        values = series.cat.categories
+        sample = values[:_SAMPLE_ROWS]
+    elif series.dtype == object:
+        values = series
+        sample = series.iloc[:_SAMPLE_ROWS]
+    else:
+        return total
+    if len(sample):
+        per_value = (sample.memory_usage(deep=True) - sample.memory_usage(deep=False)) / len(sample)
+        total += int(per_value * len(values))
+    return total
+
+
+def _size_of(value):
+    if hasattr(value, 'memory_bytes'):
+        return value.memory_bytes()
+    if isinstance(value, pd.DataFrame):
+        return frame_bytes(value)
+    if isinstance(value, dict):
+        # 行位置の配列を値に持つ索引など
+        return sys.getsizeof(value) + sum(getattr(item, 'nbytes', 0) for item in value.values())
+    return sys.getsizeof(value)
+
+
+class GrowableArray:
+    # 末尾への追加だけを行う配列。容量に余裕を持たせ、追加のたびに全体をコピーしない
+    # view() は先頭からの要素の参照（コピーしない）。追加は既存の要素を書き換えないため、以前の参照はそのまま使える
+    def __init__(self, values, capacity=0):
+        values = np.asarray(values)
+        self.length = len(values)
+        self._data = np.empty(max(capacity, _capacity_for(self.length)), dtype=values.dtype)
+        self._data[:self.length] = values
+
+    @property
+    def dtype(self):
+        return self._data.dtype
+
+    def view(self, length=None):
+        return self._data[:self.length if length is None else length]
+
+    def append(self, values, length):
+        # 先頭 length 要素の後に values を加え、(配列, 先頭からの参照) を返す
+        # 既に他の追加で length より長くなっている場合は、先頭 length 要素をコピーした新しい配列に加える
+        values = np.asarray(values)
+        with _grow_lock:
+            target = self if length == self.length else GrowableArray(self._data[:length], length + len(values))
+            needed = length + len(values)
+            if needed > len(target._data):
+                # 以前の参照は元の配列を指したまま残る
+                data = np.empty(_capacity_for(needed), dtype=target._data.dtype)
+                data[:length] = target._data[:length]
+                target._data = data
+            target._data[length:needed] = values
+            target.length = needed
+            return target, target._data[:needed]
+
+
+def _capacity_for(length):
+    return max(_MIN_CAPACITY, length + length // _GROWTH_DIVISOR)
+
+
+def dataset_key(storage):
+    return (storage.name, os.path.abspath(storage.path))
+
+
+def _appended(previous, position):
+    # position の全行が previous の全行に行を追記しただけのものか（storage.load_frame が追記前の位置を記録する）
+    return (previous is not None and position is not None and position.get("ino") == previous.get("ino")
+            and position.get("base_offset") == previous.get("offset") and position.get("base_rows") == previous.get("rows"))
+
+
+class Dataset:
+    # ある時点（バージョン）の全行。frame は全セッションで共有するため変更しない（変更する場合はコピーする）
+    # position は保存先での読み込み位置（追記された部分だけを読み込むために使う。無い場合は None）
+    # lineage は追記前のバージョン → その時点の行数（frame はそれらの全行の後に行を追記したもの）
+    def __init__(self, cache, key, version, frame, position=None, lineage=None):
+        self.cache = cache
+        self.key = key
+        self.version = version
+        self.frame = frame
+        self.position = position
+        self.lineage = lineage or {}
+        self.nbytes = frame_bytes(frame)
+
+    def view(self, name, build, extend=None):
+        # 全行から作る派生データ（build(frame) の結果）。同じバージョンの間は作成済みのものを使う
+        # extend(前の値, frame, 追記された行の先頭位置) を指定すると、追記前のバージョンの値を追記分だけ更新する
+        return self.cache.view(self, name, build, extend)
+
+
+class DatasetCache:
+    def __init__(self, max_bytes=None):
+        if max_bytes is None:
+            max_bytes = int(float(os.environ.get(CACHE_MAX_MB_ENV, DEFAULT_CACHE_MAX_MB)) * 1024 * 1024)
+        self.max_bytes = max_bytes
+        self._datasets = OrderedDict()
+        # (保存先のキー, 派生データの名前) → (バージョン, 値, メモリ使用量)
+        self._views = OrderedDict()
+        self._load_locks = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.evictions = 0
+
+    def get(self, storage):
+        # 保存先の最新の全行（Dataset）。複数のセッションが同時に読み込み直す場合も読み込みは1回だけ行う
+        key = dataset_key(storage)
+        version = storage.version()
+        with self._lock:
+            dataset = self._datasets.get(key)
+            if dataset is not None and dataset.version == version:
+                self._datasets.move_to_end(key)
+                return dataset
+            load_lock = self._load_locks.setdefault(key, threading.Lock())
+        with load_lock:
+            # 待っている間に他のセッションが読み込んでいればそれを使う
+            version = storage.version()
+            with self._lock:
+                dataset = self._datasets.get(key)
+                if dataset is not None and dataset.version == version:
+                    self._datasets.move_to_end(key)
+                    return dataset
+            # 前回の全行があれば、保存先はその後に追記された部分だけを読み込む（storage.load_frame）
+            # 読み込み中に書き込まれた場合は古いバージョンとして登録され、次回の参照で読み込み直す
+            previous = (dataset.frame, dataset.position) if dataset is not None else None
+            frame, position = storage.load_frame(previous)
+            lineage = None
+            if dataset is not None and _appended(dataset.position, position):
+                # 追記されただけなら、前のバージョンの派生データを追記分だけ更新して使えるようにする
+                lineage = dict(list(dataset.lineage.items())[-(LINEAGE_SIZE - 1):])
+                lineage[dataset.version] = len(dataset.frame)
+            dataset = Dataset(self, key, version, frame, position, lineage)
+            with self._lock:
+                self.loads += 1
+                self._install(dataset)
+        return dataset
+
+    def view(self, dataset, name, build, extend=None):
+        view_key = (dataset.key, name)
+        with self._lock:
+            cached = self._views.get(view_key)
+            if cached is not None and cached[0] == dataset.version:
+                self._views.move_to_end(view_key)
+                self.hits += 1
+                return cached[1]
+            self.misses += 1
+        if extend is not None and cached is not None and cached[0] in dataset.lineage:
+            value = extend(cached[1], dataset.frame, dataset.lineage[cached[0]])
+        else:
+            value = build(dataset.frame)
+        nbytes = _size_of(value)
+        with self._lock:
+            # 作成中に新しいバージョンが読み込まれた場合は保持しない（呼び出し元には作成した値を返す）
+            if self._datasets.get(dataset.key) is dataset:
+                self._views[view_key] = (dataset.version, value, nbytes)
+                self._views.move_to_end(view_key)
+                self._evict(keep=view_key)
+        return value
+
+    def _install(self, dataset):
+        # _lock を取得した状態で呼び出す
+        # 前のバージョンの派生データは破棄する（追記されただけの場合は、追記分だけ更新できるよう残す）
+        if dataset.lineage:
+            self._datasets.pop(dataset.key, None)
+        else:
+            self._discard(dataset.key)
+        self._datasets[dataset.key] = dataset
+        self._evict(keep=None)
+
+    def _discard(self, key):
+        # 保存先の全行と派生データを破棄し、解放したメモリ使用量を返す
+        dataset = self._datasets.pop(key, None)
+        freed = dataset.nbytes if dataset is not None else 0
+        for view_key in [view_key for view_key in self._views if view_key[0] == key]:
+            freed += self._views.pop(view_key)[2]
+        return freed
+
+    def _used_bytes(self):
+        return sum(dataset.nbytes for dataset in self._datasets.values()) + sum(view[2] for view in self._views.values())
+
+    def _evict(self, keep):
+        # 派生データを古いものから破棄し、それでも上限を超える場合は最も長く使われていない保存先の全行を破棄する
+        # （最後に使われた保存先の全行と、作成したばかりの派生データは破棄しない）
+        used = self._used_bytes()
+        for view_key in list(self._views):
+            if used <= self.max_bytes:
+                return
+            if view_key == keep:
+                continue
+            used -= self._views.pop(view_key)[2]
+            self.evictions += 1
+        for key in list(self._datasets)[:-1]:
+            if used <= self.max_bytes:
+                return
+            used -= self._discard(key)
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "datasets": len(self._datasets),
+                "views": len(self._views),
+                "used_mb": round(self._used_bytes() / 1024 / 1024, 1),
+                "max_mb": round(self.max_bytes / 1024 / 1024, 1),
+                "hits": self.hits,
+                "misses": self.misses,
+                "loads": self.loads,
+                "evictions": self.evictions,
+            }
+
+    def clear(self):
+        with self._lock:
+            self._datasets.clear()
+            self._views.clear()
+
+
+_cache = DatasetCache()
+
+
+def get_dataset_cache():
+    return _cache
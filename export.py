@@ -0,0 +1,56 @@
+import gzip
+import os
+import tempfile
+
+# 一度に読み込んで書き出す行数（ピーク時のメモリ使用量はこの行数分に収まる）
+EXPORT_CHUNK_SIZE = 20000
+
+# 出力形式: 表示名 → (エンコーディング, gzip 圧縮するか, 拡張子, MIMEタイプ)
+# cp932 は現場の Excel でそのまま開くための形式（cp932 に無い文字は「?」に置き換える）
+EXPORT_FORMATS = {
+    "UTF-8（BOM付き）": ('utf-8-sig', False, ".csv", "text/csv"),
+    "Shift_JIS（cp932・Excel向け）": ('cp932', False, ".csv", "text/csv"),
+    "UTF-8（gzip圧縮）": ('utf-8-sig', True, ".csv.gz", "application/gzip"),
+}
+
+
+def iter_frame_chunks(df, chunk_size=EXPORT_CHUNK_SIZE):
+    # 読み込み済みのデータ（検索結果など）を同じ形で書き出すためのチャンク
+    for start in range(0, len(df), chunk_size):
+        yield df.iloc[start:start + chunk_size]
+
+
+def write_chunks(chunks, f):
+    # チャンクを順にCSVとして書き出し、書き出した行数を返す（ヘッダーは最初のチャンクのみ）
+    count = 0
+    header = True
+    for chunk in chunks:
+        chunk.to_csv(f, index=False, header=header)
+        header = False
+        count += len(chunk)
+    return count
+
+
+def export_csv(chunks, export_format, directory=None):
+    # チャンクを一時ファイルに書き出し、(ファイルパス, 行数) を返す
+    encoding, compress, suffix, _ = EXPORT_FORMATS[export_format]
+    fd, path = tempfile.mkstemp(suffix=suffix, prefix="inspection_export_", dir=directory)
+    os.close(fd)
+    try:
+        if compress:
+            f = gzip.open(path, 'wt', encoding=encoding, errors='replace', newline='')
+        else:
+            f = open(path, 'w', encoding=encoding, errors='replace', newline='')
+        with f:
+            count = write_chunks(chunks, f)
+    except Exception:
+        os.remove(path)
+        raise
+    return path, count
+
+
+def export_storage(storage, export_format, site_name=None, building_name=None, date_from=None, date_to=None,
+                   chunk_size=EXPORT_CHUNK_SIZE, directory=None):
+    # 保存先から条件に一致する行をチャンク単位で読み込みながら書き出す
+    chunks = storage.iter_chunks(chunk_size, site_name, building_name, date_from, date_to)
+    return export_csv(chunks, export_format, directory)
@@ -0,0 +1,326 @@
+# 他の点検ツールから出力したCSV・Excelの点検データ、マスターデータを一括で取り込む
+# 使い方:
+#   python import_data.py inspections 点検データ.csv [--encoding cp932] [--workers 4] [--keep-numbers] [--dry-run]
+#   python import_data.py master マスター.xlsx [--replace] [--yomi-converter dictionary]
+# Excel（.xlsx）の読み込みには openpyxl が必要（pip install openpyxl）
+import argparse
+import os
+import re
+import sys
+import time
+import unicodedata
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, datetime
+
+import jaconv
+import numpy as np
+import pandas as pd
+
+try:
+    import openpyxl
+except ImportError:  # 任意の依存（Excel を読み込む場合のみ必要）
+    openpyxl = None
+
+from master import MASTER_PATH, read_master_frame
+from sequences import get_allocator
+from storage import COLUMNS, get_storage
+from yomi import get_converter, normalize_yomi
+
+CHUNK_SIZE = 50000
+
+# 点検データの必須列と任意の列
+REQUIRED_COLUMNS = ["点検日", "現場名", "棟名", "場所", "劣化名"]
+OPTIONAL_COLUMNS = ["点検者名", "劣化番号", "写真番号"]
+TEXT_COLUMNS = ["点検者名", "現場名", "棟名", "場所", "劣化名", "写真番号"]
+
+MASTER_COLUMNS = ["場所", "場所よみ", "劣化名", "劣化名よみ"]
+EXCEL_EXTENSIONS = ('.xlsx', '.xlsm')
+_JAPANESE_DATE_PATTERN = re.compile(r'(\d{4})年(\d{1,2})月(\d{1,2})日')
+
+
+def _cell_text(value):
+    # Excel のセルの値を文字列にする
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def _read_excel_chunks(path, chunk_size, sheet=None):
+    if openpyxl is None:
+        raise ImportError("Excel ファイルの読み込みには openpyxl が必要です（pip install openpyxl）")
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        worksheet = workbook[sheet] if sheet else workbook.active
+        rows = worksheet.iter_rows(values_only=True)
+        header = [_cell_text(value).strip() for value in next(rows, ())]
+        buffer = []
+        offset = 0
+        for row in rows:
+            row = [_cell_text(value) for value in row[:len(header)]]
+            buffer.append(row + [""] * (len(header) - len(row)))
+            if len(buffer) >= chunk_size:
+                # インデックスはCSVと同じくファイル全体での行位置にする
+                yield pd.DataFrame(buffer, columns=header, index=pd.RangeIndex(offset, offset + len(buffer)))
+                offset += len(buffer)
+                buffer = []
+        if buffer:
+            yield pd.DataFrame(buffer, columns=header, index=pd.RangeIndex(offset, offset + len(buffer)))
+    finally:
+        workbook.close()
+
+
+def read_chunks(path, chunk_size=CHUNK_SIZE, encoding='utf-8-sig', sheet=None):
+    # 入力ファイルを chunk_size 行ずつ文字列のデータフレームとして読み込む
+    if path.lower().endswith(EXCEL_EXTENSIONS):
+        chunks = _read_excel_chunks(path, chunk_size, sheet)
+    else:
+        chunks = pd.read_csv(path, encoding=encoding, dtype=str, keep_default_na=False, chunksize=chunk_size)
+    for chunk in chunks:
+        chunk.columns = [str(column).strip() for column in chunk.columns]
+        yield chunk
+
+
+def validate_columns(columns, required):
+    # 不足している列があれば ValueError を送出し、取り込まない列の一覧を返す
+    missing = [column for column in required if column not in columns]
+    if missing:
+        raise ValueError(f"必須の列がありません: {', '.join(missing)}")
+    return [column for column in columns if column not in required + OPTIONAL_COLUMNS + MASTER_COLUMNS]
+
+
+def clean_text(value):
+    # 全角英数・半角カナなどの表記ゆれを揃える
+    return jaconv.normalize(value).strip()
+
+
+def _map_unique(values, function):
+    # 同じ値は1度だけ変換する（点検データは同じ値の繰り返しが多い）
+    codes, uniques = pd.factorize(values)
+    converted = np.array([function(value) for value in uniques] + [None], dtype=object)
+    return converted[codes]
+
+
+def _parse_dates(values):
+    # 日付を YYYY-MM-DD の文字列にする（読めない値は None）。同じ値はまとめて1度だけ変換する
+    codes, uniques = pd.factorize(values)
+    # 全角数字・「2025年1月5日」の形式も読めるようにする
+    texts = [_JAPANESE_DATE_PATTERN.sub(r'\1-\2-\3', unicodedata.normalize('NFKC', value)) for value in uniques]
+    parsed = pd.to_datetime(pd.Series(texts, dtype=object), errors='coerce', format='mixed')
+    converted = np.array(list(parsed.dt.strftime("%Y-%m-%d").where(parsed.notna(), None)) + [None], dtype=object)
+    return converted[codes]
+
+
+def _parse_number(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def normalize_chunk(chunk):
+    # 表記を揃え、必須項目が欠けている行・日付が読めない行を除く
+    # （プロセスプールで実行するためトップレベルの関数にする）
+    # 正規化したデータフレームと、除いた行の位置（0始まり）を返す
+    normalized = pd.DataFrame(index=chunk.index)
+    for column in TEXT_COLUMNS:
+        values = chunk[column] if column in chunk.columns else pd.Series("", index=chunk.index)
+        normalized[column] = _map_unique(values.fillna(""), clean_text)
+    normalized["点検日"] = _parse_dates(chunk["点検日"].fillna("").str.strip())
+    if "劣化番号" in chunk.columns:
+        normalized["劣化番号"] = _map_unique(chunk["劣化番号"].fillna("").str.strip(), _parse_number)
+    else:
+        normalized["劣化番号"] = None
+
+    valid = normalized["点検日"].notna()
+    for column in ["現場名", "棟名", "場所", "劣化名"]:
+        valid &= normalized[column] != ""
+    return normalized.loc[valid, COLUMNS], list(chunk.index[~valid])
+
+
+def assign_numbers(df, storage, keep_numbers=False, allocator=None):
+    # 現場名・棟名ごとに劣化番号を払い出す
+    # keep_numbers の場合は入力の番号を使い、番号の無い行だけに払い出す（以降の払い出しは入力の番号より後から）
+    allocator = allocator or get_allocator()
+    numbers = df["劣化番号"].to_numpy(dtype=object)
+    exists = storage.exists()
+
+    def seed(site_name, building_name):
+        return storage.max_number(site_name, building_name) if exists else None
+
+    groups = {}
+    for key, positions in df.groupby(["現場名", "棟名"], sort=False).indices.items():
+        if keep_numbers:
+            given = [numbers[position] for position in positions if numbers[position] is not None]
+            if given:
+                allocator.advance(key[0], key[1], max(given), seed=lambda: seed(*key))
+            positions = [position for position in positions if numbers[position] is None]
+            if not positions:
+                continue
+        groups[key] = positions
+
+    # チャンク内のすべての (現場名, 棟名) の番号を1回で払い出す
+    starts = allocator.allocate_many({key: len(positions) for key, positions in groups.items()}, seed=seed)
+    for key, positions in groups.items():
+        numbers[positions] = np.arange(starts[key], starts[key] + len(positions))
+    df["劣化番号"] = numbers.astype(np.int64)
+    return df
+
+
+def _normalized_chunks(chunks, workers):
+    # 正規化をプロセスプールで並列に行い、入力の順に返す（先読みは workers * 2 チャンクまで）
+    if workers <= 1:
+        for chunk in chunks:
+            yield normalize_chunk(chunk)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        for chunk in chunks:
+            pending.append(pool.submit(normalize_chunk, chunk))
+            if len(pending) >= workers * 2:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def import_inspections(path, storage, chunk_size=CHUNK_SIZE, encoding='utf-8-sig', sheet=None,
+                       workers=None, keep_numbers=False, dry_run=False, allocator=None):
+    # 点検データを取り込み、(取り込んだ行数, 除いた行の行番号) を返す
+    workers = workers or os.cpu_count() or 1
+    chunks = read_chunks(path, chunk_size, encoding, sheet)
+    first = next(chunks, None)
+    if first is None:
+        return 0, []
+    ignored = validate_columns(list(first.columns), REQUIRED_COLUMNS)
+    if ignored:
+        print(f"取り込まない列: {', '.join(ignored)}")
+
+    def all_chunks():
+        yield first
+        yield from chunks
+
+    imported = 0
+    rejected = []
+    for normalized, invalid in _normalized_chunks(all_chunks(), workers):
+        # 行番号はヘッダーを1行目とした入力ファイルの行番号
+        rejected.extend(position + 2 for position in invalid)
+        if normalized.empty:
+            continue
+        if not dry_run:
+            assign_numbers(normalized, storage, keep_numbers, allocator)
+            storage.append_rows(normalized)
+        imported += len(normalized)
+        print(f"{imported}件を取り込みました")
+    return imported, rejected
+
+
+def import_master(path, master_path=MASTER_PATH, replace=False, encoding='utf-8-sig', sheet=None, converter_name=None):
+    # マスターデータ（場所・劣化名）を取り込む。よみが無い・空の項目はよみを生成する
+    # 既存のマスターデータに無い項目だけを追加し、(追加した場所の数, 追加した劣化名の数) を返す
+    df = pd.concat(list(read_chunks(path, CHUNK_SIZE, encoding, sheet)), ignore_index=True)
+    if "場所" not in df.columns and "劣化名" not in df.columns:
+        raise ValueError("「場所」または「劣化名」の列が必要です")
+
+    existing = pd.DataFrame(columns=MASTER_COLUMNS)
+    output_encoding = 'utf-8'
+    if os.path.exists(master_path) and not replace:
+        existing, output_encoding = read_master_frame(master_path)
+        existing = existing.reindex(columns=MASTER_COLUMNS)
+
+    # 既存のマスターデータの表記とよみを変換辞書に加える
+    converter = get_converter(converter_name)
+    for surface_column, yomi_column in (("場所", "場所よみ"), ("劣化名", "劣化名よみ")):
+        for surface, reading in zip(existing[surface_column], existing[yomi_column]):
+            converter.add(surface, reading)
+
+    new_pairs = {}
+    for surface_column, yomi_column in (("場所", "場所よみ"), ("劣化名", "劣化名よみ")):
+        known = set(existing[surface_column].dropna())
+        pairs = []
+        if surface_column in df.columns:
+            readings = df[yomi_column] if yomi_column in df.columns else pd.Series("", index=df.index)
+            for surface, reading in zip(df[surface_column], readings.fillna("")):
+                surface = clean_text(surface)
+                if not surface or surface in known:
+                    continue
+                known.add(surface)
+                pairs.append((surface, normalize_yomi(reading) if reading.strip() else converter.convert(surface)))
+        new_pairs[surface_column] = pairs
+
+    # 場所と劣化名は独立した一覧のため、件数の多い方に合わせて行を作る
+    locations, deteriorations = new_pairs["場所"], new_pairs["劣化名"]
+    rows = []
+    for i in range(max(len(locations), len(deteriorations))):
+        location = locations[i] if i < len(locations) else (None, None)
+        deterioration = deteriorations[i] if i < len(deteriorations) else (None, None)
+        rows.append([location[0], location[1], deterioration[0], deterioration[1]])
+    merged = pd.concat([existing, pd.DataFrame(rows, columns=MASTER_COLUMNS)], ignore_index=True)
+
+    # 一時ファイルに書き出してから置き換える（元のエンコーディングで書けない文字があれば UTF-8 にする）
+    tmp_path = master_path + ".tmp"
+    try:
+        merged.to_csv(tmp_path, index=False, encoding=output_encoding)
+    except UnicodeEncodeError:
+        merged.to_csv(tmp_path, index=False, encoding='utf-8')
+    os.replace(tmp_path, master_path)
+    return len(locations), len(deteriorations)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="点検データ・マスターデータをCSV/Excelから一括で取り込みます")
+    subparsers = parser.add_subparsers(dest="target", required=True)
+
+    inspections = subparsers.add_parser("inspections", help="点検データを取り込む")
+    inspections.add_argument("path", help="取り込むCSV/Excelファイル")
+    inspections.add_argument("--encoding", default="utf-8-sig", help="CSVのエンコーディング（Excel から保存したCSVは cp932）")
+    inspections.add_argument("--sheet", help="Excel のシート名（省略時は最初のシート）")
+    inspections.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="一度に処理する行数")
+    inspections.add_argument("--workers", type=int, help="正規化に使うプロセス数（省略時はCPU数）")
+    inspections.add_argument("--keep-numbers", action="store_true", help="入力の劣化番号をそのまま使う（空の行だけ払い出す）")
+    inspections.add_argument("--storage", choices=["csv", "sqlite"], help="取り込み先（省略時は環境変数 INSPECTION_STORAGE）")
+    inspections.add_argument("--dry-run", action="store_true", help="列と値の確認だけを行い、取り込まない")
+
+    master = subparsers.add_parser("master", help="マスターデータ（場所・劣化名）を取り込む")
+    master.add_argument("path", help="取り込むCSV/Excelファイル")
+    master.add_argument("--output", default=MASTER_PATH, help="マスターデータのファイル")
+    master.add_argument("--encoding", default="utf-8-sig", help="CSVのエンコーディング")
+    master.add_argument("--sheet", help="Excel のシート名（省略時は最初のシート）")
+    master.add_argument("--replace", action="store_true", help="既存のマスターデータを置き換える")
+    master.add_argument("--yomi-converter", choices=["dictionary", "kakasi"], help="よみの生成方法（省略時は pykakasi があれば kakasi）")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.path):
+        print(f"{args.path} が見つかりません", file=sys.stderr)
+        sys.exit(1)
+    os.makedirs('data', exist_ok=True)
+
+    started = time.perf_counter()
+    try:
+        if args.target == "inspections":
+            imported, rejected = import_inspections(
+                args.path, get_storage(args.storage), args.chunk_size, args.encoding, args.sheet,
+                args.workers, args.keep_numbers, args.dry_run
+            )
+            elapsed = time.perf_counter() - started
+            print(f"{'確認' if args.dry_run else '取り込み'}が完了しました（{imported}件、{elapsed:.1f}秒）")
+            if rejected:
+                preview = ", ".join(str(line) for line in rejected[:20])
+                print(f"必須項目が空・点検日が読めないため除いた行: {len(rejected)}件（{preview}{' ...' if len(rejected) > 20 else ''}）")
+        else:
+            locations, deteriorations = import_master(
+                args.path, args.output, args.replace, args.encoding, args.sheet, args.yomi_converter
+            )
+            print(f"マスターデータに場所 {locations}件、劣化名 {deteriorations}件を追加しました")
+    except (ValueError, ImportError, UnicodeDecodeError) as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
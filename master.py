@@ -0,0 +1,281 @@
+import io
+import mmap
+import os
+import pickle
+import struct
+import threading
+
+import pandas as pd
+
+from suggest import StringTable, SuggestionIndex
+
+MASTER_PATH = "data/master_data.csv"
+
+# build_master.py が作成する変換済みのマスターデータ（CSVと同じ名前で拡張子が .pkl）
+ARTIFACT_SUFFIX = ".pkl"
+
+# 変換済みデータの形式のバージョン（MasterData・SuggestionIndex の保存内容を変えた場合は上げる）
+ARTIFACT_VERSION = 1
+
+# マジック・バージョン・元のCSVの (mtime, サイズ)・本体の長さ・バッファの数
+_ARTIFACT_MAGIC = b"INSPMSTR"
+_ARTIFACT_HEADER = struct.Struct('<8sIqqQQ')
+_BUFFER_HEADER = struct.Struct('<Q')
+
+# 試行するエンコーディング（先頭から順に試す）
+ENCODINGS = ['utf-8', 'shift_jis', 'cp932', 'utf-8-sig']
+
+# マスターデータが無い場合のデフォルトの選択肢
+DEFAULT_LOCATIONS = ["1階廊下", "2階廊下", "屋上", "外壁", "階段", "玄関", "機械室", "駐車場"]
+DEFAULT_DETERIORATIONS = ["ひび割れ", "剥離", "漏水", "腐食", "変形", "欠損", "さび", "変色"]
+
+
+_LIST_FIELDS = ("locations", "deterioration_types", "locations_yomi", "deteriorations_yomi")
+_DICT_FIELDS = ("locations_dict", "deteriorations_dict")
+
+
+class MasterData:
+    # 読み込み済みのマスターデータ（セッション間で共有するため読み取り専用として扱う）
+    # 予測変換用のインデックスは読み込み時に一度だけ作成する
+    def __init__(self, locations, deterioration_types, locations_dict=None, deteriorations_dict=None,
+                 locations_yomi=(), deteriorations_yomi=(), encoding=None, row_count=0):
+        self.encoding = encoding
+        self.row_count = row_count
+        self.locations = list(locations)
+        self.deterioration_types = list(deterioration_types)
+        self.locations_dict = dict(locations_dict or {})
+        self.deteriorations_dict = dict(deteriorations_dict or {})
+        self.locations_yomi = list(locations_yomi)
+        self.deteriorations_yomi = list(deteriorations_yomi)
+        self.location_index = SuggestionIndex(self.locations, self.locations_yomi, self.locations_dict)
+        self.deterioration_index = SuggestionIndex(self.deterioration_types, self.deteriorations_yomi, self.deteriorations_dict)
+
+    @classmethod
+    def from_dataframe(cls, df, encoding=None):
+        return cls(
+            df['場所'].unique().tolist(),
+            df['劣化名'].unique().tolist(),
+            dict(zip(df['場所よみ'], df['場所'])),
+            dict(zip(df['劣化名よみ'], df['劣化名'])),
+            df['場所よみ'].unique().tolist(),
+            df['劣化名よみ'].unique().tolist(),
+            encoding=encoding,
+            row_count=len(df)
+        )
+
+    def __getstate__(self):
+        # 保存用の状態（一覧・辞書は StringTable にまとめる。文字列以外の値（欠損値）は保存しない）
+        state = dict(self.__dict__)
+        packed = state.pop("_packed", {})
+        for name in _LIST_FIELDS:
+            if name in state:
+                packed[name] = StringTable(value for value in state.pop(name) if isinstance(value, str))
+        for name in _DICT_FIELDS:
+            if name in state:
+                pairs = [(key, value) for key, value in state.pop(name).items()
+                         if isinstance(key, str) and isinstance(value, str)]
+                packed[name] = (StringTable(key for key, _ in pairs), StringTable(value for _, value in pairs))
+        state["_packed"] = packed
+        return state
+
+    def __setstate__(self, state):
+        # アプリは索引だけを使うため、一覧・辞書は最初に参照された時にリスト・辞書に戻す
+        self.__dict__.update(state)
+
+    def __getattr__(self, name):
+        packed = self.__dict__.get("_packed")
+        if packed is None or name not in packed:
+            raise AttributeError(name)
+        if name in _DICT_FIELDS:
+            keys, values = packed[name]
+            value = dict(zip(keys, values))
+        else:
+            value = list(packed[name])
+        setattr(self, name, value)
+        return value
+
+    def as_tuple(self):
+        return (
+            self.locations,
+            self.deterioration_types,
+            self.locations_dict,
+            self.deteriorations_dict,
+            self.locations_yomi,
+            self.deteriorations_yomi
+        )
+
+
+# プロセス全体で共有するキャッシュ
+# パスごとに (mtime, サイズ) と解析済みデータを保持する
+_cache = {}
+_detected_encodings = {}
+_stats = {"hits": 0, "misses": 0}
+_default_master = None
+_lock = threading.Lock()
+
+
+def _file_key(path):
+    stat = os.stat(path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _decode(raw, path):
+    # 前回検出したエンコーディングを優先して試す
+    encodings = list(ENCODINGS)
+    previous = _detected_encodings.get(path)
+    if previous in encodings:
+        encodings.remove(previous)
+        encodings.insert(0, previous)
+
+    for encoding in encodings:
+        try:
+            text = raw.decode(encoding)
+        except UnicodeDecodeError:
+            continue
+        # BOM付きUTF-8をutf-8で読んだ場合に先頭に残るBOMを除去
+        return text.lstrip('\ufeff'), encoding
+    raise UnicodeDecodeError("master", raw[:1], 0, 1, "適切なエンコーディングが見つかりませんでした")
+
+
+def read_master_frame(path=MASTER_PATH):
+    # マスターデータのCSVを読み込み、(データフレーム, 検出したエンコーディング) を返す
+    with open(path, 'rb') as f:
+        raw = f.read()
+    text, encoding = _decode(raw, os.path.abspath(path))
+    return pd.read_csv(io.StringIO(text)), encoding
+
+
+def _parse(path):
+    df, encoding = read_master_frame(path)
+    return MasterData.from_dataframe(df, encoding)
+
+
+def artifact_path_for(path=MASTER_PATH):
+    return os.path.splitext(path)[0] + ARTIFACT_SUFFIX
+
+
+def save_artifact(master, source_path, artifact_path=None):
+    # 変換済みのマスターデータを書き出す（元のCSVの (mtime, サイズ) を記録し、CSVが更新されたら使わない）
+    # 形式: ヘッダー、pickle（プロトコル5）の本体、本体が参照するバッファ（8バイト境界に揃える）
+    artifact_path = artifact_path or artifact_path_for(source_path)
+    source_key = _file_key(source_path) if os.path.exists(source_path) else (-1, -1)
+    buffers = []
+    body = pickle.dumps(master, protocol=5, buffer_callback=buffers.append)
+    tmp_path = artifact_path + ".tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(_ARTIFACT_HEADER.pack(_ARTIFACT_MAGIC, ARTIFACT_VERSION, source_key[0], source_key[1], len(body), len(buffers)))
+        f.write(body)
+        for buffer in buffers:
+            raw = buffer.raw()
+            f.write(_BUFFER_HEADER.pack(raw.nbytes))
+            f.write(raw)
+            f.write(b'\0' * (-raw.nbytes % 8))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, artifact_path)
+    return artifact_path
+
+
+def load_artifact(artifact_path, source_key=None):
+    # 変換済みのマスターデータをメモリマップで開いて復元する（バッファはコピーせずにそのまま使う）
+    # 形式のバージョンが違う・元のCSVが作成後に更新されている場合は None を返す
+    try:
+        with open(artifact_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (FileNotFoundError, ValueError):
+        return None
+    view = memoryview(mapped)
+    try:
+        magic, version, mtime_ns, size, body_length, buffer_count = _ARTIFACT_HEADER.unpack_from(view)
+    except struct.error:
+        return None
+    if magic != _ARTIFACT_MAGIC or version != ARTIFACT_VERSION:
+        return None
+    if source_key is not None and (mtime_ns, size) != source_key:
+        return None
+
+    offset = _ARTIFACT_HEADER.size
+    body = view[offset:offset + body_length]
+    offset += body_length
+    buffers = []
+    for _ in range(buffer_count):
+        (length,) = _BUFFER_HEADER.unpack_from(view, offset)
+        offset += _BUFFER_HEADER.size
+        buffers.append(view[offset:offset + length])
+        offset += length + (-length % 8)
+    try:
+        return pickle.loads(body, buffers=buffers)
+    except Exception:
+        return None
+
+
+def _stat_key(path):
+    try:
+        return _file_key(path)
+    except FileNotFoundError:
+        return None
+
+
+def master_file_key(path):
+    # マスターデータ（CSVと変換済みデータ）の更新を判定するキー（どちらも無ければ None）
+    key = (_stat_key(path), _stat_key(artifact_path_for(path)))
+    return None if key == (None, None) else key
+
+
+def load_master(path, source_key=None):
+    # キャッシュを使わずに読み込む（変換済みデータがCSVと一致していれば使い、無ければCSVを解析する）
+    master = load_artifact(artifact_path_for(path), source_key or _stat_key(path))
+    if master is None:
+        master = _parse(path)
+    return master
+
+
+def get_master_data(path=MASTER_PATH):
+    # ファイルが変更されていなければキャッシュを返す
+    # 変換済みデータ（build_master.py で作成）がCSVと一致していればそれを読み込み、無ければCSVを解析する
+    # どちらも存在しない場合は FileNotFoundError を送出する
+    abs_path = os.path.abspath(path)
+    key = master_file_key(abs_path)
+    if key is None:
+        raise FileNotFoundError(abs_path)
+
+    with _lock:
+        cached = _cache.get(abs_path)
+        if cached is not None and cached[0] == key:
+            _stats["hits"] += 1
+            return cached[1]
+        _stats["misses"] += 1
+
+    master = load_master(abs_path, key[0])
+
+    with _lock:
+        _detected_encodings[abs_path] = master.encoding
+        _cache[abs_path] = (key, master)
+    return master
+
+
+def get_default_master_data():
+    # マスターデータファイルが無い場合に使うデフォルトの選択肢
+    global _default_master
+    with _lock:
+        if _default_master is None:
+            _default_master = MasterData(DEFAULT_LOCATIONS, DEFAULT_DETERIORATIONS)
+        return _default_master
+
+
+def get_cache_stats():
+    with _lock:
+        return {
+            "hits": _stats["hits"],
+            "misses": _stats["misses"],
+            "entries": len(_cache),
+            "encodings": dict(_detected_encodings)
+        }
+
+
+def clear_cache():
+    with _lock:
+        _cache.clear()
+        _detected_encodings.clear()
+        _stats["hits"] = 0
+        _stats["misses"] = 0
@@ -0,0 +1,260 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import deque
+
+# アプリの処理時間の計測（マスターデータの読み込み・予測変換・保存・検索・描画など）
+# 環境変数 INSPECTION_METRICS=1 で有効にする。無効の場合、timer() は何もしない共有のオブジェクトを返す
+METRICS_ENV = "INSPECTION_METRICS"
+
+# 計測結果の書き出し先（JSON と Prometheus のテキスト形式）
+METRICS_JSON_PATH = "data/metrics.json"
+METRICS_PROM_PATH = "data/metrics.prom"
+
+# 有効な場合に計測結果を自動で書き出す間隔（秒）
+DUMP_INTERVAL_SECONDS = 30
+
+# 計測項目ごとに保持する直近の計測値の数（パーセンタイルの計算に使う）
+WINDOW_SIZE = 1000
+
+# Prometheus のヒストグラムのバケット（秒）
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 再実行全体の処理時間の計測項目名
+RERUN = "rerun"
+
+
+def _percentile(ordered, fraction):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class Histogram:
+    # 直近の計測値（処理時間・行数）と、起動からの累積（件数・合計・バケットごとの件数）
+    def __init__(self, window=WINDOW_SIZE):
+        self.samples = deque(maxlen=window)
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+        self.rows = 0
+
+    def observe(self, seconds, rows=None):
+        self.samples.append((seconds, rows))
+        self.count += 1
+        self.total += seconds
+        if rows:
+            self.rows += rows
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+
+    def summary(self):
+        durations = sorted(seconds for seconds, _ in self.samples)
+        rows = [value for _, value in self.samples if value is not None]
+        return {
+            "count": self.count,
+            "total_seconds": self.total,
+            "rows_total": self.rows,
+            "window": len(durations),
+            "p50_ms": _ms(_percentile(durations, 0.5)),
+            "p90_ms": _ms(_percentile(durations, 0.9)),
+            "p99_ms": _ms(_percentile(durations, 0.99)),
+            "max_ms": _ms(durations[-1] if durations else None),
+            "last_ms": _ms(self.samples[-1][0] if self.samples else None),
+            "rows_p50": _percentile(sorted(rows), 0.5),
+        }
+
+
+def _ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 3)
+
+
+class _NullTimer:
+    # 計測が無効の場合に使う（何もしない）
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set_rows(self, rows):
+        pass
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('_metrics', '_name', '_rows', '_started')
+
+    def __init__(self, metrics, name, rows):
+        self._metrics = metrics
+        self._name = name
+        self._rows = rows
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._metrics.observe(self._name, time.perf_counter() - self._started, self._rows)
+        return False
+
+    def set_rows(self, rows):
+        # 処理した行数（処理の後で分かる場合に with の中で設定する）
+        self._rows = rows
+
+
+class Metrics:
+    # プロセス全体で共有する計測結果（Streamlit のセッションは別スレッドで実行されるためロックで保護する）
+    # 再実行ごとの内訳はスレッドごとに保持する
+    def __init__(self, enabled=False, window=WINDOW_SIZE):
+        self.enabled = enabled
+        self.window = window
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._last_rerun = {}
+        self._last_dump = time.monotonic()
+        self.started_at = time.time()
+
+    def timer(self, name, rows=None):
+        if not self.enabled:
+            return _NULL_TIMER
+        return _Timer(self, name, rows)
+
+    def observe(self, name, seconds, rows=None):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram(self.window)
+            histogram.observe(seconds, rows)
+        phases = getattr(self._local, "phases", None)
+        if phases is not None:
+            total, rows_total = phases.get(name, (0.0, 0))
+            phases[name] = (total + seconds, rows_total + (rows or 0))
+
+    def start_rerun(self):
+        # 再実行の開始時に呼び出す（st.rerun() などで終了しなかった前回の内訳は破棄する）
+        if not self.enabled:
+            return
+        self._local.phases = {}
+        self._local.started = time.perf_counter()
+
+    def finish_rerun(self):
+        # 再実行の終了時に呼び出し、再実行全体の処理時間と内訳を記録する
+        if not self.enabled or getattr(self._local, "phases", None) is None:
+            return
+        phases = self._local.phases
+        self._local.phases = None
+        self.observe(RERUN, time.perf_counter() - self._local.started)
+        with self._lock:
+            self._last_rerun = phases
+        self.maybe_dump()
+
+    def last_rerun(self):
+        # 直前に完了した再実行の計測項目ごとの (処理時間, 行数)
+        with self._lock:
+            return dict(self._last_rerun)
+
+    def snapshot(self):
+        with self._lock:
+            histograms = {name: histogram.summary() for name, histogram in sorted(self._histograms.items())}
+        return {"enabled": self.enabled, "started_at": self.started_at, "generated_at": time.time(), "metrics": histograms}
+
+    def prometheus_text(self):
+        lines = [
+            "# HELP inspection_phase_seconds Processing time per phase of the inspection app.",
+            "# TYPE inspection_phase_seconds histogram",
+        ]
+        rows_lines = [
+            "# HELP inspection_phase_rows_total Rows processed per phase of the inspection app.",
+            "# TYPE inspection_phase_rows_total counter",
+        ]
+        recent_lines = [
+            "# HELP inspection_phase_recent_seconds Percentiles over the most recent samples per phase.",
+            "# TYPE inspection_phase_recent_seconds gauge",
+        ]
+        with self._lock:
+            items = sorted(self._histograms.items())
+            for name, histogram in items:
+                label = f'phase="{_escape_label(name)}"'
+                for bound, count in zip(BUCKETS, histogram.bucket_counts):
+                    lines.append(f'inspection_phase_seconds_bucket{{{label},le="{bound}"}} {count}')
+                lines.append(f'inspection_phase_seconds_bucket{{{label},le="+Inf"}} {histogram.count}')
+                lines.append(f'inspection_phase_seconds_sum{{{label}}} {histogram.total}')
+                lines.append(f'inspection_phase_seconds_count{{{label}}} {histogram.count}')
+                rows_lines.append(f'inspection_phase_rows_total{{{label}}} {histogram.rows}')
+                durations = sorted(seconds for seconds, _ in histogram.samples)
+                for quantile in (0.5, 0.9, 0.99):
+                    value = _percentile(durations, quantile)
+                    if value is not None:
+                        recent_lines.append(f'inspection_phase_recent_seconds{{{label},quantile="{quantile}"}} {value}')
+        return "\n".join(lines + rows_lines + recent_lines) + "\n"
+
+    def write_dump(self, json_path=METRICS_JSON_PATH, prom_path=METRICS_PROM_PATH):
+        # 一時ファイルに書き出してから置き換える（監視ツールが書き込み途中のファイルを読まないように）
+        for path, text in (
+            (json_path, json.dumps(self.snapshot(), ensure_ascii=False, indent=2)),
+            (prom_path, self.prometheus_text()),
+        ):
+            if not path:
+                continue
+            directory = os.path.dirname(path) or "."
+            os.makedirs(directory, exist_ok=True)
+            # 一時ファイルは書き出しごとに別の名前にする（定期の書き出しと画面からの書き出しが同時に行われても混ざらない）
+            fd, tmp_path = tempfile.mkstemp(suffix=".tmp", prefix=os.path.basename(path) + ".", dir=directory)
+            try:
+                with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                    f.write(text)
+                os.replace(tmp_path, path)
+            except BaseException:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+                raise
+        with self._lock:
+            self._last_dump = time.monotonic()
+
+    def maybe_dump(self, interval=DUMP_INTERVAL_SECONDS):
+        with self._lock:
+            due = time.monotonic() - self._last_dump >= interval
+            if due:
+                self._last_dump = time.monotonic()
+        if due:
+            try:
+                self.write_dump()
+            except OSError:
+                pass
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self._last_rerun = {}
+            self.started_at = time.time()
+
+
+def _escape_label(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+_metrics = Metrics(os.environ.get(METRICS_ENV, "").lower() in ("1", "true", "yes", "on"))
+
+
+def get_metrics():
+    return _metrics
+
+
+def enabled():
+    return _metrics.enabled
+
+
+def timer(name, rows=None):
+    # with timer("storage.append", rows=len(rows)): ... のように使う
+    return _metrics.timer(name, rows)
@@ -0,0 +1,51 @@
+# data/inspection_data.csv の内容を SQLite（data/inspection_data.db）へ移行する
+# 使い方: python migrate_to_sqlite.py [--csv data/inspection_data.csv] [--db data/inspection_data.db] [--force]
+# 移行後は環境変数 INSPECTION_STORAGE=sqlite を設定してアプリを起動する
+import argparse
+import os
+import sys
+
+import pandas as pd
+
+from sequences import advance_numbers
+from storage import CSV_ENCODING, INSPECTION_CSV_PATH, INSPECTION_DB_PATH, SqliteStorage
+
+CHUNK_SIZE = 50000
+
+
+def migrate(csv_path, db_path, force=False):
+    storage = SqliteStorage(db_path)
+    if storage.exists():
+        if not force:
+            raise RuntimeError(f"{db_path} には既にデータがあります。上書きする場合は --force を指定してください。")
+        storage.replace_all(pd.DataFrame())
+
+    total = 0
+    for chunk in pd.read_csv(csv_path, encoding=CSV_ENCODING, chunksize=CHUNK_SIZE):
+        total += storage.append_rows(chunk.to_dict('records'))
+        # 移行した番号より後から払い出すようにする
+        advance_numbers(storage, chunk)
+        print(f"{total}件を移行しました")
+    return total
+
+
+def main():
+    parser = argparse.ArgumentParser(description="点検データをCSVからSQLiteへ移行します")
+    parser.add_argument("--csv", default=INSPECTION_CSV_PATH, help="移行元のCSVファイル")
+    parser.add_argument("--db", default=INSPECTION_DB_PATH, help="移行先のSQLiteファイル")
+    parser.add_argument("--force", action="store_true", help="移行先の既存データを削除してから移行する")
+    args = parser.parse_args()
+
+    if not os.path.exists(args.csv):
+        print(f"{args.csv} が見つかりません", file=sys.stderr)
+        sys.exit(1)
+    try:
+        total = migrate(args.csv, args.db, args.force)
+    except RuntimeError as e:
+        print(str(e), file=sys.stderr)
+        sys.exit(1)
+    print(f"移行が完了しました（{total}件）")
+
+
+if __name__ == "__main__":
+    main()
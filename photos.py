@@ -0,0 +1,235 @@
+import hashlib
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from storage import closing_connection
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # サムネイルを作成しない（一覧には枚数だけを表示する）
+    Image = None
+    ImageOps = None
+
+# 劣化項目の写真
+# 元の画像は内容のハッシュ（SHA-256）をファイル名にして保存する（同じ写真を何度アップロードしても1つだけ）
+# サムネイルはバックグラウンドのスレッドで作成し、一覧には作成済みのサムネイルだけを表示する
+PHOTO_DIR = "data/photos"
+PHOTO_DB_NAME = "photos.db"
+
+# アップロードできる画像の種類
+PHOTO_TYPES = ["jpg", "jpeg", "png", "webp"]
+
+# サムネイルの最大サイズ（ピクセル）と JPEG の画質
+THUMBNAIL_SIZE = (240, 240)
+THUMBNAIL_QUALITY = 80
+
+# サムネイルを作成するスレッドの数
+THUMBNAIL_WORKERS = 2
+
+# 作成済みのサムネイルのパスをメモリに覚えておく数（一覧の表示のたびにファイルの有無を調べないように）
+THUMBNAIL_CACHE_SIZE = 4096
+
+
+def photo_hash(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def _extension(name):
+    ext = os.path.splitext(name or "")[1].lower()
+    return ".jpg" if ext == ".jpeg" else ext or ".jpg"
+
+
+def _write_atomic(path, data):
+    # 一時ファイルに書き出してから置き換える（書き込み途中のファイルを読まないように）
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+
+class PhotoStore:
+    # 写真の保存先（data/photos）
+    # originals/ab/<ハッシュ>.jpg: 元の画像、thumbnails/ab/<ハッシュ>.jpg: サムネイル
+    # photos.db: 写真の一覧（ハッシュ・元のファイル名・サイズ）と、(現場名, 棟名, 劣化番号) ごとの写真
+    def __init__(self, directory=PHOTO_DIR, workers=THUMBNAIL_WORKERS):
+        self.directory = directory
+        self.db_path = os.path.join(directory, PHOTO_DB_NAME)
+        os.makedirs(directory, exist_ok=True)
+        with closing_connection(self.db_path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS photos ("
+                "hash TEXT PRIMARY KEY, ext TEXT NOT NULL, size INTEGER NOT NULL, name TEXT, created_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS attachments ("
+                "site_name TEXT NOT NULL, building_name TEXT NOT NULL, number INTEGER NOT NULL, "
+                "position INTEGER NOT NULL, hash TEXT NOT NULL, "
+                "PRIMARY KEY (site_name, building_name, number, position))"
+            )
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="thumbnail")
+        self._pending = set()
+        self._failed = set()
+        self._ready = OrderedDict()
+        # 写真ごとの元の画像の拡張子（サムネイルが無い写真の作成を依頼する際に photos.db を読まないように）
+        self._extensions = {}
+        self._lock = threading.Lock()
+
+    def original_path(self, digest, ext):
+        return os.path.join(self.directory, "originals", digest[:2], digest + ext)
+
+    def thumbnail_path(self, digest):
+        return os.path.join(self.directory, "thumbnails", digest[:2], digest + ".jpg")
+
+    def store(self, data, name=None):
+        # 写真を保存してハッシュを返す（保存済みの写真は書き込まない）。サムネイルの作成は待たない
+        digest = photo_hash(data)
+        ext = _extension(name)
+        with closing_connection(self.db_path) as conn:
+            row = conn.execute("SELECT ext FROM photos WHERE hash = ?", (digest,)).fetchone()
+        if row is not None and os.path.exists(self.original_path(digest, row[0])):
+            ext = row[0]
+        else:
+            _write_atomic(self.original_path(digest, ext), data)
+            with closing_connection(self.db_path) as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO photos (hash, ext, size, name, created_at) VALUES (?, ?, ?, ?, ?)",
+                    (digest, ext, len(data), name, time.time())
+                )
+        with self._lock:
+            self._extensions[digest] = ext
+        self._schedule(digest, ext)
+        return digest
+
+    def _schedule(self, digest, ext):
+        if Image is None or os.path.exists(self.thumbnail_path(digest)):
+            return
+        with self._lock:
+            if digest in self._pending or digest in self._failed:
+                return
+            self._pending.add(digest)
+        self._executor.submit(self._make_thumbnail, digest, ext)
+
+    def _make_thumbnail(self, digest, ext):
+        try:
+            with Image.open(self.original_path(digest, ext)) as image:
+                # スマートフォンの写真の向き（EXIF）を反映してから縮小する
+                image = ImageOps.exif_transpose(image)
+                image.thumbnail(THUMBNAIL_SIZE)
+                if image.mode != "RGB":
+                    image = image.convert("RGB")
+                path = self.thumbnail_path(digest)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(suffix=".tmp", dir=os.path.dirname(path))
+                os.close(fd)
+                try:
+                    image.save(tmp_path, "JPEG", quality=THUMBNAIL_QUALITY)
+                    os.replace(tmp_path, path)
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+        except Exception:
+            # 画像として読めないファイルなどは作成し直さない
+            with self._lock:
+                self._failed.add(digest)
+        finally:
+            with self._lock:
+                self._pending.discard(digest)
+
+    def _extension_of(self, digest):
+        # 元の画像の拡張子（記録が無い場合は None）。一度調べた写真は photos.db を読まない
+        with self._lock:
+            if digest in self._extensions:
+                return self._extensions[digest]
+        with closing_connection(self.db_path) as conn:
+            row = conn.execute("SELECT ext FROM photos WHERE hash = ?", (digest,)).fetchone()
+        with self._lock:
+            self._extensions[digest] = row[0] if row is not None else None
+        return row[0] if row is not None else None
+
+    def thumbnail_file(self, digest):
+        # 作成済みのサムネイルのパス。作成中・作成できない場合は None（作成されていなければ作成を依頼する）
+        # 画像は読まない（表示は st.image にパスを渡し、Streamlit のメディアのURLからブラウザが読み込む）
+        with self._lock:
+            path = self._ready.get(digest)
+            if path is not None:
+                self._ready.move_to_end(digest)
+                return path
+            # 作成中・作成できない写真はファイルも photos.db も調べない
+            if digest in self._pending or digest in self._failed:
+                return None
+        path = self.thumbnail_path(digest)
+        if not os.path.exists(path):
+            ext = self._extension_of(digest)
+            if ext is not None:
+                self._schedule(digest, ext)
+            return None
+        with self._lock:
+            self._ready[digest] = path
+            while len(self._ready) > THUMBNAIL_CACHE_SIZE:
+                self._ready.popitem(last=False)
+        return path
+
+    def pending(self):
+        # 作成中のサムネイルの数
+        with self._lock:
+            return len(self._pending)
+
+    def wait(self, timeout=None):
+        # 作成中のサムネイルがなくなるまで待つ（取り込みの処理・確認用）
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self.pending():
+            if deadline is not None and time.monotonic() > deadline:
+                return False
+            time.sleep(0.05)
+        return True
+
+    def attach(self, site_name, building_name, number, digests):
+        # (現場名, 棟名, 劣化番号) の写真を digests に置き換える
+        with closing_connection(self.db_path) as conn:
+            conn.execute(
+                "DELETE FROM attachments WHERE site_name = ? AND building_name = ? AND number = ?",
+                (site_name, building_name, int(number))
+            )
+            conn.executemany(
+                "INSERT INTO attachments (site_name, building_name, number, position, hash) VALUES (?, ?, ?, ?, ?)",
+                [(site_name, building_name, int(number), position, digest) for position, digest in enumerate(digests)]
+            )
+
+    def attached(self, site_name, building_name):
+        # 現場名・棟名の {劣化番号: [ハッシュ, ...]}
+        # 元の画像の拡張子も同じ問い合わせで読み、一覧の表示時に写真ごとに photos.db を読まないようにする
+        with closing_connection(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT a.number, a.hash, p.ext FROM attachments a LEFT JOIN photos p ON p.hash = a.hash "
+                "WHERE a.site_name = ? AND a.building_name = ? ORDER BY a.number, a.position",
+                (site_name, building_name)
+            ).fetchall()
+        photos = {}
+        with self._lock:
+            for number, digest, ext in rows:
+                photos.setdefault(number, []).append(digest)
+                self._extensions[digest] = ext
+        return photos
+
+
+_stores = {}
+_lock = threading.Lock()
+
+
+def get_photo_store(directory=PHOTO_DIR):
+    abs_path = os.path.abspath(directory)
+    with _lock:
+        if abs_path not in _stores:
+            _stores[abs_path] = PhotoStore(directory)
+        return _stores[abs_path]
@@ -0,0 +1,179 @@
+import re
+import threading
+
+import jaconv
+import numpy as np
+import pandas as pd
+
+from datacache import GrowableArray, get_dataset_cache, series_bytes
+from storage import DATE_FORMAT
+
+# 「列名:値」形式の条件
+_FIELD_PATTERN = re.compile(r'^([^:]+):(.*)$')
+
+# 値 → コードの辞書は追記のたびに共有したまま加えるため、更新中は他の更新を待たせる
+_lookup_lock = threading.Lock()
+
+
+def normalize_text(text):
+    # 全角・半角とひらがな・カタカナの違いを無視して比較するための正規化
+    return jaconv.kata2hira(jaconv.normalize(text)).lower()
+
+
+def _format_value(value):
+    # 整数値の小数（欠損値を含む数値列）は整数として表示される形に揃える
+    # 日付型の点検日は保存先と同じ YYYY-MM-DD の形に揃える
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if isinstance(value, pd.Timestamp) and value == value.normalize():
+        return value.strftime(DATE_FORMAT)
+    return str(value)
+
+
+def _normalize_values(values):
+    return np.array([normalize_text(_format_value(value)) for value in values], dtype=object)
+
+
+class SearchIndex:
+    # 列ごとに値を factorize して、正規化済みの一意な値と行ごとのコードを保持する
+    # 検索は一意な値に対して部分一致を判定し、コードを使って行のマスクに展開する
+    # 行が追記された場合は extended で追記された行と新しい値だけを加える（コードと一意な値は GrowableArray に保持する）
+    def __init__(self, df, version=None):
+        self.version = version
+        self.df = df
+        self.columns = list(df.columns)
+        self._codes = {}
+        self._uniques = {}
+        self._normalized_columns = {normalize_text(column): column for column in self.columns}
+        # 追記に使う列ごとの状態（カテゴリ型の列はカテゴリ、それ以外は値 → コードの辞書と型）
+        self._categories = {}
+        self._lookups = {}
+        self._dtypes = {}
+        self._code_arrays = {}
+        self._unique_arrays = {}
+        for column in self.columns:
+            self._index_column(column)
+
+    def _index_column(self, column):
+        series = self.df[column]
+        for state in (self._categories, self._lookups, self._dtypes, self._code_arrays):
+            state.pop(column, None)
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            # カテゴリ型の列はカテゴリのコードをそのまま使う
+            codes, uniques = series.cat.codes.to_numpy(), series.cat.categories
+            self._categories[column] = uniques
+        else:
+            codes, uniques = pd.factorize(series)
+            self._lookups[column] = dict(zip(uniques, range(len(uniques))))
+            self._dtypes[column] = series.dtype
+            self._code_arrays[column] = GrowableArray(codes)
+        self._unique_arrays[column] = GrowableArray(_normalize_values(uniques))
+        self._set_column(column, codes, self._unique_arrays[column].view())
+
+    def _set_column(self, column, codes, uniques):
+        self._codes[column] = codes
+        self._uniques[column] = pd.Series(uniques, dtype=object, copy=False)
+
+    def extended(self, df, start, version=None):
+        # start 行目以降を追記した df の索引（この索引は変わらない）
+        if list(df.columns) != self.columns:
+            return SearchIndex(df, version)
+        index = SearchIndex.__new__(SearchIndex)
+        index.version = version
+        index.df = df
+        index.columns = self.columns
+        index._normalized_columns = self._normalized_columns
+        for name in ('_codes', '_uniques', '_categories', '_lookups', '_dtypes', '_code_arrays', '_unique_arrays'):
+            setattr(index, name, dict(getattr(self, name)))
+        for column in self.columns:
+            index._extend_column(column, start)
+        return index
+
+    def _extend_column(self, column, start):
+        series = self.df[column]
+        count = len(self._uniques[column])
+        if column in self._categories and isinstance(series.dtype, pd.CategoricalDtype):
+            # 既存のカテゴリの後にカテゴリが加わっただけなら、新しいカテゴリだけを正規化する
+            categories, known = series.cat.categories, self._categories[column]
+            if categories is not known and not (len(categories) >= count and categories[:count].equals(known)):
+                self._index_column(column)
+                return
+            array, uniques = self._unique_arrays[column].append(_normalize_values(categories[count:]), count)
+            self._categories[column] = categories
+            self._unique_arrays[column] = array
+            self._set_column(column, series.cat.codes.to_numpy(), uniques)
+        elif column in self._lookups and series.dtype == self._dtypes[column]:
+            # 追記された行を factorize し、既存の値のコードに対応付ける（新しい値には続きのコードを振る）
+            codes, values = pd.factorize(series.iloc[start:])
+            mapping = np.empty(len(values) + 1, dtype=np.intp)
+            mapping[-1] = -1
+            extra = []
+            with _lookup_lock:
+                lookup = self._lookups[column]
+                if len(lookup) != count:
+                    # 同じ索引から別の追記で既に値が加えられている
+                    lookup = {value: code for value, code in lookup.items() if code < count}
+                    self._lookups[column] = lookup
+                for position, value in enumerate(values):
+                    code = lookup.get(value)
+                    if code is None:
+                        code = lookup[value] = len(lookup)
+                        extra.append(value)
+                    mapping[position] = code
+            code_array, codes = self._code_arrays[column].append(mapping[codes], start)
+            unique_array, uniques = self._unique_arrays[column].append(_normalize_values(extra), count)
+            self._code_arrays[column] = code_array
+            self._unique_arrays[column] = unique_array
+            self._set_column(column, codes, uniques)
+        else:
+            self._index_column(column)
+
+    def memory_bytes(self):
+        # 行ごとのコードと一意な値のメモリ使用量（参照している全行は含まない）
+        return sum(codes.nbytes for codes in self._codes.values()) + \
+            sum(series_bytes(uniques) for uniques in self._uniques.values())
+
+    def _column_mask(self, column, value):
+        # 一意な値ごとの一致判定（末尾の False は欠損値のコード -1 用）
+        matches = self._uniques[column].str.contains(value, regex=False).to_numpy(dtype=bool)
+        return np.append(matches, False)[self._codes[column]]
+
+    def parse(self, query):
+        # 空白区切りの条件に分解する（「列名:値」は列を限定、それ以外は全列が対象）
+        conditions = []
+        for token in normalize_text(query).split():
+            column = None
+            match = _FIELD_PATTERN.match(token)
+            if match and match.group(1) in self._normalized_columns:
+                column = self._normalized_columns[match.group(1)]
+                token = match.group(2)
+            if token:
+                conditions.append((column, token))
+        return conditions
+
+    def mask(self, query):
+        # すべての条件に一致する行を True とするマスク
+        mask = np.ones(len(self.df), dtype=bool)
+        for column, value in self.parse(query):
+            if column is not None:
+                mask &= self._column_mask(column, value)
+            else:
+                any_column = np.zeros(len(self.df), dtype=bool)
+                for name in self.columns:
+                    any_column |= self._column_mask(name, value)
+                mask &= any_column
+        return mask
+
+    def search(self, query):
+        return self.df[self.mask(query)]
+
+
+def get_search_index(storage):
+    # 保存先の全行と同じく、プロセス全体で共有するキャッシュ（datacache.py）に保持する
+    dataset = get_dataset_cache().get(storage)
+    return dataset.view("search", lambda df: SearchIndex(df, dataset.version),
+                        lambda index, df, start: index.extended(df, start, dataset.version))
+
+
+def search_rows(storage, query):
+    return get_search_index(storage).search(query)
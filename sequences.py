@@ -0,0 +1,152 @@
+import os
+import threading
+
+import pandas as pd
+
+from storage import closing_connection
+
+SEQUENCES_DB_PATH = "data/sequences.db"
+
+
+class SequenceAllocator:
+    # (現場名, 棟名) ごとの劣化番号の払い出し
+    # SQLite の書き込みロック（BEGIN IMMEDIATE）で複数のセッション・プロセス間でも同じ番号を渡さない
+    def __init__(self, db_path=SEQUENCES_DB_PATH):
+        self.path = db_path
+        with closing_connection(self.path) as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sequences ("
+                "site_name TEXT NOT NULL, building_name TEXT NOT NULL, next_number INTEGER NOT NULL, "
+                "PRIMARY KEY (site_name, building_name))"
+            )
+
+    def peek(self, site_name, building_name):
+        # 次に払い出す番号（まだ払い出したことが無い場合は None）
+        with closing_connection(self.path) as conn:
+            row = conn.execute(
+                "SELECT next_number FROM sequences WHERE site_name = ? AND building_name = ?",
+                (site_name, building_name)
+            ).fetchone()
+        return None if row is None else row[0]
+
+    def allocate_many(self, counts, seed=None):
+        # {(現場名, 棟名): 個数} の番号を1つのトランザクションで払い出し、{(現場名, 棟名): 先頭の番号} を返す
+        # 初めて払い出す (現場名, 棟名) は seed(現場名, 棟名) の次から始める
+        starts = {}
+        with closing_connection(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            for (site_name, building_name), count in counts.items():
+                row = conn.execute(
+                    "SELECT next_number FROM sequences WHERE site_name = ? AND building_name = ?",
+                    (site_name, building_name)
+                ).fetchone()
+                if row is None:
+                    current_max = seed(site_name, building_name) if seed is not None else None
+                    start = 1 if current_max is None else int(current_max) + 1
+                else:
+                    start = row[0]
+                conn.execute(
+                    "INSERT INTO sequences (site_name, building_name, next_number) VALUES (?, ?, ?) "
+                    "ON CONFLICT (site_name, building_name) DO UPDATE SET next_number = excluded.next_number",
+                    (site_name, building_name, start + count)
+                )
+                starts[(site_name, building_name)] = start
+        return starts
+
+    def allocate(self, site_name, building_name, count=1, seed=None):
+        # count 個の連続した番号を払い出し、先頭の番号を返す
+        # 初めて払い出す (現場名, 棟名) は seed()（保存済みの最大番号、無ければ None）の次から始める
+        if count < 1:
+            raise ValueError("count は1以上を指定してください")
+        with closing_connection(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT next_number FROM sequences WHERE site_name = ? AND building_name = ?",
+                (site_name, building_name)
+            ).fetchone()
+            if row is None:
+                current_max = seed() if seed is not None else None
+                start = 1 if current_max is None else int(current_max) + 1
+                conn.execute(
+                    "INSERT INTO sequences (site_name, building_name, next_number) VALUES (?, ?, ?)",
+                    (site_name, building_name, start + count)
+                )
+            else:
+                start = row[0]
+                conn.execute(
+                    "UPDATE sequences SET next_number = ? WHERE site_name = ? AND building_name = ?",
+                    (start + count, site_name, building_name)
+                )
+        return start
+
+    def advance(self, site_name, building_name, number, seed=None):
+        # 取り込んだデータなどで使われた番号より後から払い出すようにする
+        # 初めての (現場名, 棟名) は seed()（保存済みの最大番号）より後からにもする
+        with closing_connection(self.path) as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT next_number FROM sequences WHERE site_name = ? AND building_name = ?",
+                (site_name, building_name)
+            ).fetchone()
+            if row is None:
+                current_max = seed() if seed is not None else None
+                next_number = max(int(number), 0 if current_max is None else int(current_max)) + 1
+            else:
+                next_number = max(row[0], int(number) + 1)
+            conn.execute(
+                "INSERT INTO sequences (site_name, building_name, next_number) VALUES (?, ?, ?) "
+                "ON CONFLICT (site_name, building_name) DO UPDATE SET next_number = excluded.next_number",
+                (site_name, building_name, next_number)
+            )
+
+
+_allocators = {}
+_lock = threading.Lock()
+
+
+def get_allocator(db_path=SEQUENCES_DB_PATH):
+    abs_path = os.path.abspath(db_path)
+    with _lock:
+        if abs_path not in _allocators:
+            _allocators[abs_path] = SequenceAllocator(db_path)
+        return _allocators[abs_path]
+
+
+def allocate_numbers(storage, site_name, building_name, count, allocator=None):
+    # 保存先の (現場名, 棟名) の最大番号を初期値として count 個の番号を払い出す
+    allocator = allocator or get_allocator()
+    start = allocator.allocate(
+        site_name, building_name, count,
+        seed=lambda: storage.max_number(site_name, building_name) if storage.exists() else None
+    )
+    return list(range(start, start + count))
+
+
+def allocate_row_numbers(storage, rows, allocator=None):
+    # 劣化番号の無い行（表への追加など）に (現場名, 棟名) ごとの番号を払い出して設定する
+    groups = {}
+    for row in rows:
+        number = row.get("劣化番号")
+        if (number.strip() == "") if isinstance(number, str) else pd.isna(number):
+            groups.setdefault((row.get("現場名") or "", row.get("棟名") or ""), []).append(row)
+    for (site_name, building_name), group in groups.items():
+        for row, number in zip(group, allocate_numbers(storage, site_name, building_name, len(group), allocator)):
+            row["劣化番号"] = number
+    return rows
+
+
+def advance_numbers(storage, rows, allocator=None):
+    # 保存した行（表の編集・移行など、払い出しを経ずに書き込んだ行）の番号より後から払い出すよう、
+    # (現場名, 棟名) ごとに番号の最大値まで進める。rows は辞書のリストかデータフレーム
+    frame = rows if isinstance(rows, pd.DataFrame) else pd.DataFrame(list(rows))
+    if frame.empty or not {"現場名", "棟名", "劣化番号"} <= set(frame.columns):
+        return
+    allocator = allocator or get_allocator()
+    numbers = pd.to_numeric(frame["劣化番号"], errors='coerce')
+    maxima = numbers.groupby([frame["現場名"].fillna("").astype(str), frame["棟名"].fillna("").astype(str)]).max().dropna()
+    for (site_name, building_name), number in maxima.items():
+        allocator.advance(
+            site_name, building_name, int(number),
+            seed=lambda: storage.max_number(site_name, building_name) if storage.exists() else None
+        )
@@ -0,0 +1,226 @@
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict
+
+import numpy as np
+import pandas as pd
+
+from datacache import get_dataset_cache
+from master import MasterData, load_master, master_file_key
+from storage import extend_site_groups, site_groups
+from suggest import LayeredIndex
+from yomi import get_converter
+
+# 現場ごとのマスターデータ（共通のマスターデータと同じ列のCSV。ファイル名は「現場名.csv」）
+SITE_MASTER_DIR = "data/site_masters"
+
+# プロセス全体で保持する現場ごとの索引の数（超えた場合は最も長く使われていない現場から破棄する）
+SITE_CACHE_SIZE = 64
+
+# 過去の点検から学習した項目を作り直す間隔（秒）
+# このアプリで保存した行は保存時に加え（learn_rows）、他の保存による変更はこの間隔が経つまでは反映しない
+LEARNED_REFRESH_SECONDS = 60
+
+_FILENAME_PATTERN = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+# (パス) → (ファイルのキー, マスターデータ) と (保存先, 現場名) → 学習した項目（LearnedItems）
+_site_cache = OrderedDict()
+_learned_cache = OrderedDict()
+_lock = threading.Lock()
+_converter = None
+
+
+def site_master_path(site_name, directory=SITE_MASTER_DIR):
+    # ファイル名に使えない文字は「_」に置き換える
+    return os.path.join(directory, _FILENAME_PATTERN.sub("_", site_name.strip()) + ".csv")
+
+
+def _remember(cache, key, value):
+    # _lock を取得した状態で呼び出す
+    cache[key] = value
+    cache.move_to_end(key)
+    while len(cache) > SITE_CACHE_SIZE:
+        cache.popitem(last=False)
+
+
+def get_site_master(site_name, directory=SITE_MASTER_DIR):
+    # 現場ごとのマスターデータ（ファイルが無い場合は None）
+    # build_master.py --master data/site_masters/現場名.csv で変換済みデータを作成しておくこともできる
+    if not site_name:
+        return None
+    path = os.path.abspath(site_master_path(site_name, directory))
+    key = master_file_key(path)
+    if key is None:
+        return None
+
+    with _lock:
+        cached = _site_cache.get(path)
+        if cached is not None and cached[0] == key:
+            _site_cache.move_to_end(path)
+            return cached[1]
+
+    master = load_master(path, key[0])
+    with _lock:
+        _remember(_site_cache, path, (key, master))
+    return master
+
+
+def _reading(surface):
+    global _converter
+    if _converter is None:
+        _converter = get_converter()
+    return _converter.convert(surface)
+
+
+def _site_values(storage, site_name):
+    # 現場の保存済みの点検データに出てくる (場所の出現回数, 劣化名の出現回数)
+    # プロセス全体で共有する全行と (現場名, 棟名) → 行位置 の索引から数える（CSV を読み直さない）
+    dataset = get_dataset_cache().get(storage)
+    groups = dataset.view("site_groups", site_groups, extend_site_groups)
+    parts = [positions for (site, _), positions in groups.items() if site == site_name]
+    rows = dataset.frame.iloc[np.concatenate(parts)] if parts else dataset.frame.iloc[:0]
+    counts = []
+    for column in ("場所", "劣化名"):
+        values = rows[column].value_counts(sort=True) if column in rows.columns else pd.Series(dtype=int)
+        counts.append(Counter({name: int(count) for name, count in values.items() if isinstance(name, str) and name and count > 0}))
+    return counts[0], counts[1]
+
+
+def _learned_master(locations, deteriorations, readings):
+    # 出現回数の多い順に並べたマスターデータ。よみは yomi.py で生成し、readings に覚えて同じ語を変換し直さない
+    location_names = [name for name, _ in locations.most_common()]
+    deterioration_names = [name for name, _ in deteriorations.most_common()]
+    for name in location_names + deterioration_names:
+        if name not in readings:
+            readings[name] = _reading(name)
+    location_yomi = [readings[name] for name in location_names]
+    deterioration_yomi = [readings[name] for name in deterioration_names]
+    return MasterData(
+        location_names,
+        deterioration_names,
+        dict(zip(location_yomi, location_names)),
+        dict(zip(deterioration_yomi, deterioration_names)),
+        location_yomi,
+        deterioration_yomi,
+        row_count=sum(locations.values())
+    )
+
+
+class LearnedItems:
+    # 現場の過去の点検から学習した項目
+    # master: 保存先の全行から作成したもの、recent: その後このアプリで保存した行で初めて使われた場所・劣化名
+    # 保存のたびに master を作り直すと語の数に比例して時間がかかるため、新しい語だけを小さな recent に加える
+    def __init__(self, version, created, locations, deteriorations, readings):
+        self.version = version
+        self.created = created
+        self.locations = locations
+        self.deteriorations = deteriorations
+        self.readings = readings
+        self.master = _learned_master(locations, deteriorations, readings)
+        self.recent_locations = Counter()
+        self.recent_deteriorations = Counter()
+        self.recent = None
+
+    def masters(self):
+        # 最近の保存で使われた語を先に探す
+        return [master for master in (self.recent, self.master) if master is not None]
+
+    def add(self, rows):
+        # 保存した行の場所・劣化名を数え、master に無い語があれば recent を作り直す
+        new_words = False
+        for row in rows:
+            for column, counts, recent in (("場所", self.locations, self.recent_locations),
+                                           ("劣化名", self.deteriorations, self.recent_deteriorations)):
+                value = row.get(column)
+                if not isinstance(value, str) or not value:
+                    continue
+                if value not in counts:
+                    new_words = True
+                if value not in counts or value in recent:
+                    recent[value] += 1
+                counts[value] += 1
+        if new_words:
+            self.recent = _learned_master(self.recent_locations, self.recent_deteriorations, self.readings)
+
+
+def build_learned_master(storage, site_name):
+    # 現場の過去の点検データに出てくる場所・劣化名（多く使われた順）からマスターデータを作る
+    locations, deteriorations = _site_values(storage, site_name)
+    return _learned_master(locations, deteriorations, {})
+
+
+def _learned_key(storage, site_name):
+    return (storage.name, os.path.abspath(storage.path), site_name)
+
+
+def forget_learned(storage, site_name):
+    # 学習した項目を破棄し、次回の参照で作り直す
+    with _lock:
+        _learned_cache.pop(_learned_key(storage, site_name), None)
+
+
+def learn_rows(storage, site_name, rows):
+    # 保存した行の場所・劣化名を学習した項目に加える（作成済みの場合のみ。保存先は読み直さない）
+    key = _learned_key(storage, site_name)
+    with _lock:
+        learned = _learned_cache.get(key)
+        if learned is None:
+            return
+        learned.add(rows)
+        learned.version = storage.version()
+
+
+def _get_learned(storage, site_name):
+    if not site_name or not storage.exists():
+        return None
+    key = _learned_key(storage, site_name)
+    version = storage.version()
+    now = time.monotonic()
+
+    with _lock:
+        learned = _learned_cache.get(key)
+        if learned is not None and (learned.version == version or now - learned.created < LEARNED_REFRESH_SECONDS):
+            _learned_cache.move_to_end(key)
+            return learned
+
+    # 他の点検者・取り込みによる変更を反映するため、保存先の全行から作り直す
+    locations, deteriorations = _site_values(storage, site_name)
+    readings = dict(learned.readings) if learned is not None else {}
+    learned = LearnedItems(version, now, locations, deteriorations, readings)
+    with _lock:
+        _remember(_learned_cache, key, learned)
+    return learned
+
+
+def get_learned_master(storage, site_name):
+    # 過去の点検から学習した項目（点検データが無い場合は None）
+    learned = _get_learned(storage, site_name)
+    return None if learned is None else learned.master
+
+
+def get_layered_indexes(master_data, site_name, storage=None):
+    # 現場ごとのマスター → 過去の点検から学習した項目 → 共通のマスター の順に重ねた
+    # (場所の索引, 劣化名の索引) を返す（現場名が空の場合は共通のマスターだけ）
+    layers = [get_site_master(site_name)]
+    if storage is not None:
+        learned = _get_learned(storage, site_name)
+        if learned is not None:
+            layers.extend(learned.masters())
+    layers = [layer for layer in layers if layer is not None] + [master_data]
+    return (
+        LayeredIndex([layer.location_index for layer in layers]),
+        LayeredIndex([layer.deterioration_index for layer in layers])
+    )
+
+
+def get_site_cache_stats():
+    with _lock:
+        return {"site_masters": len(_site_cache), "learned": len(_learned_cache)}
+
+
+def clear_site_cache():
+    with _lock:
+        _site_cache.clear()
+        _learned_cache.clear()
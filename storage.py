@@ -0,0 +1,1069 @@
+import csv
+import io
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+import warnings
+import weakref
+import zlib
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+from datacache import GrowableArray, get_dataset_cache
+from wal import WAL_SUFFIX, WriteAheadLog, data_checksum, file_checksum
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+except ImportError:  # 列指向のキャッシュを使わず、毎回CSVを解析する
+    pa = None
+    feather = None
+
+INSPECTION_CSV_PATH = "data/inspection_data.csv"
+INSPECTION_DB_PATH = "data/inspection_data.db"
+CSV_ENCODING = 'utf-8-sig'
+
+# データ閲覧タブでページ単位に読み込むための行位置の記録間隔
+PAGE_INDEX_STEP = 1000
+
+# 自動更新で保存先の変更を確認する間隔（秒）
+CHANGE_POLL_SECONDS = 2
+
+# 点検データの列（新規作成時のヘッダー）
+COLUMNS = ["点検日", "点検者名", "現場名", "棟名", "劣化番号", "場所", "劣化名", "写真番号"]
+
+# 読み取り専用のデータ（索引・検索）でカテゴリ型にする列（同じ値の繰り返しが多い列）
+CATEGORY_COLUMNS = ["点検者名", "現場名", "棟名", "場所", "劣化名"]
+DATE_FORMAT = "%Y-%m-%d"
+
+# CSVを解析した結果の列指向のキャッシュ（Feather。CSVと同じ名前で拡張子が .feather）
+FRAME_CACHE_SUFFIX = ".feather"
+_FRAME_CACHE_KEY = b"inspection_source_position"
+
+# 追記された行だけを読み込む際に、ファイルが書き換えられていないかを確かめる先頭部分のバイト数
+HEAD_CHECKSUM_BYTES = 4096
+
+# 列指向のキャッシュの作成後に追記された行がこの行数を超えたら、次回の読み込み時にキャッシュを作り直す
+FRAME_CACHE_REBUILD_ROWS = 50000
+
+
+@contextmanager
+def file_lock(path):
+    # 同じサーバー上の複数セッション・プロセス間で書き込みを直列化する排他ロック
+    lock_path = path + ".lock"
+    with open(lock_path, 'a+b') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX)
+        else:
+            lock_file.seek(0)
+            msvcrt.locking(lock_file.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def read_header(csv_path=INSPECTION_CSV_PATH):
+    # ファイル先頭の1行だけを読んで列名を返す（ファイルが無い・空の場合は None）
+    if not os.path.exists(csv_path) or os.path.getsize(csv_path) == 0:
+        return None
+    with open(csv_path, 'r', encoding=CSV_ENCODING, newline='') as f:
+        return next(csv.reader(f), None)
+
+
+def _ends_with_newline(f):
+    f.seek(0, os.SEEK_END)
+    if f.tell() == 0:
+        return True
+    f.seek(-1, os.SEEK_END)
+    return f.read(1) in (b'\n', b'\r')
+
+
+def _append_payload(rows, csv_path):
+    # file_lock を取得した状態で呼び出す
+    # 追記するバイト列と、追記した行のCSVテキスト・列名を返す（ファイルを新規作成する場合は列名が None）
+    # rows は辞書のリストかデータフレーム（一括取り込みなど行数が多い場合）
+    columns = read_header(csv_path)
+    is_new = columns is None
+    if is_new:
+        keys = rows.columns if isinstance(rows, pd.DataFrame) else rows[0]
+        columns = list(COLUMNS) + [key for key in keys if key not in COLUMNS]
+
+    if isinstance(rows, pd.DataFrame):
+        body = rows.reindex(columns=columns).to_csv(index=False, header=False, lineterminator='\n')
+    else:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        for row in rows:
+            writer.writerow(["" if row.get(column) is None else row.get(column) for column in columns])
+        body = buffer.getvalue()
+
+    if is_new:
+        payload = (",".join(columns) + "\n" + body).encode(CSV_ENCODING)
+    else:
+        payload = body.encode('utf-8')
+        # 末尾に改行が無いファイルへの追記で行が連結されないようにする
+        with open(csv_path, 'rb') as f:
+            if not _ends_with_newline(f):
+                payload = b'\n' + payload
+
+    return payload, body, None if is_new else columns
+
+
+def _write_at(path, offset, payload):
+    # offset の位置から payload を書き込み、それ以降（書き込み途中で中断された分など）を切り詰める
+    with open(path, 'r+b' if os.path.exists(path) else 'wb') as f:
+        f.seek(offset)
+        f.write(payload)
+        f.truncate()
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _fsync_directory(path):
+    # os.replace によるファイルの置き換えをディスクに反映する（Windows では不要）
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def append_rows(rows, csv_path=INSPECTION_CSV_PATH):
+    # 新しい行だけをファイル末尾に追記する
+    # ヘッダーはファイル作成時のみ書き込み、既存ファイルの場合はその列順に合わせる
+    return CsvStorage(csv_path).append_rows(rows)
+
+
+def file_version(path):
+    # ファイルの同一性と更新を判定するための値（存在しない場合は None）
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def _skip_records(f, count):
+    # f の現在位置から count 行を読み飛ばす（改行を含む引用符付きの値は1行として数え、空行は数えない）
+    skipped = 0
+    in_quotes = False
+    while skipped < count:
+        line = f.readline()
+        if not line:
+            return
+        if not in_quotes and line.strip() == b'':
+            continue
+        if line.count(b'"') % 2:
+            in_quotes = not in_quotes
+        if not in_quotes:
+            skipped += 1
+
+
+class RowOffsetIndex:
+    # 行位置 → バイト位置 の索引（PAGE_INDEX_STEP 行ごとに記録する）
+    # ファイルが追記されただけ（同じ inode でサイズが増加し、先頭部分と走査済みの末尾の改行が変わっていない）の場合は
+    # 追記分だけを走査する。それ以外（同じ長さ以上での書き換えを含む）は全体を走査し直す
+    def __init__(self):
+        self.version = None
+        self.columns = None
+        self.offsets = []
+        self.row_count = 0
+        self.end = 0
+        self.partial_rows = 0
+        self.head_length = 0
+        self.head_crc = None
+
+    def update(self, path, version):
+        if self.version == version:
+            return
+        if self.version is None or self.version[0] != version[0] or version[2] < self.end or not self._appended_only(path):
+            self.columns = read_header(path)
+            self.offsets = []
+            self.row_count = 0
+            self.partial_rows = 0
+            with open(path, 'rb') as f:
+                self.head_length = min(HEAD_CHECKSUM_BYTES, os.fstat(f.fileno()).st_size)
+                self.head_crc = _head_checksum(f, self.head_length)
+                f.seek(0)
+                f.readline()
+                self.end = f.tell()
+        self._scan(path)
+        self.version = version
+
+    def _appended_only(self, path):
+        # 前回の走査以降、末尾に追記されただけか（read_appended と同じ先頭部分のチェックサムで書き換えを検出する）
+        with open(path, 'rb') as f:
+            if _head_checksum(f, self.head_length) != self.head_crc:
+                return False
+            if self.end == 0:
+                return True
+            f.seek(self.end - 1)
+            return f.read(1) == b'\n'
+
+    def _scan(self, path):
+        # 改行を含む引用符付きの値にも対応するため、引用符の対応を追いながら行を数える
+        self.row_count -= self.partial_rows
+        self.offsets = [offset for offset in self.offsets if offset < self.end]
+        self.partial_rows = 0
+        position = self.end
+        row_start = position
+        in_quotes = False
+        with open(path, 'rb') as f:
+            f.seek(position)
+            for line in f:
+                if not in_quotes:
+                    row_start = position
+                    if line.strip() == b'':
+                        position += len(line)
+                        self.end = position
+                        continue
+                    if self.row_count % PAGE_INDEX_STEP == 0:
+                        self.offsets.append(row_start)
+                if line.count(b'"') % 2:
+                    in_quotes = not in_quotes
+                position += len(line)
+                if not in_quotes:
+                    self.row_count += 1
+                    if line.endswith(b'\n'):
+                        self.end = position
+                    else:
+                        # 改行で終わっていない最終行は、次回の走査で読み直す
+                        self.partial_rows = 1
+
+    def locate(self, row_offset):
+        # 指定行を含む区間の先頭バイト位置と、そこから読み飛ばす行数（_skip_records で読み飛ばす）
+        checkpoint = row_offset // PAGE_INDEX_STEP
+        return self.offsets[checkpoint], row_offset - checkpoint * PAGE_INDEX_STEP
+
+
+def _write_csv_file(df, path):
+    with open(path, 'w', encoding=CSV_ENCODING, newline='') as f:
+        df.to_csv(f, index=False)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def compact_frame(df):
+    # 読み取り専用の用途（索引・検索）向けに省メモリの型に変換する
+    # 点検日はすべて YYYY-MM-DD 形式の場合のみ日付型にする（それ以外の値があれば元の値を失わないよう文字列のまま）
+    # 劣化番号は欠損値が無ければ32ビット整数にする
+    for column in CATEGORY_COLUMNS:
+        if column in df.columns and df[column].dtype == object:
+            df[column] = df[column].astype('category')
+    if "点検日" in df.columns and df["点検日"].dtype == object:
+        # 日付の種類は行数よりはるかに少ないため、一意な値だけを判定・変換する
+        codes, uniques = pd.factorize(df["点検日"])
+        dates = pd.to_datetime(pd.Series(uniques, dtype=object), format=DATE_FORMAT, errors='coerce')
+        if dates.notna().all() and all(isinstance(value, str) and len(value) == 10 for value in uniques):
+            df["点検日"] = np.append(dates.to_numpy(), np.datetime64('NaT', 'ns'))[codes]
+    if "劣化番号" in df.columns and pd.api.types.is_integer_dtype(df["劣化番号"]):
+        numbers = df["劣化番号"]
+        if numbers.empty or (numbers.min() >= -2 ** 31 and numbers.max() < 2 ** 31):
+            df["劣化番号"] = numbers.astype('int32')
+    return df
+
+
+def expand_frame(df):
+    # compact_frame で変換したデータを表示・編集用に戻す（カテゴリ型は文字列、日付型は YYYY-MM-DD の文字列）
+    df = df.copy()
+    for column in df.columns:
+        if isinstance(df[column].dtype, pd.CategoricalDtype):
+            df[column] = df[column].astype(object)
+        elif pd.api.types.is_datetime64_any_dtype(df[column]):
+            # 日付の種類だけ文字列に変換する
+            codes, uniques = pd.factorize(df[column])
+            df[column] = np.append(uniques.strftime(DATE_FORMAT).to_numpy(dtype=object), np.nan)[codes]
+    return df
+
+
+def concat_frames(frames):
+    # compact_frame で変換したデータを連結する（カテゴリ型の列はカテゴリを合わせてカテゴリ型のまま連結する）
+    # 点検日の型が異なる（日付型と文字列）場合は文字列に揃えてから連結する
+    if len({str(frame["点検日"].dtype) for frame in frames if "点検日" in frame.columns}) > 1:
+        frames = [expand_frame(frame) for frame in frames]
+    columns = {}
+    for column in frames[0].columns:
+        parts = [frame[column] for frame in frames]
+        if all(isinstance(part.dtype, pd.CategoricalDtype) for part in parts):
+            columns[column] = pd.Series(union_categoricals(parts, ignore_order=True))
+        else:
+            columns[column] = pd.concat(parts, ignore_index=True)
+    return compact_frame(pd.DataFrame(columns))
+
+
+def _code_dtype(count):
+    # カテゴリ数が count のカテゴリ型で pandas がコードに使う整数型（異なる型のコードを渡すと変換でコピーされる）
+    for dtype in (np.int8, np.int16, np.int32):
+        if count < np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+
+class AppendableFrame:
+    # 追記されていく全行（compact_frame の型）。列ごとの配列に余裕を持たせて保持し、追記では既存の行をコピーしない
+    # カテゴリ型の列は既存のカテゴリの後に新しいカテゴリを加えるため、既存の行のコードは変わらない
+    def __init__(self, df):
+        self.columns = list(df.columns)
+        self.length = len(df)
+        self._arrays = {}
+        self._dtypes = {}
+        for column in self.columns:
+            values = df[column]
+            if isinstance(values.dtype, pd.CategoricalDtype):
+                self._dtypes[column] = pd.CategoricalDtype(values.cat.categories)
+                values = values.cat.codes.to_numpy().astype(_code_dtype(len(values.cat.categories)), copy=False)
+            self._arrays[column] = GrowableArray(np.asarray(values))
+
+    def frame(self):
+        # 全行のデータフレーム（列の配列を参照し、コピーしない）
+        data = {}
+        for column in self.columns:
+            values = self._arrays[column].view(self.length)
+            if column in self._dtypes:
+                values = pd.Categorical.from_codes(values, dtype=self._dtypes[column], validate=False)
+            data[column] = values
+        return pd.DataFrame(data, copy=False)
+
+    def append(self, rows):
+        # rows（compact_frame の型）を追記した新しい AppendableFrame を返す（この AppendableFrame と frame() は変わらない）
+        # 列や型が合わない（連結すると型が変わる）場合は None
+        if list(rows.columns) != self.columns:
+            return None
+        arrays = {}
+        dtypes = dict(self._dtypes)
+        for column in self.columns:
+            array = self._arrays[column]
+            values = rows[column]
+            if column in self._dtypes:
+                if isinstance(values.dtype, pd.CategoricalDtype):
+                    codes, uniques = values.cat.codes.to_numpy(), values.cat.categories
+                elif values.dtype == object:
+                    codes, uniques = pd.factorize(values)
+                    uniques = pd.Index(uniques, dtype=object)
+                else:
+                    return None
+                categories = self._dtypes[column].categories
+                extra = uniques[categories.get_indexer(uniques) < 0]
+                if len(extra):
+                    categories = categories.append(extra)
+                    dtypes[column] = pd.CategoricalDtype(categories)
+                codes = np.append(categories.get_indexer(uniques), -1)[codes]
+                code_dtype = _code_dtype(len(categories))
+                if code_dtype != array.dtype:
+                    # カテゴリ数がコードの型の上限を超えた場合だけ、既存の行のコードを変換する
+                    array = GrowableArray(array.view(self.length).astype(code_dtype))
+                values = codes.astype(code_dtype)
+            else:
+                values = values.to_numpy()
+                if values.dtype != array.dtype and (values.dtype.kind == 'M' or not np.can_cast(values.dtype, array.dtype)):
+                    return None
+                values = values.astype(array.dtype, copy=False)
+            arrays[column] = array.append(values, self.length)[0]
+        extended = AppendableFrame.__new__(AppendableFrame)
+        extended.columns = self.columns
+        extended.length = self.length + len(rows)
+        extended._arrays = arrays
+        extended._dtypes = dtypes
+        return extended
+
+
+def site_groups(df):
+    # (現場名, 棟名) → 行位置 の索引
+    if '現場名' not in df.columns or '棟名' not in df.columns or df.empty:
+        return {}
+    return df.groupby(['現場名', '棟名'], sort=False, observed=True).indices
+
+
+def extend_site_groups(groups, df, start):
+    # start 行目以降を追記した df の site_groups（追記された行をまとめ、該当する組み合わせだけ行位置を加える）
+    added = site_groups(df.iloc[start:])
+    if not added:
+        return groups
+    groups = dict(groups)
+    for key, positions in added.items():
+        positions = positions + start
+        groups[key] = np.concatenate([groups[key], positions]) if key in groups else positions
+    return groups
+
+
+def frame_cache_path(csv_path):
+    return os.path.splitext(csv_path)[0] + FRAME_CACHE_SUFFIX
+
+
+def _head_checksum(f, length):
+    f.seek(0)
+    return zlib.crc32(f.read(length))
+
+
+def read_position(path, columns, row_count, version):
+    # ファイル全体を解析した後の読み込み位置（inode・バイト位置・行数・先頭部分のチェックサム・列）
+    # version は解析前の file_version。解析中に変更された場合は位置が分からないため None
+    if version is None or file_version(path) != version:
+        return None
+    ino, _, size = version
+    head_length = min(HEAD_CHECKSUM_BYTES, size)
+    with open(path, 'rb') as f:
+        head_crc = _head_checksum(f, head_length)
+    return {"ino": ino, "offset": size, "rows": row_count, "head_length": head_length, "head_crc": head_crc,
+            "columns": list(columns)}
+
+
+def read_appended(path, position):
+    # position の後に追記された行だけを読み込み、(追記された行, 新しい読み込み位置) を返す
+    # ファイルが書き換えられた場合（inode の変化・サイズの縮小・先頭部分の不一致）は None
+    # 書き込み途中の最後の行は読み込まず、次回に読み込む
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    if stat.st_ino != position["ino"] or stat.st_size < position["offset"]:
+        return None
+    with open(path, 'rb') as f:
+        if _head_checksum(f, position["head_length"]) != position["head_crc"]:
+            return None
+        f.seek(position["offset"])
+        data = f.read(stat.st_size - position["offset"])
+    data = data[:data.rfind(b'\n') + 1]
+    columns = position["columns"]
+    if data.strip():
+        df = pd.read_csv(io.BytesIO(data), header=None, names=columns, encoding='utf-8')
+    else:
+        df = pd.DataFrame(columns=columns)
+    df.index = pd.RangeIndex(position["rows"], position["rows"] + len(df))
+    return df, dict(position, offset=position["offset"] + len(data), rows=position["rows"] + len(df))
+
+
+def read_frame_cache(cache_path):
+    # 列指向のキャッシュを読み込み、(全行, 読み込み位置) を返す（無い・読めない場合は None）
+    if feather is None:
+        return None
+    try:
+        table = feather.read_table(cache_path, memory_map=True)
+        position = json.loads((table.schema.metadata or {})[_FRAME_CACHE_KEY])
+    except (OSError, KeyError, ValueError, pa.ArrowException):
+        return None
+    return table.to_pandas(), position
+
+
+def write_frame_cache(df, cache_path, position):
+    # 一時ファイルに書き出してから置き換える（書き込めない場合はキャッシュを使わないだけ）
+    if feather is None:
+        # requirements.txt の pyarrow が無い環境（同じ場所の警告は1回だけ表示される）
+        warnings.warn("pyarrow がインストールされていないため、読み込み用のキャッシュを使わずに毎回CSVを解析します")
+        return False
+    if position is None:
+        return False
+    try:
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        metadata = dict(table.schema.metadata or {})
+        metadata[_FRAME_CACHE_KEY] = json.dumps(position).encode('utf-8')
+        table = table.replace_schema_metadata(metadata)
+        fd, tmp_path = tempfile.mkstemp(suffix=".tmp", prefix=os.path.basename(cache_path) + ".",
+                                        dir=os.path.dirname(cache_path) or ".")
+        os.close(fd)
+        try:
+            # 圧縮しない（読み込み時にメモリマップから直接変換できるように）
+            feather.write_feather(table, tmp_path, compression='uncompressed')
+            os.replace(tmp_path, cache_path)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+    except (OSError, pa.ArrowException):
+        return False
+    return True
+
+
+def filter_mask(df, site_name=None, building_name=None, date_from=None, date_to=None):
+    # 現場名・棟名・点検日の範囲（YYYY-MM-DD の文字列として比較）で絞り込む条件
+    mask = pd.Series(True, index=df.index)
+    if site_name:
+        mask &= df["現場名"].astype(str) == str(site_name)
+    if building_name:
+        mask &= df["棟名"].astype(str) == str(building_name)
+    if date_from or date_to:
+        if pd.api.types.is_datetime64_any_dtype(df["点検日"]):
+            dates = df["点検日"].dt.strftime(DATE_FORMAT).fillna("")
+        else:
+            dates = df["点検日"].fillna("").astype(str)
+        if date_from:
+            mask &= dates >= str(date_from)
+        if date_to:
+            mask &= (dates != "") & (dates <= str(date_to))
+    return mask
+
+
+class ConflictError(Exception):
+    # 編集を始めた後に他のセッションが同じ行を変更・削除した場合に送出する
+    def __init__(self, row_ids):
+        self.row_ids = list(row_ids)
+        super().__init__(f"他のユーザーが変更した行があります（行ID: {', '.join(str(row_id) for row_id in self.row_ids)}）")
+
+
+def _canonical(value):
+    # 保存先・エディタで型が変わっても同じ値を同じ文字列として比較できるようにする
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    if isinstance(value, pd.Timestamp) and value == value.normalize():
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    if hasattr(value, 'item'):
+        return _canonical(value.item())
+    return str(value)
+
+
+def compute_row_diff(original_df, edited_df):
+    # 行IDをキーに、変更された行（変更された列のみ）・追加された行・削除された行を求める
+    original_ids = set(original_df.index)
+    edited_ids = set(edited_df.index)
+    columns = [column for column in edited_df.columns if column in original_df.columns]
+
+    changed = {}
+    added = []
+    for row_id, row in zip(edited_df.index, edited_df.to_dict('records')):
+        if row_id not in original_ids:
+            added.append(row)
+            continue
+        original = original_df.loc[row_id]
+        values = {column: row[column] for column in columns if _canonical(row[column]) != _canonical(original[column])}
+        if values:
+            changed[row_id] = values
+    deleted = [row_id for row_id in original_df.index if row_id not in edited_ids]
+    return {"changed": changed, "added": added, "deleted": deleted}
+
+
+def restore_row_ids(edited_df, row_ids):
+    # 行位置（RangeIndex）で編集した表に行IDを戻す（row_ids は編集前の行位置 → 行ID。追加した行は None）
+    # 追加された行には既存の行IDと重ならない負の行IDを振る
+    labels = []
+    new_id = 0
+    for position in edited_df.index:
+        row_id = row_ids[position] if 0 <= position < len(row_ids) else None
+        if row_id is None:
+            new_id -= 1
+            row_id = new_id
+        labels.append(row_id)
+    restored = edited_df.copy()
+    restored.index = labels
+    return restored
+
+
+def check_conflicts(current_df, original_df, row_ids):
+    # 保存先の行が編集開始時の内容（original_df）から変わっていないか確かめる
+    conflicts = []
+    for row_id in row_ids:
+        if row_id not in current_df.index:
+            conflicts.append(row_id)
+            continue
+        current = current_df.loc[row_id]
+        original = original_df.loc[row_id]
+        for column in original_df.columns:
+            if _canonical(current.get(column)) != _canonical(original[column]):
+                conflicts.append(row_id)
+                break
+    if conflicts:
+        raise ConflictError(conflicts)
+
+
+class CsvStorage:
+    # data/inspection_data.csv を使う保存先（行IDはファイル内の行位置）
+    name = "csv"
+
+    def __init__(self, csv_path=INSPECTION_CSV_PATH):
+        self.path = csv_path
+        # 行位置の索引（プロセス内の全セッションで共有）
+        self._offset_index = RowOffsetIndex()
+        # 最後に load_frame で返した全行の (弱参照, AppendableFrame)。次の追記はその配列に加える
+        self._appendable = None
+        self._lock = threading.Lock()
+        # 変更内容を先に書き込むログ（前回の書き込みが中断されていれば再適用する）
+        self._wal = WriteAheadLog(csv_path + WAL_SUFFIX)
+        if os.path.exists(self._wal.path):
+            with file_lock(self.path):
+                self._recover_locked()
+
+    def _recover_locked(self):
+        # 完了していないログの記録を再適用する（file_lock を取得した状態で呼び出す）
+        for record in self._wal.pending():
+            if record["op"] == "append":
+                self._replay_append(record)
+            elif record["op"] == "rewrite":
+                self._replay_rewrite(record)
+            self._wal.commit(record["id"])
+
+    def _replay_append(self, record):
+        base_size = record["base_size"]
+        size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+        if size < base_size:
+            warnings.warn(f"{self.path} が追記前より短くなっているため、中断された追記を再適用できません")
+            return
+        if "payload" not in record:
+            # 追記した内容のチェックサムだけを記録している場合は、すべて書き込まれていればそのまま使い、
+            # 途中までしか書き込まれていなければ追記前のサイズに切り詰める（追記の完了は呼び出し元に報告していない）
+            length = record["length"]
+            if size >= base_size + length:
+                with open(self.path, 'rb') as f:
+                    f.seek(base_size)
+                    if data_checksum(f.read(length)) == record["checksum"]:
+                        return
+            _write_at(self.path, base_size, b'')
+            return
+        # 以前の形式の記録（追記する内容をそのまま記録している）
+        payload = record["payload"].encode('utf-8')
+        if size >= base_size + len(payload):
+            with open(self.path, 'rb') as f:
+                f.seek(base_size)
+                if f.read(len(payload)) == payload:
+                    return
+        # 追記されていない・途中まで追記された場合は追記前の位置から書き直す
+        _write_at(self.path, base_size, payload)
+
+    def _replay_rewrite(self, record):
+        current = file_checksum(self.path)
+        if current == record["target_checksum"]:
+            return
+        tmp_path = record["tmp_path"]
+        if current == record["base_checksum"] and file_checksum(tmp_path) == record["target_checksum"]:
+            # 一時ファイルの書き込みは完了していて、置き換える前に中断された
+            os.replace(tmp_path, self.path)
+            _fsync_directory(self.path)
+            return
+        warnings.warn(f"{self.path} が書き換え前の内容と一致しないため、中断された書き換えを再適用できません")
+
+    def _rewrite_locked(self, df):
+        # 一時ファイルに書き出し、ログに記録してから置き換える（file_lock を取得した状態で呼び出す）
+        # 書き込み途中で落ちても元のファイルが残り、置き換え前に落ちた場合は再適用される
+        tmp_path = self.path + ".tmp"
+        _write_csv_file(df, tmp_path)
+        record_id = self._wal.append({
+            "op": "rewrite",
+            "base_checksum": file_checksum(self.path),
+            "target_checksum": file_checksum(tmp_path),
+            "tmp_path": tmp_path
+        })
+        os.replace(tmp_path, self.path)
+        _fsync_directory(self.path)
+        self._wal.commit(record_id)
+        self._wal.compact()
+
+    def exists(self):
+        return read_header(self.path) is not None
+
+    def version(self):
+        # データが変更されるたびに変わる値（検索索引などのキャッシュキーに使う）
+        return file_version(self.path)
+
+    def read_all(self):
+        return pd.read_csv(self.path, encoding=CSV_ENCODING)
+
+    def read_frame(self):
+        # 読み取り専用の全行（compact_frame の型）。更新には read_all を使う
+        return self.load_frame()[0]
+
+    def _extend(self, df, position):
+        # 返す読み込み位置には追記前の位置（base_offset・base_rows）を記録する（datacache.py が派生データの更新に使う）
+        appended = read_appended(self.path, position)
+        if appended is None:
+            return None
+        rows, new_position = appended
+        new_position = dict(new_position, base_offset=position["offset"], base_rows=position["rows"])
+        if rows.empty:
+            return df, new_position
+        rows = compact_frame(rows)
+        current = self._appendable
+        appendable = current[1] if current is not None and current[0]() is df else AppendableFrame(df)
+        extended = appendable.append(rows)
+        if extended is None:
+            # 型が変わる場合は連結し直す
+            extended = AppendableFrame(concat_frames([df, rows]))
+        frame = extended.frame()
+        self._remember_appendable(frame, extended)
+        return frame, new_position
+
+    def _remember_appendable(self, frame, appendable):
+        # 全行が参照されなくなれば（キャッシュから破棄されれば）配列も解放する
+        def release(ref):
+            if self._appendable is not None and self._appendable[0] is ref:
+                self._appendable = None
+        self._appendable = (weakref.ref(frame, release), appendable)
+
+    def load_frame(self, previous=None):
+        # (全行, 読み込み位置) を返す
+        # previous（前回の戻り値）の後に追記されただけであれば、追記された部分だけを解析して加える
+        # 前回の結果が無い場合は列指向のキャッシュを読み込み、キャッシュの作成後に追記された部分だけを解析する
+        # ファイルが書き換えられていればCSV全体を解析し、キャッシュを作り直す
+        if previous is not None and previous[1] is not None:
+            extended = self._extend(*previous)
+            if extended is not None:
+                return extended
+        cache_path = frame_cache_path(self.path)
+        cached = read_frame_cache(cache_path)
+        if cached is not None:
+            extended = self._extend(*cached)
+            if extended is not None:
+                if extended[1]["rows"] - cached[1]["rows"] > FRAME_CACHE_REBUILD_ROWS:
+                    write_frame_cache(extended[0], cache_path, extended[1])
+                return extended
+        version = file_version(self.path)
+        df = compact_frame(self.read_all())
+        position = read_position(self.path, df.columns, len(df), version)
+        write_frame_cache(df, cache_path, position)
+        return df, position
+
+    def read_site(self, site_name, building_name):
+        if not self.exists():
+            return pd.DataFrame(columns=COLUMNS)
+        # プロセス全体で共有する全行と (現場名, 棟名) → 行位置 の索引から取り出す
+        dataset = get_dataset_cache().get(self)
+        groups = dataset.view("site_groups", site_groups, extend_site_groups)
+        positions = groups.get((site_name, building_name), [])
+        return dataset.view(("site", site_name, building_name), lambda df: df.iloc[positions])
+
+    def _get_offset_index(self):
+        version = file_version(self.path)
+        with self._lock:
+            self._offset_index.update(self.path, version)
+            return self._offset_index
+
+    def count(self):
+        if not self.exists():
+            return 0
+        return self._get_offset_index().row_count
+
+    def read_page(self, offset, limit):
+        # 指定範囲の行だけを読み込む（行IDはファイル内の行位置）
+        index = self._get_offset_index()
+        if offset >= index.row_count:
+            return pd.DataFrame(columns=index.columns)
+        start, skip = index.locate(offset)
+        with open(self.path, 'rb') as f:
+            # pandas の skiprows は物理行と行の数え方が異なる（引用符内の改行）ため、読み始めの位置まで自前で読み飛ばす
+            f.seek(start)
+            _skip_records(f, skip)
+            df = pd.read_csv(f, header=None, names=index.columns, nrows=limit, encoding='utf-8')
+        df.index = pd.RangeIndex(offset, offset + len(df))
+        return df
+
+    def iter_chunks(self, chunk_size, site_name=None, building_name=None, date_from=None, date_to=None):
+        # 条件に一致する行を chunk_size 行ずつ読み込む（ファイル全体をメモリに載せない）
+        if not self.exists():
+            return
+        for chunk in pd.read_csv(self.path, encoding=CSV_ENCODING, chunksize=chunk_size):
+            chunk = chunk[filter_mask(chunk, site_name, building_name, date_from, date_to)]
+            if not chunk.empty:
+                yield chunk
+
+    def max_number(self, site_name=None, building_name=None):
+        header = read_header(self.path)
+        if not header or "劣化番号" not in header:
+            return None
+        if site_name is not None:
+            # 現場名・棟名を指定した場合は索引から該当する行だけを取り出す
+            numbers = self.read_site(site_name, building_name)["劣化番号"]
+        else:
+            # 劣化番号の列だけを読み込む
+            numbers = pd.read_csv(self.path, encoding=CSV_ENCODING, usecols=["劣化番号"])["劣化番号"]
+        numbers = pd.to_numeric(numbers, errors='coerce').dropna()
+        return None if numbers.empty else int(numbers.max())
+
+    def append_rows(self, rows):
+        # rows は辞書のリストかデータフレーム
+        if len(rows) == 0:
+            return 0
+        with file_lock(self.path):
+            self._recover_locked()
+            payload, _, _ = _append_payload(rows, self.path)
+            # 追記前のサイズと追記する内容の長さ・チェックサムをログに記録してから追記する
+            # （行の内容はログに書かない。中断された場合は追記前のサイズに切り詰めて元に戻す）
+            base_size = os.path.getsize(self.path) if os.path.exists(self.path) else 0
+            record_id = self._wal.append({"op": "append", "base_size": base_size, "length": len(payload),
+                                          "checksum": data_checksum(payload)})
+            _write_at(self.path, base_size, payload)
+            # 完了の記録が失われても、チェックサムが一致する追記はそのまま使われるため fsync しない
+            self._wal.commit(record_id, sync=False)
+            self._wal.compact()
+        return len(rows)
+
+    def update_row(self, row_id, values):
+        with file_lock(self.path):
+            self._recover_locked()
+            df = self.read_all()
+            if row_id not in df.index:
+                return False
+            for column, value in values.items():
+                df.loc[row_id, column] = value
+            self._rewrite_locked(df)
+        return True
+
+    def replace_all(self, df):
+        with file_lock(self.path):
+            self._recover_locked()
+            self._rewrite_locked(df)
+
+    def apply_diff(self, diff, original_df):
+        # 行単位の差分だけを反映する（original_df と一致しない行があれば ConflictError）
+        if not diff["changed"] and not diff["deleted"]:
+            # 追加だけならファイルを書き換えずに追記する
+            return self.append_rows(diff["added"])
+        with file_lock(self.path):
+            self._recover_locked()
+            df = self.read_all()
+            check_conflicts(df, original_df, list(diff["changed"]) + diff["deleted"])
+            for row_id, values in diff["changed"].items():
+                for column, value in values.items():
+                    if column not in df.columns:
+                        df[column] = None
+                    # 数値列に文字列を入れる場合などに備えて object 型にしてから代入する
+                    if df[column].dtype != object:
+                        df[column] = df[column].astype(object)
+                    df.at[row_id, column] = value
+            df = df.drop(index=diff["deleted"])
+            if diff["added"]:
+                df = pd.concat([df, pd.DataFrame(diff["added"]).reindex(columns=df.columns)], ignore_index=True)
+            self._rewrite_locked(df)
+        return len(diff["changed"]) + len(diff["deleted"]) + len(diff["added"])
+
+
+_SQLITE_TYPES = {"劣化番号": "INTEGER"}
+
+
+def _sqlite_value(value):
+    # pandas の欠損値・numpy の数値型を SQLite で扱える値に変換する
+    if pd.isna(value):
+        return None
+    if hasattr(value, 'item'):
+        return value.item()
+    return value
+
+
+@contextmanager
+def closing_connection(db_path):
+    # トランザクションをコミットしてから接続を閉じる
+    conn = sqlite3.connect(db_path, timeout=30)
+    try:
+        with conn:
+            yield conn
+    finally:
+        conn.close()
+
+
+class SqliteStorage:
+    # 埋め込みSQLiteを使う保存先（行IDは rowid）
+    name = "sqlite"
+
+    def __init__(self, db_path=INSPECTION_DB_PATH):
+        self.path = db_path
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS inspections ("
+                + ", ".join(f'"{column}" {_SQLITE_TYPES.get(column, "TEXT")}' for column in COLUMNS)
+                + ")"
+            )
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_inspections_site ON inspections ("現場名", "棟名", "劣化番号")')
+            conn.execute('CREATE INDEX IF NOT EXISTS idx_inspections_date ON inspections ("点検日")')
+            # 書き込みのたびに増えるバージョン番号
+            conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER)")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0)")
+            for event in ("INSERT", "UPDATE", "DELETE"):
+                conn.execute(
+                    f"CREATE TRIGGER IF NOT EXISTS bump_version_{event.lower()} AFTER {event} ON inspections "
+                    "BEGIN UPDATE meta SET value = value + 1 WHERE key = 'version'; END"
+                )
+
+    def _connect(self):
+        return closing_connection(self.path)
+
+    def _select(self, where="", params=(), suffix=""):
+        columns = ", ".join(f'"{column}"' for column in COLUMNS)
+        with self._connect() as conn:
+            df = pd.read_sql_query(
+                f"SELECT rowid AS row_id, {columns} FROM inspections {where} ORDER BY rowid {suffix}",
+                conn, params=params, index_col="row_id"
+            )
+        df.index.name = None
+        return df
+
+    def exists(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT 1 FROM inspections LIMIT 1").fetchone() is not None
+
+    def version(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def read_all(self):
+        return self._select()
+
+    def read_frame(self):
+        # 読み取り専用の全行（compact_frame の型）
+        return compact_frame(self._select())
+
+    def load_frame(self, previous=None):
+        # 追記された行だけを読み込むことはできないため、常に全行を読み込む（読み込み位置は無し）
+        return self.read_frame(), None
+
+    def read_site(self, site_name, building_name):
+        return self._select('WHERE "現場名" = ? AND "棟名" = ?', (site_name, building_name))
+
+    def count(self):
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM inspections").fetchone()[0]
+
+    def read_page(self, offset, limit):
+        return self._select("", (limit, offset), suffix="LIMIT ? OFFSET ?")
+
+    def iter_chunks(self, chunk_size, site_name=None, building_name=None, date_from=None, date_to=None):
+        # 条件に一致する行を chunk_size 行ずつ読み込む
+        conditions, params = [], []
+        if site_name:
+            conditions.append('"現場名" = ?')
+            params.append(site_name)
+        if building_name:
+            conditions.append('"棟名" = ?')
+            params.append(building_name)
+        if date_from:
+            conditions.append('"点検日" >= ?')
+            params.append(str(date_from))
+        if date_to:
+            conditions.append('"点検日" <= ?')
+            params.append(str(date_to))
+        where = "WHERE " + " AND ".join(conditions) if conditions else ""
+        columns = ", ".join(f'"{column}"' for column in COLUMNS)
+        with self._connect() as conn:
+            for chunk in pd.read_sql_query(
+                f"SELECT rowid AS row_id, {columns} FROM inspections {where} ORDER BY rowid",
+                conn, params=params, index_col="row_id", chunksize=chunk_size
+            ):
+                chunk.index.name = None
+                yield chunk
+
+    def max_number(self, site_name=None, building_name=None):
+        with self._connect() as conn:
+            if site_name is not None:
+                # idx_inspections_site の索引だけで求まる
+                value = conn.execute(
+                    'SELECT MAX("劣化番号") FROM inspections WHERE "現場名" = ? AND "棟名" = ?',
+                    (site_name, building_name)
+                ).fetchone()[0]
+            else:
+                value = conn.execute('SELECT MAX("劣化番号") FROM inspections').fetchone()[0]
+        return None if value is None else int(value)
+
+    def _insert(self, conn, rows):
+        placeholders = ", ".join("?" for _ in COLUMNS)
+        columns = ", ".join(f'"{column}"' for column in COLUMNS)
+        if isinstance(rows, pd.DataFrame):
+            frame = rows.reindex(columns=COLUMNS).astype(object)
+            values = frame.where(frame.notna(), None).itertuples(index=False, name=None)
+        else:
+            values = (tuple(_sqlite_value(row.get(column)) for column in COLUMNS) for row in rows)
+        conn.executemany(f"INSERT INTO inspections ({columns}) VALUES ({placeholders})", values)
+
+    def append_rows(self, rows):
+        # rows は辞書のリストかデータフレーム
+        if len(rows) == 0:
+            return 0
+        with self._connect() as conn:
+            self._insert(conn, rows)
+        return len(rows)
+
+    def update_row(self, row_id, values):
+        values = {column: value for column, value in values.items() if column in COLUMNS}
+        assignments = ", ".join(f'"{column}" = ?' for column in values)
+        with self._connect() as conn:
+            cursor = conn.execute(
+                f"UPDATE inspections SET {assignments} WHERE rowid = ?",
+                [_sqlite_value(value) for value in values.values()] + [int(row_id)]
+            )
+        return cursor.rowcount > 0
+
+    def replace_all(self, df):
+        with self._connect() as conn:
+            conn.execute("DELETE FROM inspections")
+            self._insert(conn, df.to_dict('records'))
+
+    def apply_diff(self, diff, original_df):
+        # 行単位の差分を1つのトランザクションで反映する（original_df と一致しない行があれば ConflictError）
+        row_ids = [int(row_id) for row_id in list(diff["changed"]) + diff["deleted"]]
+        columns = ", ".join(f'"{column}"' for column in COLUMNS)
+        with self._connect() as conn:
+            # 確認から書き込みまでの間に他の書き込みが入らないよう先にロックを取る
+            conn.execute("BEGIN IMMEDIATE")
+            current = {}
+            for start in range(0, len(row_ids), 500):
+                chunk = row_ids[start:start + 500]
+                placeholders = ", ".join("?" for _ in chunk)
+                cursor = conn.execute(
+                    f"SELECT rowid, {columns} FROM inspections WHERE rowid IN ({placeholders})", chunk
+                )
+                for record in cursor:
+                    current[record[0]] = dict(zip(COLUMNS, record[1:]))
+            check_conflicts(pd.DataFrame.from_dict(current, orient='index', columns=COLUMNS), original_df, row_ids)
+
+            for row_id, values in diff["changed"].items():
+                values = {column: value for column, value in values.items() if column in COLUMNS}
+                if not values:
+                    continue
+                assignments = ", ".join(f'"{column}" = ?' for column in values)
+                conn.execute(
+                    f"UPDATE inspections SET {assignments} WHERE rowid = ?",
+                    [_sqlite_value(value) for value in values.values()] + [int(row_id)]
+                )
+            conn.executemany("DELETE FROM inspections WHERE rowid = ?", [(int(row_id),) for row_id in diff["deleted"]])
+            self._insert(conn, diff["added"])
+        return len(diff["changed"]) + len(diff["deleted"]) + len(diff["added"])
+
+
+_storages = {}
+
+
+def get_storage(backend=None):
+    # 環境変数 INSPECTION_STORAGE（csv / sqlite）で保存先を切り替える
+    backend = backend or os.environ.get("INSPECTION_STORAGE", "csv")
+    if backend not in _storages:
+        if backend == "sqlite":
+            _storages[backend] = SqliteStorage()
+        elif backend == "csv":
+            _storages[backend] = CsvStorage()
+        else:
+            raise ValueError(f"未対応の保存先です: {backend}")
+    return _storages[backend]
+
+
+def wait_for_change(storage, seen_version, on_poll=None, interval=CHANGE_POLL_SECONDS, timeout=None):
+    # 保存先のバージョンが seen_version から変わるまで interval 秒ごとに確認し、新しいバージョンを返す
+    # （確認はファイルの stat か1行の問い合わせだけで、データは読み込まない。timeout 秒経っても変わらなければ None）
+    # on_poll は確認のたびに呼び出す（Streamlit では画面の要素を更新し、操作・切断時にスクリプトが中断されるようにする）
+    started = time.monotonic()
+    while True:
+        version = storage.version()
+        if version != seen_version:
+            return version
+        if timeout is not None and time.monotonic() - started >= timeout:
+            return None
+        if on_poll is not None:
+            on_poll()
+        time.sleep(interval)
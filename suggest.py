@@ -0,0 +1,471 @@
+import bisect
+import heapq
+import pickle
+import re
+import threading
+from array import array
+from collections import Counter, OrderedDict
+from itertools import accumulate
+
+import jaconv
+
+# 候補の最大表示件数
+DEFAULT_LIMIT = 20
+
+# 前方一致の範囲がこの件数を超える場合は結果をメモ化する（1〜2文字入力など）
+MEMO_THRESHOLD = 256
+MEMO_SIZE = 1024
+
+# 候補を探す段階（この順に候補を並べる）
+SUGGEST_STAGES = ("prefix", "infix", "fuzzy")
+
+# あいまい検索で許容する編集距離の上限
+MAX_EDIT_DISTANCE = 2
+
+# あいまい検索で位置付きバイグラムを索引するキーの先頭文字数と、編集距離を計算する候補数の上限
+FUZZY_INDEX_DEPTH = 16
+FUZZY_CANDIDATE_LIMIT = 200
+
+# 前方一致検索の上限として使う文字
+_MAX_CHAR = '\U0010ffff'
+
+_ALPHABET_PATTERN = re.compile(r'[a-zA-Z]')
+_TRAILING_CONSONANT_PATTERN = re.compile(r'[bcdfghjklmnpqrstvwxyz]+$')
+
+# 読み（ひらがな・カタカナ・ローマ字）だけの入力（数字・空白は含んでもよい）
+_READING_PATTERN = re.compile(r'[ぁ-ゖーa-z0-9 ]*[ぁ-ゖa-z][ぁ-ゖーa-z0-9 ]*')
+
+
+def _buffer(values):
+    # 保存時に配列の中身を pickle のバッファ（プロトコル5では out-of-band）として渡す
+    return pickle.PickleBuffer(values)
+
+
+def _restore_ints(buffer):
+    return memoryview(buffer).cast('i')
+
+
+class IntTable:
+    # 整数配列を保存するための入れ物。読み込むと（メモリマップ上の）memoryview になる
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values if isinstance(values, array) else array('i', values)
+
+    def __reduce_ex__(self, protocol):
+        return (_restore_ints, (_buffer(self.values),))
+
+
+class PostingTable:
+    # キー → 整数配列の辞書を「連結した1つの配列と (開始, 終了) の辞書」で持つ
+    # 読み込んだ後は memoryview の切り出しを返すため、配列ごとの復元やコピーが無い
+    __slots__ = ('_values', '_ranges')
+
+    def __init__(self, postings):
+        self._values = array('i')
+        self._ranges = {}
+        for key, positions in postings.items():
+            self._ranges[key] = (len(self._values), len(self._values) + len(positions))
+            self._values.extend(positions)
+
+    @classmethod
+    def _restore(cls, values, ranges):
+        table = cls.__new__(cls)
+        table._values = values
+        table._ranges = ranges
+        return table
+
+    def __reduce_ex__(self, protocol):
+        return (PostingTable._restore, (IntTable(self._values), self._ranges))
+
+    def __len__(self):
+        return len(self._ranges)
+
+    def __contains__(self, key):
+        return key in self._ranges
+
+    def __getitem__(self, key):
+        start, end = self._ranges[key]
+        return memoryview(self._values)[start:end]
+
+    def get(self, key, default=None):
+        return self[key] if key in self._ranges else default
+
+
+class StringTable:
+    # 文字列の一覧を「UTF-8 で連結したバイト列と開始位置の配列」で持つ読み取り専用のシーケンス
+    # 読み込む際に文字列を1件ずつ作らずに済み、参照した文字列だけを復号する
+    __slots__ = ('_data', '_offsets')
+
+    def __init__(self, strings=()):
+        encoded = [value.encode('utf-8') for value in strings]
+        self._data = b''.join(encoded)
+        self._offsets = array('q', [0])
+        self._offsets.extend(accumulate(len(value) for value in encoded))
+
+    @classmethod
+    def _restore(cls, data, offsets):
+        table = cls.__new__(cls)
+        table._data = memoryview(data)
+        table._offsets = memoryview(offsets).cast('q')
+        return table
+
+    def __reduce_ex__(self, protocol):
+        return (StringTable._restore, (_buffer(self._data), _buffer(self._offsets)))
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, position):
+        if isinstance(position, slice):
+            return [self[i] for i in range(*position.indices(len(self)))]
+        if position < 0:
+            position += len(self)
+        if not 0 <= position < len(self):
+            raise IndexError("StringTable index out of range")
+        return str(self._data[self._offsets[position]:self._offsets[position + 1]], 'utf-8')
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+def normalize_reading(text):
+    # 全角・半角を正規化してひらがなに揃える
+    return jaconv.kata2hira(jaconv.normalize(text))
+
+
+def romaji_to_reading(text):
+    # ローマ字入力をひらがなに変換する
+    # 入力途中の末尾の子音（"ikkaih" の "h" など）は「っ」「ん」に化けないよう変換前に取り除く
+    normalized = jaconv.normalize(text)
+    if not _ALPHABET_PATTERN.search(normalized):
+        return None
+    romaji = _TRAILING_CONSONANT_PATTERN.sub('', normalized.lower())
+    return jaconv.kata2hira(jaconv.alphabet2kana(romaji))
+
+
+def _bigrams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _positional_bigrams(text):
+    return [(text[i:i + 2], i) for i in range(min(len(text), FUZZY_INDEX_DEPTH) - 1)]
+
+
+def _allowed_distance(length):
+    # バイグラムの共通数で候補を絞り込めるのは (バイグラム数 - 2 * 距離) > 0 の場合のみ
+    return min(MAX_EDIT_DISTANCE, (length - 2) // 2)
+
+
+def prefix_edit_distance(query, key, max_distance):
+    # query と key の先頭部分との編集距離の最小値（max_distance を超えたら None）
+    # 対角線から max_distance 以内のセルだけを計算する
+    n = len(query)
+    over = max_distance + 1
+    previous = [min(i, over) for i in range(n + 1)]
+    best = previous[n]
+    for j, key_char in enumerate(key[:n + max_distance], 1):
+        lo = max(1, j - max_distance)
+        hi = min(n, j + max_distance)
+        current = [over] * (n + 1)
+        if j <= max_distance:
+            current[0] = j
+        for i in range(lo, hi + 1):
+            cost = previous[i - 1] + (query[i - 1] != key_char)
+            if previous[i] + 1 < cost:
+                cost = previous[i] + 1
+            if current[i - 1] + 1 < cost:
+                cost = current[i - 1] + 1
+            current[i] = cost if cost < over else over
+        if current[n] < best:
+            best = current[n]
+        if min(current[lo - 1:hi + 1]) > max_distance:
+            break
+        previous = current
+    return best if best <= max_distance else None
+
+
+class SuggestionIndex:
+    # よみ・表記を正規化したキーのソート済み配列を持ち、bisect で前方一致検索する
+    # 順位は「よみの一致（マスター順）→ 表記の一致（マスター順）」で、従来の get_suggestions と同じ
+    # 中間一致・あいまい一致はキーのバイグラム索引から候補を絞り込んで判定する
+    def __init__(self, options, yomi_options=(), mapping_dict=None):
+        mapping_dict = mapping_dict or {}
+        self.surfaces = []
+        entries = []
+
+        # よみでの検索用エントリ
+        for yomi in yomi_options:
+            if not isinstance(yomi, str) or not isinstance(mapping_dict.get(yomi), str):
+                continue
+            entries.append((normalize_reading(yomi), len(self.surfaces)))
+            self.surfaces.append(mapping_dict[yomi])
+
+        # 元の表記での検索用エントリ
+        for opt in options:
+            if not isinstance(opt, str):
+                continue
+            entries.append((normalize_reading(opt), len(self.surfaces)))
+            self.surfaces.append(opt)
+
+        entries.sort()
+        self._keys = [key for key, _ in entries]
+        self._ranks = array('i', [rank for _, rank in entries])
+
+        # 表記順に並べたエントリ位置（出現頻度のある表記のエントリを bisect で探す）
+        self._surface_order = array('i', sorted(range(len(self._ranks)), key=lambda position: self.surfaces[self._ranks[position]]))
+
+        # バイグラム → エントリ位置の転置索引（中間一致用）と
+        # (バイグラム, キー内の位置) → エントリ位置の転置索引（あいまい一致用）
+        postings = {}
+        positional = {}
+        for position, key in enumerate(self._keys):
+            for gram in _bigrams(key):
+                postings.setdefault(gram, []).append(position)
+            for gram_at in _positional_bigrams(key):
+                positional.setdefault(gram_at, []).append(position)
+        self._postings = {gram: array('i', positions) for gram, positions in postings.items()}
+        self._positional = {gram_at: array('i', positions) for gram_at, positions in positional.items()}
+
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    def __getstate__(self):
+        # 保存用の状態（文字列・整数配列は1つのバッファにまとめ、メモは保存しない）
+        state = dict(self.__dict__)
+        for name in ('_keys', 'surfaces'):
+            state[name] = StringTable(state[name])
+        for name in ('_ranks', '_surface_order'):
+            state[name] = IntTable(state[name])
+        for name in ('_postings', '_positional'):
+            state[name] = PostingTable(state[name])
+        del state['_memo'], state['_memo_lock']
+        return state
+
+    def __setstate__(self, state):
+        # 読み込んだ索引はバッファ上のまま使う（検索では位置を指定して読むだけのため）
+        self.__dict__.update(state)
+        self._memo = OrderedDict()
+        self._memo_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def prefix_range(self, prefix):
+        lo = bisect.bisect_left(self._keys, prefix)
+        hi = bisect.bisect_left(self._keys, prefix + _MAX_CHAR, lo)
+        return lo, hi
+
+    def _unique_ranks(self, ranks, limit):
+        # 順位順に並べ、同じ表記は1度だけ返す
+        result = []
+        seen = set()
+        for rank in ranks:
+            surface = self.surfaces[rank]
+            if surface in seen:
+                continue
+            seen.add(surface)
+            result.append(rank)
+            if len(result) >= limit:
+                break
+        return result
+
+    def _lookup(self, lo, hi, limit):
+        size = hi - lo
+        if size == 0:
+            return []
+
+        candidates = self._ranks[lo:hi]
+        if size > limit * 2:
+            # 上位だけを取り出す（重複で不足した場合のみ全件を並べ替える）
+            result = self._unique_ranks(heapq.nsmallest(limit * 2, candidates), limit)
+            if len(result) >= limit:
+                return result
+        return self._unique_ranks(sorted(candidates), limit)
+
+    def _prefix_ranks(self, prefix, limit):
+        memo_key = (prefix, limit)
+        with self._memo_lock:
+            if memo_key in self._memo:
+                self._memo.move_to_end(memo_key)
+                return self._memo[memo_key]
+
+        lo, hi = self.prefix_range(prefix)
+        result = self._lookup(lo, hi, limit)
+
+        # 範囲が大きい前方一致だけをメモ化する
+        if hi - lo > MEMO_THRESHOLD:
+            with self._memo_lock:
+                self._memo[memo_key] = result
+                if len(self._memo) > MEMO_SIZE:
+                    self._memo.popitem(last=False)
+        return result
+
+    def _frequent_positions(self, frequencies):
+        # 出現頻度のある表記のエントリ位置 → 出現回数
+        def surface_at(position):
+            return self.surfaces[self._ranks[position]]
+
+        positions = {}
+        for surface, count in frequencies.items():
+            if not isinstance(surface, str):
+                continue
+            lo = bisect.bisect_left(self._surface_order, surface, key=surface_at)
+            hi = bisect.bisect_right(self._surface_order, surface, lo, key=surface_at)
+            for position in self._surface_order[lo:hi]:
+                positions[position] = count
+        return positions
+
+    def _infix_positions(self, query):
+        # クエリの全バイグラムを含むキーの中から部分文字列として含むものを返す
+        grams = _bigrams(query)
+        lists = [self._postings.get(gram) for gram in grams]
+        if not lists or any(postings is None for postings in lists):
+            return []
+        shortest = min(lists, key=len)
+        if len(query) == 2:
+            return list(shortest)
+        return [position for position in shortest if query in self._keys[position]]
+
+    def _fuzzy_positions(self, query):
+        # 先頭付近の同じ位置（±距離）に現れるバイグラムで候補を絞り込み、
+        # 共通数の多い候補から順に先頭部分との編集距離で判定する
+        max_distance = _allowed_distance(len(query))
+        if max_distance < 1:
+            return []
+        groups = []
+        for gram, offset in _positional_bigrams(query):
+            shifts = range(max(0, offset - max_distance), offset + max_distance + 1)
+            group = [self._positional[(gram, shifted)] for shifted in shifts if (gram, shifted) in self._positional]
+            groups.append((sum(len(postings) for postings in group), group))
+
+        # 一致すべきバイグラム数が required なら、件数の少ない順に
+        # (バイグラム数 - required + 1) 個のどれかには必ず含まれる
+        required = len(groups) - 2 * max_distance
+        groups.sort(key=lambda item: item[0])
+        counts = Counter()
+        for _, group in groups[:len(groups) - required + 1]:
+            for postings in group:
+                counts.update(postings)
+
+        if len(counts) > FUZZY_CANDIDATE_LIMIT:
+            candidates = heapq.nlargest(FUZZY_CANDIDATE_LIMIT, counts.items(), key=lambda item: item[1])
+        else:
+            candidates = list(counts.items())
+
+        result = []
+        for position, _ in candidates:
+            key = self._keys[position]
+            if len(key) < len(query) - max_distance:
+                continue
+            distance = prefix_edit_distance(query, key, max_distance)
+            if distance:
+                result.append((distance, position))
+        return result
+
+    def stage_ranks(self, stage, queries, limit, frequencies):
+        # 段階（SUGGEST_STAGES）ごとの候補を順位順のエントリ番号で返す（表記の重複は呼び出し側で除く）
+        # 各段階の中では出現頻度の高い順、同じ頻度ならマスター順
+        # 出現頻度は表記ではなくエントリ番号で引く（候補ごとに表記を読まずに済む）
+        frequent_positions = self._frequent_positions(frequencies) if frequencies else {}
+        rank_counts = {self._ranks[position]: count for position, count in frequent_positions.items()}
+
+        def by_frequency(rank):
+            return (-rank_counts.get(rank, 0), rank)
+
+        ranks = set()
+        if stage == "prefix":
+            # マスター順の上位と、出現頻度のある候補を合わせて並べ替える
+            for query in queries:
+                ranks.update(self._prefix_ranks(query, limit))
+                for position in frequent_positions:
+                    if self._keys[position].startswith(query):
+                        ranks.add(self._ranks[position])
+            return sorted(ranks, key=by_frequency)
+
+        if stage == "infix":
+            for query in queries:
+                if len(query) < 2:
+                    continue
+                ranks.update(self._ranks[position] for position in self._infix_positions(query))
+            return heapq.nsmallest(limit * 2, ranks, key=by_frequency)
+
+        # あいまい一致（ひらがなのよみに対する編集距離）
+        scored = {}
+        for query in queries:
+            for distance, position in self._fuzzy_positions(query):
+                rank = self._ranks[position]
+                scored[rank] = min(distance, scored.get(rank, distance))
+        return heapq.nsmallest(limit * 2, scored, key=lambda rank: (scored[rank],) + by_frequency(rank))
+
+    def suggest(self, input_text, limit=DEFAULT_LIMIT, frequencies=None, stages=SUGGEST_STAGES):
+        return merge_suggestions([self], input_text, limit, frequencies, stages)
+
+
+class LayeredIndex:
+    # 優先度順に並べた複数の索引（現場ごとのマスター → 過去の点検から学習した項目 → 共通のマスター など）
+    # 各索引は段階ごとに上位 limit 件程度しか調べないため、検索の手間は索引の数にだけ比例する
+    def __init__(self, indexes):
+        self.indexes = [index for index in indexes if index is not None]
+
+    def __len__(self):
+        return sum(len(index) for index in self.indexes)
+
+    def suggest(self, input_text, limit=DEFAULT_LIMIT, frequencies=None, stages=SUGGEST_STAGES):
+        return merge_suggestions(self.indexes, input_text, limit, frequencies, stages)
+
+
+def _queries(input_text):
+    queries = [normalize_reading(input_text)]
+    romaji = romaji_to_reading(input_text)
+    if romaji and romaji not in queries:
+        queries.append(romaji)
+    return queries
+
+
+def merge_suggestions(indexes, input_text, limit=DEFAULT_LIMIT, frequencies=None, stages=SUGGEST_STAGES):
+    # 前方一致 → 中間一致 → あいまい一致の順に候補を返す（同じ段階の中では索引の並び順を優先する）
+    # あいまい一致は、どの索引にも前方一致の候補が無い場合（入力の誤りが疑われる場合）のみ行う
+    # stages を指定するとその段階の候補だけを返す
+    if not input_text:
+        return []
+    frequencies = frequencies or {}
+    queries = _queries(input_text)
+
+    suggestions = []
+    seen = set()
+    prefix_found = False
+    for stage in stages:
+        if stage == "fuzzy" and prefix_found:
+            break
+        for index in indexes:
+            for rank in index.stage_ranks(stage, queries, limit, frequencies):
+                surface = index.surfaces[rank]
+                if surface in seen:
+                    continue
+                seen.add(surface)
+                suggestions.append(surface)
+                if len(suggestions) >= limit:
+                    return suggestions
+        if stage == "prefix":
+            prefix_found = bool(suggestions)
+    return suggestions
+
+
+# 予測変換機能
+def get_suggestions(input_text, index, limit=DEFAULT_LIMIT, frequencies=None, stages=SUGGEST_STAGES):
+    if index is None:
+        return []
+    return index.suggest(input_text, limit, frequencies, stages)
+
+
+def resolve_reading(input_text, index, frequencies=None):
+    # 候補を選ばずに確定した入力（まとめて入力など）の値
+    # 読みだけの入力は前方一致（完全一致を含む）の最上位の候補に置き換え、漢字を含む入力・前方一致の候補の無い入力はそのまま使う
+    # 中間一致・あいまい一致の候補は入力と別の語のことがあるため、確認せずには置き換えない
+    text = input_text.strip()
+    if not _READING_PATTERN.fullmatch(normalize_reading(text).lower()):
+        return text
+    suggestions = get_suggestions(text, index, limit=1, frequencies=frequencies, stages=("prefix",))
+    return suggestions[0] if suggestions else text
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import uuid
+
+# 追記専用のログ（JSON Lines）
+# 変更内容を先にログへ書き込んで fsync し、保存先へ反映した後に完了（commit）を書き込む
+# 完了していない記録は起動時・次の書き込み時に再適用する
+
+WAL_SUFFIX = ".wal"
+
+# 完了済みの記録だけになった時点でログがこのサイズを超えていれば空にする
+WAL_COMPACT_BYTES = 1024 * 1024
+
+
+def file_checksum(path):
+    # ファイル内容の SHA-256（ファイルが無い場合は None）
+    if not os.path.exists(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def data_checksum(data):
+    # バイト列の SHA-256
+    return hashlib.sha256(data).hexdigest()
+
+
+def _json_default(value):
+    # numpy の数値型などを JSON に書ける値に変換する
+    if hasattr(value, 'item'):
+        return value.item()
+    return str(value)
+
+
+class WriteAheadLog:
+    # 呼び出し側が保存先のファイルロックを取得した状態で使う
+    # 読み込み済みの位置を覚えておき、他のプロセスが追記した分だけを読み込む
+    def __init__(self, path):
+        self.path = path
+        self._inode = None
+        self._offset = 0
+        self._pending = {}
+
+    def _reset(self, inode=None):
+        self._inode = inode
+        self._offset = 0
+        self._pending = {}
+
+    def _refresh(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            self._reset()
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # 空にされた・置き換えられた場合は先頭から読み直す
+            self._reset(stat.st_ino)
+        if stat.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # 改行で終わっていない最後の行は書き込み途中のため読まない
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 書き込み途中で中断された行（この記録の変更は保存先に反映されていない）
+                continue
+            if record.get("op") == "commit":
+                self._pending.pop(record.get("id"), None)
+            else:
+                self._pending[record["id"]] = record
+        self._offset += end
+
+    def pending(self):
+        # 完了していない記録（書き込み順）
+        self._refresh()
+        return list(self._pending.values())
+
+    def _write(self, record, sync=True):
+        line = (json.dumps(record, ensure_ascii=False, default=_json_default) + "\n").encode('utf-8')
+        with open(self.path, 'a+b') as f:
+            # 書き込み途中で中断された行の後ろに続けて書かないようにする
+            f.seek(0, os.SEEK_END)
+            if f.tell() > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    line = b'\n' + line
+            f.write(line)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+
+    def append(self, record):
+        # 記録を書き込み、完了時に使うIDを返す
+        self._refresh()
+        record = dict(record, id=uuid.uuid4().hex)
+        self._write(record)
+        return record["id"]
+
+    def commit(self, record_id, sync=True):
+        # sync=False は完了の記録が失われても再適用の判定で同じ結果になる場合（追記など）に使う
+        # （次にログへ fsync した時点でまとめてディスクに反映される）
+        self._write({"op": "commit", "id": record_id}, sync)
+        self._refresh()
+
+    def compact(self, limit=WAL_COMPACT_BYTES):
+        # 完了していない記録が無く、ログが大きくなっていれば空にする
+        if not os.path.exists(self.path) or os.path.getsize(self.path) <= limit:
+            return False
+        if self.pending():
+            return False
+        with open(self.path, 'wb') as f:
+            f.flush()
+            os.fsync(f.fileno())
+        self._reset(os.stat(self.path).st_ino)
+        return True
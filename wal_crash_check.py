@@ -0,0 +1,173 @@
+# CSV保存先の書き込みログ（wal.py）による復旧を確認する
+# 書き込みを繰り返す子プロセスを任意の時点で強制終了し、完了を報告した変更が失われていないかを確かめる
+# 使い方: python wal_crash_check.py [--rounds 50] [--dir 作業ディレクトリ] [--seed 0]
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+from storage import COLUMNS, CsvStorage
+
+CSV_NAME = "inspection_data.csv"
+JOURNAL_NAME = "journal.txt"
+
+
+def _record(journal, line):
+    # 子プロセスの進行状況を記録する（強制終了されても残るように fsync する）
+    journal.write(line + "\n")
+    journal.flush()
+    os.fsync(journal.fileno())
+
+
+def _row(marker, kind):
+    return {"点検日": "2025-01-01", "点検者名": "crash", "現場名": "S", "棟名": "B", "劣化番号": 0,
+            "場所": "", "劣化名": kind, "写真番号": marker}
+
+
+def run_writer(work_dir, round_no, seed):
+    # 追記・1行の更新・差分の反映を繰り返す（親プロセスに強制終了されるまで続ける）
+    rng = random.Random(seed)
+    storage = CsvStorage(os.path.join(work_dir, CSV_NAME))
+    with open(os.path.join(work_dir, JOURNAL_NAME), 'a', encoding='utf-8') as journal:
+        _record(journal, f"ready {round_no}")
+        step = 0
+        while True:
+            step += 1
+            key = f"{round_no}-{step}"
+            choice = rng.random()
+            if choice < 0.7:
+                markers = [f"W{key}-{i}" for i in range(rng.randint(1, 20))]
+                _record(journal, f"begin append {' '.join(markers)}")
+                storage.append_rows([_row(marker, "append") for marker in markers])
+                _record(journal, f"done append {' '.join(markers)}")
+            elif choice < 0.85:
+                _record(journal, f"begin update U{key}")
+                storage.update_row(0, {"場所": f"U{key}"})
+                _record(journal, f"done update U{key}")
+            else:
+                original = storage.read_all().iloc[[1]]
+                diff = {"changed": {1: {"場所": f"D{key}"}}, "added": [], "deleted": []}
+                _record(journal, f"begin diff D{key}")
+                storage.apply_diff(diff, original)
+                _record(journal, f"done diff D{key}")
+
+
+def _read_journal(work_dir):
+    # 完了を報告した追記の識別子と、行0・行1に書き込まれた可能性のある値を集める
+    done_markers = set()
+    begun_markers = set()
+    expected = {0: {"begun": [], "done": None}, 1: {"begun": [], "done": None}}
+    with open(os.path.join(work_dir, JOURNAL_NAME), encoding='utf-8') as f:
+        for line in f:
+            parts = line.split()
+            if len(parts) < 3:
+                continue
+            state, op, values = parts[0], parts[1], parts[2:]
+            if op == "append":
+                (done_markers if state == "done" else begun_markers).update(values)
+            elif op in ("update", "diff"):
+                target = expected[0 if op == "update" else 1]
+                if state == "done":
+                    target["done"] = values[0]
+                else:
+                    target["begun"].append(values[0])
+    return done_markers, begun_markers, expected
+
+
+def verify(work_dir):
+    # 復旧後のデータを確認し、問題の一覧を返す
+    storage = CsvStorage(os.path.join(work_dir, CSV_NAME))
+    problems = []
+    if storage._wal.pending():
+        problems.append("復旧後も完了していないログの記録が残っています")
+    df = storage.read_all()
+    if list(df.columns) != COLUMNS:
+        problems.append(f"列が一致しません: {list(df.columns)}")
+        return problems
+
+    done_markers, begun_markers, expected = _read_journal(work_dir)
+    markers = df["写真番号"].astype(str)
+    found = set(markers)
+    lost = done_markers - found
+    if lost:
+        problems.append(f"完了した追記が失われています: {len(lost)}行")
+    if markers.duplicated().any():
+        problems.append(f"同じ行が重複しています: {markers[markers.duplicated()].tolist()[:5]}")
+    unknown = found - begun_markers - {"seed-0", "seed-1"}
+    if unknown:
+        problems.append(f"書き込んでいない行があります: {sorted(unknown)[:5]}")
+
+    for row_id, target in expected.items():
+        value = df.loc[row_id, "場所"]
+        value = "" if value != value else str(value)
+        if target["done"] is None:
+            continue
+        # 最後に完了した値か、それより後に開始した（完了前に中断された）値のいずれか
+        begun = target["begun"]
+        allowed = set(begun[begun.index(target["done"]):])
+        if value not in allowed:
+            problems.append(f"行{row_id}の値が最後に完了した変更と一致しません: {value}（期待値: {target['done']}）")
+    return problems
+
+
+def _wait_ready(work_dir, round_no, process, timeout=30):
+    path = os.path.join(work_dir, JOURNAL_NAME)
+    deadline = time.time() + timeout
+    while time.time() < deadline and process.poll() is None:
+        with open(path, encoding='utf-8') as f:
+            if f"ready {round_no}\n" in f.read():
+                return True
+        time.sleep(0.01)
+    return False
+
+
+def main():
+    parser = argparse.ArgumentParser(description="書き込み中の強制終了から点検データが復旧できるかを確認します")
+    parser.add_argument("--rounds", type=int, default=50, help="強制終了する回数")
+    parser.add_argument("--dir", help="作業ディレクトリ（省略時は一時ディレクトリ）")
+    parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+    parser.add_argument("--max-delay", type=float, default=0.5, help="書き込み開始から強制終了までの最大秒数")
+    parser.add_argument("--writer", type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    work_dir = args.dir or tempfile.mkdtemp(prefix="wal_crash_")
+    if args.writer is not None:
+        run_writer(work_dir, args.writer, args.seed + args.writer)
+        return
+
+    os.makedirs(work_dir, exist_ok=True)
+    open(os.path.join(work_dir, JOURNAL_NAME), 'a').close()
+    CsvStorage(os.path.join(work_dir, CSV_NAME)).append_rows([_row("seed-0", "seed"), _row("seed-1", "seed")])
+
+    rng = random.Random(args.seed)
+    failures = 0
+    for round_no in range(1, args.rounds + 1):
+        process = subprocess.Popen([
+            sys.executable, os.path.abspath(__file__),
+            "--dir", work_dir, "--seed", str(args.seed), "--writer", str(round_no)
+        ])
+        if not _wait_ready(work_dir, round_no, process):
+            process.kill()
+            print("書き込みプロセスが起動しませんでした", file=sys.stderr)
+            sys.exit(1)
+        time.sleep(rng.uniform(0, args.max_delay))
+        process.kill()
+        process.wait()
+
+        problems = verify(work_dir)
+        rows = len(CsvStorage(os.path.join(work_dir, CSV_NAME)).read_all())
+        status = "OK" if not problems else "NG"
+        print(f"[{round_no}/{args.rounds}] {status} {rows}行")
+        for problem in problems:
+            print(f"  {problem}")
+        failures += bool(problems)
+
+    print(f"完了: {args.rounds}回中 {failures}回で問題が見つかりました（作業ディレクトリ: {work_dir}）")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
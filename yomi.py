@@ -0,0 +1,146 @@
+import re
+
+import jaconv
+
+try:
+    import pykakasi
+except ImportError:  # 任意の依存（未インストールの場合は辞書による変換を使う）
+    pykakasi = None
+
+# 建物の点検でよく使う語のよみ（辞書による変換で使う）
+BASE_READINGS = {
+    # 階・位置
+    "階": "かい", "地下": "ちか", "屋上": "おくじょう", "塔屋": "とうや", "屋根": "やね", "屋内": "おくない",
+    "屋外": "おくがい", "北": "きた", "南": "みなみ", "東": "ひがし", "西": "にし", "北面": "ほくめん",
+    "南面": "なんめん", "東面": "とうめん", "西面": "せいめん", "側": "がわ", "面": "めん", "上部": "じょうぶ",
+    "下部": "かぶ", "内部": "ないぶ", "外部": "がいぶ", "周辺": "しゅうへん", "付近": "ふきん", "棟": "とう",
+    "第": "だい", "号": "ごう", "号棟": "ごうとう", "号室": "ごうしつ", "左": "ひだり", "右": "みぎ", "前": "まえ", "奥": "おく",
+    # 部位
+    "廊下": "ろうか", "階段": "かいだん", "外階段": "そとかいだん", "外壁": "がいへき", "内壁": "ないへき",
+    "壁": "かべ", "玄関": "げんかん", "機械室": "きかいしつ", "電気室": "でんきしつ", "駐車場": "ちゅうしゃじょう",
+    "駐輪場": "ちゅうりんじょう", "庇": "ひさし", "手摺": "てすり", "手すり": "てすり", "笠木": "かさぎ",
+    "天井": "てんじょう", "床": "ゆか", "開口部": "かいこうぶ", "排水溝": "はいすいこう", "排水口": "はいすいこう",
+    "樋": "とい", "雨樋": "あまどい", "竪樋": "たてどい", "窓": "まど", "扉": "とびら", "柱": "はしら", "梁": "はり",
+    "基礎": "きそ", "外構": "がいこう", "塀": "へい", "擁壁": "ようへき", "看板": "かんばん", "室外機": "しつがいき",
+    "防水": "ぼうすい", "目地": "めじ", "躯体": "くたい", "軒天": "のきてん", "軒裏": "のきうら", "踊場": "おどりば",
+    "踊り場": "おどりば", "共用": "きょうよう", "専用": "せんよう", "受水槽": "じゅすいそう", "高架水槽": "こうかすいそう",
+    # 劣化
+    "ひび割れ": "ひびわれ", "割れ": "われ", "剥離": "はくり", "剥落": "はくらく", "漏水": "ろうすい",
+    "腐食": "ふしょく", "変形": "へんけい", "欠損": "けっそん", "変色": "へんしょく", "浮き": "うき",
+    "白華": "はっか", "爆裂": "ばくれつ", "鉄筋": "てっきん", "露出": "ろしゅつ", "塗膜": "とまく",
+    "剥れ": "はがれ", "剥がれ": "はがれ", "劣化": "れっか", "汚れ": "よごれ", "傾斜": "けいしゃ",
+    "沈下": "ちんか", "脱落": "だつらく", "膨れ": "ふくれ", "錆": "さび", "破損": "はそん", "損傷": "そんしょう",
+    "亀裂": "きれつ", "緩み": "ゆるみ", "漏れ": "もれ", "雨漏り": "あまもり", "軽微": "けいび",
+    "著しい": "いちじるしい", "部分的": "ぶぶんてき",
+}
+
+# 「○階」の読み（音が変わるもの）
+_FLOOR_READINGS = {
+    "1": "いっかい", "2": "にかい", "3": "さんがい", "4": "よんかい", "5": "ごかい", "6": "ろっかい",
+    "7": "ななかい", "8": "はっかい", "9": "きゅうかい", "10": "じゅっかい",
+}
+_DIGITS = ["", "いち", "に", "さん", "よん", "ご", "ろく", "なな", "はち", "きゅう"]
+_NUMBER_PATTERN = re.compile(r'\d+')
+
+
+def number_reading(number):
+    # 0〜9999 の数字のよみ（それ以上は1桁ずつ読む）
+    if number == 0:
+        return "ぜろ"
+    if number >= 10000:
+        return "".join(_DIGITS[int(digit)] or "ぜろ" for digit in str(number))
+    reading = ""
+    for unit, unit_reading, specials in (
+        (1000, "せん", {3: "さんぜん", 8: "はっせん"}),
+        (100, "ひゃく", {3: "さんびゃく", 6: "ろっぴゃく", 8: "はっぴゃく"}),
+        (10, "じゅう", {}),
+    ):
+        digit = number // unit % 10
+        if digit == 0:
+            continue
+        if digit in specials:
+            reading += specials[digit]
+        else:
+            reading += ("" if digit == 1 else _DIGITS[digit]) + unit_reading
+    return reading + _DIGITS[number % 10]
+
+
+class DictionaryConverter:
+    # 辞書の語を最長一致で置き換えてよみを作る（かなはひらがなにし、辞書に無い漢字はそのまま残す）
+    name = "dictionary"
+
+    def __init__(self, readings=None):
+        self.readings = dict(BASE_READINGS)
+        self.readings.update(readings or {})
+        self._max_length = max((len(word) for word in self.readings), default=1)
+
+    def add(self, surface, reading):
+        # マスターデータの表記とよみの組を辞書に加える
+        if isinstance(surface, str) and isinstance(reading, str) and surface and reading:
+            self.readings[surface] = reading
+            self._max_length = max(self._max_length, len(surface))
+
+    def convert(self, text):
+        text = jaconv.normalize(text)
+        result = []
+        i = 0
+        while i < len(text):
+            number = _NUMBER_PATTERN.match(text, i)
+            if number:
+                digits = number.group()
+                end = number.end()
+                if text.startswith("階", end) and digits in _FLOOR_READINGS:
+                    result.append(_FLOOR_READINGS[digits])
+                    end += 1
+                else:
+                    result.append(number_reading(int(digits)))
+                i = end
+                continue
+            for length in range(min(self._max_length, len(text) - i), 0, -1):
+                word = text[i:i + length]
+                if word in self.readings:
+                    result.append(self.readings[word])
+                    i += length
+                    break
+            else:
+                result.append(text[i])
+                i += 1
+        return jaconv.kata2hira("".join(result))
+
+
+class KakasiConverter:
+    # pykakasi による変換（辞書に登録済みの語は辞書のよみを優先する）
+    name = "kakasi"
+
+    def __init__(self, readings=None):
+        self._kakasi = pykakasi.kakasi()
+        self._dictionary = DictionaryConverter(readings)
+
+    def add(self, surface, reading):
+        self._dictionary.add(surface, reading)
+
+    def convert(self, text):
+        text = jaconv.normalize(text)
+        if text in self._dictionary.readings:
+            return self._dictionary.readings[text]
+        return "".join(item["hira"] for item in self._kakasi.convert(text))
+
+
+CONVERTERS = {"dictionary": DictionaryConverter, "kakasi": KakasiConverter}
+
+
+def get_converter(name=None, readings=None):
+    # name を省略した場合は pykakasi があれば使い、無ければ辞書による変換を使う
+    if name is None:
+        name = "kakasi" if pykakasi is not None else "dictionary"
+    if name == "kakasi" and pykakasi is None:
+        raise ImportError("pykakasi がインストールされていません（pip install pykakasi）")
+    if name not in CONVERTERS:
+        raise ValueError(f"未対応のよみ変換です: {name}")
+    return CONVERTERS[name](readings)
+
+
+def normalize_yomi(text):
+    # よみを全角ひらがなに揃える
+    return jaconv.kata2hira(jaconv.normalize(text)).strip()
+